@@ -1,3 +1,5 @@
+import asyncio
+
 from flask import Flask
 from flask import abort
 from flask import jsonify
@@ -10,15 +12,23 @@ from smart_on_fhir import smart_app
 from continuous_training import ct_app
 
 mocab_app = Flask(__name__)
+mocab_app.secret_key = conf.get('flask_config').get('SECRET_KEY')
 mocab_app.register_blueprint(smart_app, url_prefix=conf.get('base_urls').get('smart_prefix'))
 mocab_app.register_blueprint(cds_app.server, url_prefix=conf.get('base_urls').get('cds_hooks_prefix'))
 mocab_app.register_blueprint(ct_app, url_prefix=conf.get('base_urls').get('continuous_training_prefix'))
 CORS(mocab_app)
 
 from base_module import return_model_result
+from base_module import return_model_results
 from base_module import verify_data
 from base import patient_data_search as ds
+from base.feature_resolver import FeatureResolver
+from base.latency_budget import Deadline
+from base.object_store import async_runner
 from base.object_store import feature_table
+from base.object_store import fhir_class_obj
+from base.object_store import inference_server
+from base.object_store import search_cache
 
 
 # Map the csv into dictionary
@@ -36,6 +46,85 @@ def exist_model():
     return jsonify({"model": feature_table.get_exist_model_name()})
 
 
+@mocab_app.route('/inference_metrics')
+def inference_metrics():
+    """
+    Queue depth and batch size metrics of the in-process inference server, keyed by "<model name>/<model type>".
+    """
+    return jsonify(inference_server.metrics())
+
+
+@mocab_app.route('/search_cache_metrics')
+def search_cache_metrics():
+    """
+    Size and hit/miss counters of the cross-request FHIR search cache.
+    """
+    return jsonify(search_cache.metrics())
+
+
+@mocab_app.route('/predict', methods=['GET'])
+def predict_with_id():
+    """
+    Description:
+        This api gets the request with patient's id and several models, then the server would return every model's
+        result and patient's data. The features that the models share are fetched once.
+
+    :param models: <base>/predict?id=<patient's id>&models=<model name>,<model name>&hour_alive_time
+    :return: json object
+        {
+            "<model name>": {
+                "predict_value": <int> or <double>
+                "<feature's name>": {
+                    "date": YYYY-MM-DDThh:mm:ss,
+                    "value": <boolean> or <int> or <double> or <string> // depends on the data
+                }
+            }, ...
+            "<model name>": null // the model was not done within the latency budget
+        }
+    """
+    patient_id = request.values.get('id')
+    if patient_id is None:
+        abort(400, description="Please fill in patient's ID.")
+    model_names = [name.strip() for name in request.values.get('models', '').split(',') if name.strip() != '']
+    if len(model_names) == 0:
+        abort(400, description="Please fill in the models.")
+    for model_name in model_names:
+        if model_name not in feature_table.get_exist_model_name():
+            abort(400, description=f"Model '{model_name}' is not exist in the feature table.")
+    hour_alive_time = request.values.get('hour_alive_time')
+
+    # The searches of every in-flight request are multiplexed on the shared event loop.
+    return jsonify(async_runner.run(_predict_models(patient_id, model_names, hour_alive_time)))
+
+
+async def _predict_models(patient_id, model_names, hour_alive_time) -> dict:
+    async def predict(model_name, resolver, deadline):
+        with deadline.stage(f"{model_name} fetch"):
+            patient_data_dict = await ds.async_model_feature_search_with_patient_id(
+                patient_id, table.get_model_feature_dict(model_name), data_alive_time=hour_alive_time,
+                plans=table.get_extraction_plans(model_name), context=resolver.context, resolver=resolver)
+        with deadline.stage(f"{model_name} predict"):
+            patient_data_dict["predict_value"] = await asyncio.to_thread(return_model_result, patient_data_dict,
+                                                                         model_name)
+        return patient_data_dict
+
+    deadline = Deadline(conf.get("latency_budget").get("API_SECONDS"))
+    with fhir_class_obj.request_context(patient_id=patient_id, deadline=deadline) as context:
+        async with context.new_async_client() as async_client:
+            context.async_client = async_client
+            resolver = FeatureResolver(patient_id, context=context)
+            results = await asyncio.gather(*[deadline.run(predict(model_name, resolver, deadline))
+                                             for model_name in model_names], return_exceptions=True)
+    deadline.log_if_exceeded("/predict")
+
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, asyncio.TimeoutError):
+            raise result
+    # The models that are not done within the latency budget are returned without a result.
+    return {model_name: None if isinstance(result, asyncio.TimeoutError) else result
+            for model_name, result in zip(model_names, results)}
+
+
 @mocab_app.route('/<api>', methods=['GET'])
 def api_with_id(api):
     """
@@ -59,12 +148,33 @@ def api_with_id(api):
         abort(400, description="Please fill in patient's ID.")
     hour_alive_time = request.values.get('hour_alive_time')  # None if request has no hour_alive_time parameter
 
-    patient_data_dict = ds.model_feature_search_with_patient_id(
-        patient_id, table.get_model_feature_dict(api), data_alive_time=hour_alive_time)
-    patient_data_dict["predict_value"] = return_model_result(patient_data_dict, api)
+    budget = conf.get("latency_budget").get("API_SECONDS")
+    try:
+        # The searches of every in-flight request are multiplexed on the shared event loop.
+        patient_data_dict = async_runner.run(_predict_model(api, patient_id, hour_alive_time, budget))
+    except asyncio.TimeoutError:
+        abort(504, description=f"{api} could not be calculated within {budget} seconds.")
     return jsonify(patient_data_dict)
 
 
+async def _predict_model(api, patient_id, hour_alive_time, budget) -> dict:
+    # Every FHIR search and the model call get what is left of the latency budget of the request.
+    deadline = Deadline(budget)
+    with fhir_class_obj.request_context(patient_id=patient_id, deadline=deadline) as context:
+        try:
+            with deadline.stage("fetch"):
+                patient_data_dict = await deadline.run(ds.async_model_feature_search_with_patient_id(
+                    patient_id, table.get_model_feature_dict(api), data_alive_time=hour_alive_time,
+                    plans=table.get_extraction_plans(api), context=context))
+            # The prediction is CPU bound, so it runs in the executor instead of on the event loop.
+            with deadline.stage("predict"):
+                patient_data_dict["predict_value"] = await deadline.run(
+                    asyncio.to_thread(return_model_result, patient_data_dict, api))
+        finally:
+            deadline.log_if_exceeded(f"/{api}")
+    return patient_data_dict
+
+
 @mocab_app.route('/<api>/change', methods=['POST'])
 # POST method will get the object body from frontend
 # POST method will only return predict value(double or integer)
@@ -88,3 +198,83 @@ def api_with_post(api):
     verify_data(patient_data_dict, api)
     patient_data_dict["predict_value"] = return_model_result(patient_data_dict, api)
     return jsonify(patient_data_dict)
+
+
+@mocab_app.route('/<api>/batch', methods=['POST'])
+def api_with_batch(api):
+    """
+    Description:
+        This api scores many patients with one model invocation. The body gives either patients' ids, whose data
+        would be searched from the FHIR server, or patients' data that were already filled in.
+
+    :param api: POST <base>/<model name>/batch
+        {
+            "ids": [<patient's id>, ...],
+            "hour_alive_time": <optional>
+        }
+        or
+        {
+            "patients": [{"<feature's name>": {"date": ..., "value": ...}, ...}, ...]
+        }
+    :return: json object
+        {
+            "results": [
+                {
+                    "id": <patient's id>, // only if the patients were given with ids
+                    "predict_value": <int> or <double>
+                    "<feature's name>": {
+                        "date": YYYY-MM-DDThh:mm:ss,
+                        "value": <boolean> or <int> or <double> or <string> // depends on the data
+                    }
+                }
+                or
+                {
+                    "id": <patient's id>,
+                    "error": <why the patient's data could not be searched, e.g. an unknown id>
+                }, ...
+            ]
+        }
+    """
+    body = request.get_json()
+    if body is None or ("ids" not in body and "patients" not in body):
+        abort(400, description="Please fill in patients' ids or patients' data.")
+
+    if "ids" in body:
+        # The patients are searched concurrently on the shared event loop.
+        patient_data_dicts = async_runner.run(_search_patients(api, body["ids"], body.get("hour_alive_time")))
+    else:
+        patient_data_dicts = body["patients"]
+        for patient_data_dict in patient_data_dicts:
+            verify_data(patient_data_dict, api)
+
+    # Only the patients whose data were found are scored, the others keep their error.
+    found = [patient_data_dict for patient_data_dict in patient_data_dicts if "error" not in patient_data_dict]
+    if len(found) > 0:
+        predict_values = return_model_results(found, api)
+        for patient_data_dict, predict_value in zip(found, predict_values):
+            patient_data_dict["predict_value"] = predict_value
+    return jsonify({"results": patient_data_dicts})
+
+
+async def _search_patients(api, patient_ids, hour_alive_time) -> list:
+    """
+    :return: the data of every patient in the order of patient_ids, {"id": ..., "error": ...} for a patient whose
+             search failed, so one unknown id does not fail the whole batch
+    """
+    model_table = table.get_model_feature_dict(api)
+    plans = table.get_extraction_plans(api)
+    semaphore = asyncio.Semaphore(max(1, conf.get("batch_api").get("MAX_PARALLEL_PATIENTS")))
+
+    async def search(patient_id):
+        async with semaphore:
+            # Every patient is searched in its own request context, the same as one /<api> request.
+            with fhir_class_obj.request_context(patient_id=patient_id) as context:
+                try:
+                    patient_data_dict = await ds.async_model_feature_search_with_patient_id(
+                        patient_id, model_table, data_alive_time=hour_alive_time, plans=plans, context=context)
+                except Exception as e:
+                    return {"id": patient_id, "error": str(e)}
+        patient_data_dict["id"] = patient_id
+        return patient_data_dict
+
+    return list(await asyncio.gather(*[search(patient_id) for patient_id in patient_ids]))
@@ -0,0 +1,28 @@
+import asyncio
+import threading
+
+
+class _AsyncRunner:
+    """
+    One event loop on a daemon thread for the whole process. The Flask views are served on the WSGI threads and hand
+    their coroutine to this loop, so the FHIR searches of every in-flight request are multiplexed on one loop and
+    share the keep-alive sessions of the async client pool, instead of a new loop and session per request.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _running_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="async-runner", daemon=True).start()
+            return self._loop
+
+    def run(self, coroutine):
+        """
+        Run the coroutine on the shared loop and wait for its result. Called from a thread that is not the loop's,
+        e.g. a WSGI thread or a background worker.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._running_loop()).result()
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+
+from fhirpy.base.exceptions import MultipleResourcesFound
+from fhirpy.base.exceptions import ResourceNotFound
+from fhirpy.base.utils import parse_pagination_url
+
+from base.fetch_planner import feature_searches
+from base.fhir_search_obj import FhirSearchContext
+from base.object_store import search_cache
+from base.patient_bundle import bundle_resources
+from base.route_converter import get_by_path
+
+
+def _encode_search(context: FhirSearchContext, resource_type: str, params: dict, sort: str = None) -> dict:
+    # fhirpy turns e.g. date__ge into date=ge...
+    search = context.async_client.resources(resource_type).search(**params)
+    if sort is not None:
+        search = search.sort(sort)
+    return search.params
+
+
+async def _search_pages(context: FhirSearchContext, resource_type: str, params: dict, sort: str = None):
+    """
+    Send the search with the async client and yield the resources of every page, the next page is requested only
+    when the previous one has been read. The resources are SyncFHIRResource of context.client, the same as the sync
+    path returns, so the strategies of base/search_sets.py read them and the search cache shares them.
+    """
+    bundle = await context.async_client._fetch_resource(resource_type, _encode_search(context, resource_type,
+                                                                                       params, sort))
+    while True:
+        yield bundle_resources(context.client, bundle)
+        next_link = get_by_path(bundle, ["link", {"relation": "next"}, "url"])
+        if not next_link:
+            return
+        bundle = await context.async_client._fetch_resource(*parse_pagination_url(next_link))
+
+
+async def _send_search(context: FhirSearchContext, resource_type: str, params: dict, sort: str, mode: str):
+    if mode == "count":
+        # The same as SyncSearchSet.count
+        bundle = await context.async_client._fetch_resource(
+            resource_type, {**_encode_search(context, resource_type, params), "_count": 0, "_totalMethod": "count"})
+        return bundle["total"]
+
+    resources = []
+    async for page in _search_pages(context, resource_type, params, sort):
+        resources.extend(page)
+        if mode != "fetch_all":
+            break
+
+    if mode == "get":
+        if len(resources) == 0:
+            raise ResourceNotFound("No resources found")
+        if len(resources) > 1:
+            raise MultipleResourcesFound("More than one resource found")
+        return resources[0]
+    return resources
+
+
+async def async_search_resources(context: FhirSearchContext, resource_type: str, params: dict, sort: str = None,
+                                 mode: str = "fetch"):
+    """
+    The same as search_resources of base/search_sets.py, through the same search cache.
+    :param mode: "fetch" for the first page, "fetch_all" for every page, "get" for a single resource, "count"
+    """
+    cache_params = {**params, "_sort": sort}
+    result = search_cache.lookup(context.client, resource_type, cache_params, mode)
+    if result is None:
+        result = await _send_search(context, resource_type, params, sort, mode)
+        search_cache.store(context.client, resource_type, cache_params, result, mode)
+    return result
+
+
+async def send_searches(context: FhirSearchContext, program):
+    """
+    The async I/O layer of the search programs of base/fetch_planner.py, the searches of a round are awaited together.
+    :return: the return value of the program
+    """
+    try:
+        requests = next(program)
+        while True:
+            results = await asyncio.gather(*[async_search_resources(context, request.resource_type, request.params,
+                                                                    sort=request.sort, mode=request.mode)
+                                             for request in requests])
+            requests = program.send(list(results))
+    except StopIteration as done:
+        return done.value
+
+
+async def search_data_sets(context: FhirSearchContext, patient_id: str, table: dict, default_time: datetime) -> dict:
+    """
+    Send the searches of every feature (feature_searches of base/fetch_planner.py) with the async client, the
+    searches of a round are awaited together on one event loop.
+    :return: feature name and its data set
+    """
+    return await send_searches(context, feature_searches(context.client.url, patient_id, table, default_time))
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import configObject as conf
+
+
+class _CardCache:
+    """
+    Stale-while-revalidate cache of the CDS Hooks cards, keyed by (FHIR server, authorization, patient, encounter,
+    model). The authorization is part of the key, the same as in the search cache, so a card is only served to the
+    hooks with the credentials it was computed with. The encounter is part of it because model_evaluation decides the
+    models of the patient per encounter.
+
+    A patient-view hook of a patient whose models all have a card younger than the max age is answered from the
+    cache, and the cards are recomputed in the background for the next view. A model that was skipped for the
+    patient is stored with card None, so it does not make the patient a cache miss.
+    """
+
+    def __init__(self, max_size=None, max_age_seconds=None, enabled=None, refresh_workers=None):
+        cache_config = conf.get("card_cache", {})
+        self._enabled = enabled if enabled is not None else cache_config.get("ENABLED", False)
+        self._max_size = max_size if max_size is not None else cache_config.get("MAX_SIZE", 1024)
+        self._max_age = max_age_seconds if max_age_seconds is not None \
+            else cache_config.get("MAX_AGE_SECONDS", 900)
+        self._refresh_workers = refresh_workers if refresh_workers is not None \
+            else cache_config.get("REFRESH_WORKERS", 2)
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @staticmethod
+    def _key(server, authorization, patient_id, encounter_id) -> tuple:
+        return server, hashlib.sha256(str(authorization).encode()).hexdigest(), patient_id, encounter_id
+
+    def get_cards(self, server, authorization, patient_id, encounter_id, model_names) -> list or None:
+        """
+        :return: (model name, card, age in seconds) of every model, or None if any of them has no fresh card
+        """
+        if not self._enabled:
+            return None
+
+        now = time.time()
+        cards = []
+        patient_key = self._key(server, authorization, patient_id, encounter_id)
+        with self._lock:
+            for model_name in model_names:
+                key = (*patient_key, model_name)
+                if key not in self._entries:
+                    return None
+                stored_at, card = self._entries[key]
+                if now - stored_at > self._max_age:
+                    return None
+                self._entries.move_to_end(key)
+                cards.append((model_name, card, now - stored_at))
+        return cards
+
+    def put(self, server, authorization, patient_id, encounter_id, model_name, card):
+        if not self._enabled:
+            return
+
+        with self._lock:
+            key = (*self._key(server, authorization, patient_id, encounter_id), model_name)
+            self._entries[key] = (time.time(), card)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def refresh(self, server, authorization, patient_id, encounter_id, recompute) -> bool:
+        """
+        Run recompute in the background, unless the cards of the patient are being recomputed already.
+        :param recompute: callable that computes the cards and puts them into the cache
+        :return: whether the recomputation was scheduled
+        """
+        key = self._key(server, authorization, patient_id, encounter_id)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(1, self._refresh_workers),
+                                                    thread_name_prefix="card-cache-refresh")
+
+        def run():
+            try:
+                recompute()
+            except Exception as e:
+                # The cached cards stay until they are too old, the next view computes them again.
+                print(e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(run)
+        return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -21,13 +21,13 @@ class App(object):
     def discovery(self):
         return {"services": [s.to_dict() for s in self.services]}
 
-    def handle_hook(self, id: str, input: dict) -> Response:
+    async def handle_hook(self, id: str, input: dict) -> Response:
         try:
             if "hook" in input:
                 hook = input["hook"]
                 for service in self.services:
                     if hook == service.hook and id == service.id:
-                        return service.handle_input(input)
+                        return await service.handle_input(input)
                 # message = f"service with id: {id} and hook {hook} not found"
             return Response(statusCode=400)
         except Exception as e:
@@ -11,9 +11,9 @@ class FHIRAuthorization:
     # https://cds-hooks.org/specification/current/#fhir-resource-access
     access_token: str  # REQUIRED:	string	This is the OAuth 2.0 access token that provides access to the FHIR server.
     token_type: str  # expires_in	REQUIRED	Fixed value: Bearer
-    expires_in = None  # REQUIRED	integer	The lifetime in seconds of the access token.
     scope: str  # REQUIRED	string	The scopes the access token grants the CDS Service.
     subject: str  # REQUIRED	string	The OAuth 2.0 client identifier of the CDS Service, as registered with the CDS Client's authorization server.
+    expires_in: int = None  # REQUIRED	integer	The lifetime in seconds of the access token.
 
 
 class Request(object):
@@ -21,7 +21,7 @@ class Request(object):
     hookInstance: str  # REQUIRED	string	A UUID for this particular hook call (see more information below).
     fhirServer: str = ""  # OPTIONAL: an fhir server to access
     fhirAuthorization: FHIRAuthorization = None  # OPTIONAL: an fhirAuthorization
-    prefetch: object  # OPTIONAL	object	The FHIR data that was prefetched by the CDS Client (see more information below).
+    prefetch: object = None  # OPTIONAL	object	The FHIR data that was prefetched by the CDS Client (see more information below).
 
     def hydrate(self, req):
         self.set_hooks(req)
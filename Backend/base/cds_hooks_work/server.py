@@ -1,6 +1,8 @@
 from flask import Flask, json, request, Blueprint
 from flask_cors import CORS
 
+from base.object_store import async_runner
+
 # flaskApp = Flask(__name__)
 flaskApp = Blueprint('cds_hooks', __name__)
 
@@ -20,7 +22,8 @@ def init(app):
     def service(id):
         requestData = request.json
         try:
-            response = app.handle_hook(id, requestData)
+            # The hooks of every in-flight request are multiplexed on the shared event loop.
+            response = async_runner.run(app.handle_hook(id, requestData))
             body = response.to_dict()
             return json.jsonify(body), response.httpStatusCode
         except:
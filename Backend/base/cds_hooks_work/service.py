@@ -1,3 +1,4 @@
+import inspect
 from typing import List
 from .request import Request, PatientViewRequest
 from .response import Response
@@ -14,7 +15,7 @@ class Service(object):
     # {baseUrl}/cds-services/{id}
     description: str  # REQUIRED	string	The description of this service.
     title: str  # RECOMMENDED	string	The human-friendly name of this service.
-    prefetch: object  # optional
+    prefetch: object  # optional, the prefetch templates, or a function that returns them when the service is discovered
     handler: HookHandler
 
     def __init__(self, hook, id, description, title="", prefetch=None, handler: HookHandler = None):
@@ -35,18 +36,21 @@ class Service(object):
             "id": self.id,
             "description": self.description,
             "title": self.title,
-            "prefetch": self.prefetch
+            "prefetch": self.prefetch() if callable(self.prefetch) else self.prefetch
         }
 
     def set_handler(self, handler: Callable):
         self.handler = handler
 
-    def handle_input(self, request_dict: dict):
+    async def handle_input(self, request_dict: dict):
         response = Response(statusCode=200)  # set a response with a default status code
 
         if self.hook == 'patient-view':
             request = PatientViewRequest(request_dict)
-            self.handler(request, response)
+            # The handler may be a coroutine function, e.g. one that awaits its FHIR searches
+            result = self.handler(request, response)
+            if inspect.isawaitable(result):
+                await result
             return response
         else:
             raise NotImplemented
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from base.fetch_planner import split_codes
+from base.object_store import feature_table
+from base.patient_bundle import bundle_resources
+from base.patient_bundle import select_feature_resources
+from base.patient_bundle import to_resource
+from base.route_converter import get_by_path
+
+PATIENT_KEY = "patient"
+ENCOUNTER_KEY = "encounter"
+# Resource type -> prefetch keys, and the search parameter of every key. Observation codes may be in the
+# component (e.g. blood pressure), so its codes are prefetched with both code and component-code.
+PREFETCH_SEARCHES = {
+    "Observation": {"observations": "code", "observationComponents": "component-code"},
+    "Procedure": {"procedures": "code"},
+    "Condition": {"conditions": "code"},
+}
+
+
+def prefetch_templates(table=None) -> dict:
+    """
+    The prefetch templates of the CDS service, one search per resource type with the codes of every model.
+    :param table: the feature table, feature_table of base/object_store.py by default
+    :return: e.g. {"patient": "Patient/{{context.patientId}}",
+                   "conditions": "Condition?subject={{context.patientId}}&code=a,b,c", ...}
+    """
+    table = table if table is not None else feature_table
+    codes = {resource_type: [] for resource_type in PREFETCH_SEARCHES}
+    for model_name in table.get_exist_model_name():
+        for feature in table.get_model_feature_dict(model_name).values():
+            resource_type = str(feature['type_of_data']).capitalize()
+            if resource_type not in codes:
+                continue
+            codes[resource_type].extend(code for code in split_codes(feature['code'])
+                                        if code not in codes[resource_type])
+
+    templates = {
+        PATIENT_KEY: "Patient/{{context.patientId}}",
+        ENCOUNTER_KEY: "Encounter/{{context.encounterId}}",
+    }
+    for resource_type, searches in PREFETCH_SEARCHES.items():
+        if len(codes[resource_type]) == 0:
+            continue
+        for key, param in searches.items():
+            templates[key] = f"{resource_type}?subject={{{{context.patientId}}}}&{param}={','.join(codes[resource_type])}"
+    return templates
+
+
+class Prefetch:
+    """
+    The data prefetched by the CDS client. A resource type is answered from the prefetch only when every search of
+    the type was prefetched completely, a missing (null) or paged result leaves the type to the FHIR server.
+    """
+
+    def __init__(self, client, prefetch: dict = None):
+        prefetch = prefetch or {}
+        self.resources = []
+        self.resource_types = set()
+        self.patient = None
+        self.encounter = None
+
+        if prefetch.get(PATIENT_KEY) is not None:
+            self.patient = to_resource(client, prefetch[PATIENT_KEY])
+            self.resources.append(self.patient)
+            self.resource_types.add("Patient")
+        if prefetch.get(ENCOUNTER_KEY) is not None:
+            self.encounter = to_resource(client, prefetch[ENCOUNTER_KEY])
+
+        for resource_type, searches in PREFETCH_SEARCHES.items():
+            bundles = [prefetch.get(key) for key in searches]
+            if any(bundle is None or get_by_path(bundle, ["link", {"relation": "next"}, "url"])
+                   for bundle in bundles):
+                continue
+            # An Observation may be in both the code and the component-code result.
+            seen = set()
+            for bundle in bundles:
+                for resource in bundle_resources(client, bundle):
+                    if resource.get('id') is not None and resource.get('id') in seen:
+                        continue
+                    seen.add(resource.get('id'))
+                    self.resources.append(resource)
+            self.resource_types.add(resource_type)
+
+    def covers(self, feature: dict) -> bool:
+        return str(feature['type_of_data']).capitalize() in self.resource_types
+
+    def feature_data_sets(self, patient_id: str, table: dict, default_time) -> dict:
+        """
+        :return: feature name and its data set, for the features that the prefetch covers
+        """
+        return {key: select_feature_resources(self.resources, patient_id, table[key], default_time)
+                for key in table if self.covers(table[key])}
@@ -0,0 +1,36 @@
+import threading
+
+CODE = "code"
+COMPONENT_CODE = "component_code"
+
+
+def other_form(form: str) -> str:
+    return COMPONENT_CODE if form == CODE else CODE
+
+
+class _CodeSearchForms:
+    """
+    Remembers, per FHIR server and feature code, whether the Observations of the code are found by the code or by the
+    component-code search parameter. e.g. blood pressure is usually stored as components of a panel.
+
+    Once the form is known, Observation searches go straight to it instead of trying code first.
+    """
+
+    def __init__(self):
+        self._forms = {}
+        self._lock = threading.Lock()
+
+    def get(self, server_url, code) -> str or None:
+        """
+        :return: CODE, COMPONENT_CODE or None if the code has never been found on the server
+        """
+        with self._lock:
+            return self._forms.get((server_url, code))
+
+    def remember(self, server_url, code, form):
+        with self._lock:
+            self._forms[(server_url, code)] = form
+
+    def clear(self):
+        with self._lock:
+            self._forms.clear()
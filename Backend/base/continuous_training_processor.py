@@ -5,7 +5,6 @@ from datetime import date, datetime
 
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score, roc_curve
 from sklearn.model_selection import train_test_split
-import tensorflow as tf
 
 from base.exceptions import ThresholdNoneError
 from base.exceptions import VariableNoneError
@@ -13,6 +12,7 @@ from base.object_store import feature_table
 from base.object_store import training_feature_table
 from base.route_converter import get_by_path
 from base.patient_data_search import extract_data_in_data_sets
+from base.search_sets import compile_extraction_plans
 from base.search_sets import get_datetime_value_with_func
 from base.model_input_transformer import transformer
 from base.lib import transform_to_correct_type
@@ -144,13 +144,15 @@ def extract_value_and_datetime(resources: dict, table) -> dict:
     :return: dictionary. Keys are the patient id, and values are the list of resources.
     """
     return_data = {}
+    # Compiled once for every patient
+    plans = compile_extraction_plans(table)
     for patient_id, resources in resources.items():
         patient_separated_data = {}
         for feature_name, resources in resources.items():
             temp_data = {"resource": resources,
                          "type": table[feature_name]["type_of_data"]}
             patient_separated_data[feature_name] = extract_data_in_data_sets(
-                temp_data, table[feature_name])
+                temp_data, table[feature_name], plan=plans[feature_name])
 
         return_data[patient_id] = patient_separated_data
 
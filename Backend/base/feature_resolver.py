@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+
+from base.fetch_planner import split_codes
+from base.fhir_search_obj import FhirSearchContext
+from base.patient_data_search import async_retrieve_data_sets
+from base.search_sets import get_search_start_date
+
+
+def feature_fetch_key(table: dict, default_time: datetime) -> tuple:
+    """
+    Features of different models with the same key get the same data set, e.g. the age of every model.
+    The default value is part of the key, because it is the data set of a feature without resources. The search
+    type is part of it because the search is pushed down with it, a latest feature reads only the newest resources
+    while max, min and all read every page (see get_search_pushdown).
+    :return: (resource type, code set, time window, value route, datetime route, default value, search type)
+    """
+    return (str(table['type_of_data']).capitalize(),
+            tuple(sorted(split_codes(table['code']))),
+            get_search_start_date(table, default_time),
+            tuple(table['value_route'] or ()),
+            tuple(table['datetime_route'] or ()),
+            table['default_value'],
+            str(table['search_type']).capitalize())
+
+
+class FeatureResolver:
+    """
+    The data sets of one request, e.g. every model of a CDS Hooks call. A feature that several models share is
+    fetched once, and the models asking for it while it is being fetched wait for the same retrieval.
+    """
+
+    def __init__(self, patient_id: str, default_time: datetime = None, context: FhirSearchContext = None):
+        self.patient_id = patient_id
+        self.default_time = default_time if default_time is not None else datetime.now()
+        self.context = context
+        # fetch key -> the retrieval task and the feature name it fetched the key with
+        self._fetches = {}
+
+    async def data_sets(self, table: dict) -> dict:
+        """
+        :param table: feature name and its feature table, of one model
+        :return: feature name and the data set returned by async_retrieve_data_sets
+        """
+        keys = {name: feature_fetch_key(table[name], self.default_time) for name in table}
+
+        # The features that no model has asked for yet are retrieved together.
+        new_features = {}
+        for name, key in keys.items():
+            if key not in self._fetches and key not in new_features:
+                new_features[key] = name
+        if len(new_features) > 0:
+            retrieval = asyncio.ensure_future(async_retrieve_data_sets(
+                self.patient_id, {name: table[name] for name in new_features.values()}, self.default_time,
+                self.context))
+            for key, name in new_features.items():
+                self._fetches[key] = (retrieval, name)
+
+        data = {}
+        for name, key in keys.items():
+            retrieval, fetched_name = self._fetches[key]
+            data[name] = (await retrieval)[fetched_name]
+        return data
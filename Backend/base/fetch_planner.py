@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from base.code_search_forms import CODE
+from base.code_search_forms import COMPONENT_CODE
+from base.object_store import code_search_forms
+from base.fhir_search_obj import FhirSearchContext
+from base.object_store import fhir_class_obj
+from base.search_sets import get_search_pushdown
+from base.search_sets import get_search_start_date
+from base.search_sets import is_existence_only
+from base.search_sets import search_resources
+from config import configObject as conf
+
+# Resources that are searched by code, the Patient resource is searched by id and stays on the per-feature path.
+COALESCED_RESOURCE_TYPES = ("Observation", "Procedure", "Condition")
+
+# Keep the same order as the per-feature searches in base/search_sets.py
+SEARCH_SORT = {
+    "Observation": "-date",
+    "Procedure": "-date",
+    "Condition": "recorded-date",
+}
+
+
+@dataclass
+class FeatureSearchGroup:
+    """
+    The features that can be answered by a single FHIR search: same resource type, same date__ge and same pushdown
+    mode, see get_search_pushdown.
+    """
+    resource_type: str
+    date_ge: str | None
+    tables: dict = field(default_factory=dict)
+
+    @property
+    def codes(self) -> list:
+        codes = []
+        for table in self.tables.values():
+            for code in split_codes(table['code']):
+                if code not in codes:
+                    codes.append(code)
+        return codes
+
+
+def split_codes(code: str) -> list:
+    """
+    Split the code of the feature table, e.g. "http://loinc.org|8480-6,http://loinc.org|8462-4"
+    """
+    return [item.strip() for item in str(code).split(",") if item.strip() != ""]
+
+
+def plan_feature_searches(table: dict, default_time: datetime) -> (list, list):
+    """
+    Group the features by (resource type, date__ge, pushdown mode), so every group is fetched with one code=a,b,c
+    search. The latest features are kept apart from the max, min and all ones, which read every page of their search,
+    so a latest feature never pages through the history of the others.
+    :param table: feature name and its feature table, the features may belong to several models
+    :return: the search groups, and the features that still have to be searched one by one
+    """
+    groups = {}
+    single_features = []
+    for key, feature in table.items():
+        resource_type = str(feature['type_of_data']).capitalize()
+        # Existence only features are counted one by one, a shared count can not be split back to the features.
+        if resource_type not in COALESCED_RESOURCE_TYPES or is_existence_only(feature):
+            single_features.append(key)
+            continue
+
+        # Condition is searched without date__ge, see Condition.search
+        date_ge = None if resource_type == "Condition" else get_search_start_date(feature, default_time)
+        _, mode = get_search_pushdown([feature], resource_type)
+        group_key = (resource_type, date_ge, mode)
+        if group_key not in groups:
+            groups[group_key] = FeatureSearchGroup(resource_type, date_ge)
+        groups[group_key].tables[key] = feature
+
+    return list(groups.values()), single_features
+
+
+def match_codings(codings: list, codes: list) -> bool:
+    """
+    Token matching of FHIR search: "system|code" must match both, a code without system matches any system.
+    """
+    for coding in codings or []:
+        if not isinstance(coding, dict):
+            continue
+        for code in codes:
+            if "|" in code:
+                system, value = code.split("|", 1)
+                if coding.get('system') == system and coding.get('code') == value:
+                    return True
+            elif coding.get('code') == code:
+                return True
+    return False
+
+
+def resource_codings(resource, component=False) -> list:
+    if not component:
+        return (resource.get('code') or {}).get('coding') or []
+
+    codings = []
+    for item in resource.get('component') or []:
+        codings.extend((item.get('code') or {}).get('coding') or [])
+    return codings
+
+
+def demultiplex_resources(resources: list, tables: dict, component=False) -> dict:
+    """
+    Give every feature the resources whose coding matches one of its codes. The order of the resources is kept.
+    :return: feature name and its matched resources
+    """
+    matched = {key: [] for key in tables}
+    for resource in resources:
+        codings = resource_codings(resource, component)
+        for key, table in tables.items():
+            if match_codings(codings, split_codes(table['code'])):
+                matched[key].append(resource)
+    return matched
+
+
+def group_search_params(resource_type, patient_id, tables, date_ge, code_param=CODE) -> (dict, str):
+    """
+    The params of the code=a,b,c search of the features, with the pushdown of their search_type and routes.
+    :return: the search params and the fetch mode, see get_search_pushdown
+    """
+    params = {
+        "subject": patient_id,
+        code_param: ",".join(FeatureSearchGroup(resource_type, date_ge, tables).codes),
+    }
+    if date_ge is not None:
+        params['date__ge'] = date_ge
+
+    pushdown_params, mode = get_search_pushdown(list(tables.values()), resource_type)
+    params.update(pushdown_params)
+    return params, mode
+
+
+@dataclass
+class SearchRequest:
+    """
+    One FHIR search of a search program. The programs below hold the rules of what is searched, and the sync
+    (send_searches) and the async (async_search.send_searches) I/O layers only send the searches they yield.
+    """
+    resource_type: str
+    params: dict
+    sort: str | None = None
+    # "fetch" for the first page, "fetch_all" for every page, "get" for a single resource, "count"
+    mode: str = "fetch"
+
+
+def together(programs: list):
+    """
+    Run the search programs side by side, the searches they yield in the same round are yielded as one list.
+    :return: the return value of every program
+    """
+    results = [None] * len(programs)
+    waiting = {}
+
+    def advance(index, sent):
+        try:
+            waiting[index] = programs[index].send(sent)
+        except StopIteration as done:
+            waiting.pop(index, None)
+            results[index] = done.value
+
+    for index in range(len(programs)):
+        advance(index, None)
+    while len(waiting) > 0:
+        rounds = list(waiting.items())
+        answers = yield [request for _, requests in rounds for request in requests]
+        offset = 0
+        for index, requests in rounds:
+            advance(index, answers[offset:offset + len(requests)])
+            offset += len(requests)
+    return results
+
+
+def send_searches(client, program):
+    """
+    The sync I/O layer of the search programs.
+    :return: the return value of the program
+    """
+    try:
+        requests = next(program)
+        while True:
+            requests = program.send([search_resources(client, request.resource_type, request.params,
+                                                      sort=request.sort, mode=request.mode)
+                                     for request in requests])
+    except StopIteration as done:
+        return done.value
+
+
+def search_features(resource_type, patient_id, tables, date_ge, code_param=CODE):
+    """
+    Search program of the features of the tables with one code=a,b,c search.
+    A group whose features only need their latest resource reads the first page of the search. The features that
+    are not on it are searched on their own with the pushdown of a single latest feature (_count=1), instead of
+    paging through the history of the others until every feature has a resource, so a feature without any data costs
+    one small search. A group with a max, min or all feature reads every page.
+    :return: feature name and its matched resources
+    """
+    component = code_param == COMPONENT_CODE
+    params, mode = group_search_params(resource_type, patient_id, tables, date_ge, code_param)
+    [resources] = yield [SearchRequest(resource_type, params, SEARCH_SORT[resource_type], mode)]
+    matched = demultiplex_resources(resources, tables, component=component)
+
+    missing = [key for key in tables if len(matched[key]) == 0]
+    if mode == "fetch_all" or len(tables) == 1 or len(missing) == 0:
+        # Every page was read, or the search was the one of the feature itself.
+        return matched
+
+    searches = []
+    for key in missing:
+        params, mode = group_search_params(resource_type, patient_id, {key: tables[key]}, date_ge, code_param)
+        searches.append(SearchRequest(resource_type, params, SEARCH_SORT[resource_type], mode))
+    results = yield searches
+    for key, resources in zip(missing, results):
+        matched[key] = demultiplex_resources(resources, {key: tables[key]}, component=component)[key]
+    return matched
+
+
+class ObservationFormSearch:
+    """
+    The same as Observation.search, features without any resource by code may be recorded in component-code.
+    Features whose form is known are searched with that form only. The unknown ones are searched by code first, and by
+    component-code only when the code search has no resource for them: the component-code search of a feature that
+    is recorded by code never matches, so it would only read the patient's panels (e.g. blood pressure) for nothing.
+    The searches themselves are sent by the caller, so the sync and the async path share the rules.
+    """
+
+    def __init__(self, server_url: str, group: FeatureSearchGroup):
+        self._server_url = server_url
+        self._group = group
+        forms = {key: code_search_forms.get(server_url, table['code']) for key, table in group.tables.items()}
+        self._searched = {
+            CODE: {key for key in forms if forms[key] != COMPONENT_CODE},
+            COMPONENT_CODE: {key for key in forms if forms[key] == COMPONENT_CODE},
+        }
+        self.matched = {key: [] for key in group.tables}
+
+    def first_searches(self) -> dict:
+        """
+        :return: form and the features that are searched with it first
+        """
+        return {form: set(keys) for form, keys in self._searched.items()}
+
+    def next_searches(self, found: dict) -> dict | None:
+        """
+        :param found: form and the matched resources of its features, see search_features
+        :return: the features that are still missing with the form they have not been searched with yet,
+                 or None when every feature is done
+        """
+        for key in self._group.tables:
+            for form in (CODE, COMPONENT_CODE):
+                if len(self.matched[key]) == 0 and len(found.get(form, {}).get(key, [])) > 0:
+                    self.matched[key] = found[form][key]
+                    code_search_forms.remember(self._server_url, self._group.tables[key]['code'], form)
+
+        retry = {form: {key for key in self._group.tables
+                        if len(self.matched[key]) == 0 and key not in self._searched[form]}
+                 for form in (CODE, COMPONENT_CODE)}
+        if all(len(keys) == 0 for keys in retry.values()):
+            return None
+        for form in retry:
+            self._searched[form] |= retry[form]
+        return retry
+
+
+def _search_observation_forms(server_url: str, patient_id: str, group: FeatureSearchGroup):
+    form_search = ObservationFormSearch(server_url, group)
+    searches = form_search.first_searches()
+    while searches is not None:
+        forms = [form for form in searches if len(searches[form]) > 0]
+        found = yield from together([
+            search_features(group.resource_type, patient_id,
+                            {key: group.tables[key] for key in group.tables if key in searches[form]},
+                            group.date_ge, form)
+            for form in forms])
+        searches = form_search.next_searches(dict(zip(forms, found)))
+    return form_search.matched
+
+
+def group_searches(server_url: str, patient_id: str, group: FeatureSearchGroup):
+    """
+    Search program of every feature of the group, see search_features.
+    :return: feature name and the same data set as get_patient_resources_data_set returns
+    """
+    if group.resource_type == "Observation":
+        matched = yield from _search_observation_forms(server_url, patient_id, group)
+    else:
+        matched = yield from search_features(group.resource_type, patient_id, group.tables, group.date_ge)
+    return to_data_sets(group.resource_type, group.tables, matched)
+
+
+def single_feature_searches(patient_id: str, table: dict, default_time: datetime):
+    """
+    Search program of a feature that is not coalesced: the Patient features, and the existence only features, which
+    are counted with _summary=count.
+    :return: the data set of the feature
+    """
+    resource_type = str(table['type_of_data']).capitalize()
+    if resource_type == "Patient":
+        [patient] = yield [SearchRequest('Patient', {'_id': patient_id, '_count': 1}, mode="get")]
+        return {'resource': [patient], 'type': "Patient"}
+    if not is_existence_only(table):
+        raise KeyError(f"{resource_type} features can not be searched on their own")
+
+    params = {"subject": patient_id, "code": table['code'], "_summary": "count"}
+    # Condition is searched without date__ge, see Condition.search
+    date_ge = None if resource_type == "Condition" else get_search_start_date(table, default_time)
+    if date_ge is not None:
+        params['date__ge'] = date_ge
+    [total] = yield [SearchRequest(resource_type, params, mode="count")]
+    matched = [{'resourceType': resource_type}] if total > 0 else []
+    return to_data_sets(resource_type, {'feature': table}, {'feature': matched})['feature']
+
+
+def feature_searches(server_url: str, patient_id: str, table: dict, default_time: datetime, coalesce: bool = None):
+    """
+    Search program of every feature of a request, the groups and the single features search side by side. Without
+    coalescing every feature is a group of its own, which is the same search as its strategy sends.
+    :param coalesce: search the groups of plan_feature_searches together, COALESCE_QUERIES when None
+    :return: feature name and its data set, in the order of the table
+    """
+    if coalesce is None:
+        coalesce = conf.get("fhir_search").get("COALESCE_QUERIES")
+    groups, single_features = plan_feature_searches(table, default_time)
+    if not coalesce:
+        groups = [FeatureSearchGroup(group.resource_type, group.date_ge, {key: feature})
+                  for group in groups for key, feature in group.tables.items()]
+
+    results = yield from together(
+        [group_searches(server_url, patient_id, group) for group in groups] +
+        [single_feature_searches(patient_id, table[key], default_time) for key in single_features])
+
+    fetched = {}
+    for data_sets in results[:len(groups)]:
+        fetched.update(data_sets)
+    fetched.update(dict(zip(single_features, results[len(groups):])))
+    return {key: fetched[key] for key in table}
+
+
+def fetch_feature_search_group(patient_id: str, group: FeatureSearchGroup, context: FhirSearchContext = None) -> dict:
+    """
+    Fetch every feature of the group with one search, and split the result back to the features.
+    :return: feature name and the same data set as get_patient_resources_data_set returns
+            e.g. {"glucose": {"resource": [SyncFHIRResource...], "type": "Observation"}}
+    """
+    if context is None:
+        context = fhir_class_obj.context()
+    return send_searches(context.client, group_searches(context.client.url, patient_id, group))
+
+
+def to_data_sets(resource_type: str, tables: dict, matched: dict) -> dict:
+    """
+    Pack the matched resources of every feature into the data set that get_patient_resources_data_set returns.
+    """
+    data_sets = {}
+    for key, results in matched.items():
+        if len(results) == 0:
+            # Condition returns None when the patient has no such condition, the others return the default value.
+            results = [None] if resource_type == "Condition" else [tables[key]['default_value']]
+        data_sets[key] = {'resource': results, 'type': resource_type}
+    return data_sets
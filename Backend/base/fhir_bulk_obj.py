@@ -53,7 +53,7 @@ class _BulkDataClient(object):
         self.session.close()
 
     def _issue(self, url, **params):
-        response = self.session.get(url, params=params, timeout=30)
+        response = self.session.get(url, params=params, timeout=config['bulk_server'].get('TIMEOUT_SECONDS', 30))
         response.raise_for_status()
         return response
 
@@ -0,0 +1,283 @@
+import asyncio
+import contextlib
+import json
+import threading
+import time
+from json import JSONDecodeError
+
+import aiohttp
+import requests
+from fhirpy import AsyncFHIRClient
+from fhirpy import SyncFHIRClient
+from fhirpy.base.exceptions import OperationOutcome
+from fhirpy.base.exceptions import ResourceNotFound
+from fhirpy.base.utils import AttrDict
+from requests.adapters import HTTPAdapter
+
+from base.latency_budget import request_timeout
+from config import configObject as conf
+
+
+class PooledFHIRClient(SyncFHIRClient):
+    """
+    SyncFHIRClient that sends every request through one keep-alive requests.Session, instead of requests.request,
+    which opens a new connection (and a new TLS handshake) for every search.
+    """
+
+    def __init__(self, url, authorization=None, extra_headers=None, requests_config=None,
+                 pool_connections=10, pool_maxsize=10, expires_at=None, timeout=None):
+        super().__init__(url, authorization, extra_headers, requests_config)
+        self.expires_at = expires_at
+        self.timeout = timeout
+        self.last_used = time.monotonic()
+        # The requests that hold the client, a retired client is closed when the last one releases it.
+        self.in_use = 0
+        self.retired = False
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _do_request(self, method, path, data=None, params=None):
+        # The same as SyncClient._do_request, except for the session.
+        self.last_used = time.monotonic()
+        headers = self._build_request_headers()
+        url = self._build_request_url(path, params)
+        # The retrievals run on worker threads (asyncio.to_thread), which copy the deadline of the request.
+        timeout = request_timeout(self.timeout)
+        if timeout is not None:
+            # requests does not take a timeout of 0
+            timeout = max(timeout, 0.001)
+        r = self._session.request(method, url, json=data, headers=headers,
+                                  **{"timeout": timeout, **self.requests_config})
+        return _read_response(r.status_code, r.content.decode())
+
+    def close(self):
+        self._session.close()
+
+
+class PooledAsyncFHIRClient(AsyncFHIRClient):
+    """
+    AsyncFHIRClient whose requests share one keep-alive aiohttp session while it is open, instead of a new session
+    (and connection) for every search. The session belongs to the event loop it is opened on, _AsyncFhirClientPool
+    keeps it open for every request of the loop, or it is opened for one block:
+        async with PooledAsyncFHIRClient(url, authorization) as client:
+            ...
+    """
+
+    def __init__(self, url, authorization=None, extra_headers=None, aiohttp_config=None, limit=10, timeout=None,
+                 expires_at=None):
+        super().__init__(url, authorization, extra_headers, aiohttp_config)
+        self._limit = limit
+        self._session = None
+        self.timeout = timeout
+        self.expires_at = expires_at
+        self.last_used = time.monotonic()
+        # The requests that hold the client, a retired client is closed when the last one releases it.
+        self.in_use = 0
+        self.retired = False
+
+    def open(self):
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self._limit))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _do_request(self, method, path, data=None, params=None):
+        if self._session is None:
+            return await super()._do_request(method, path, data, params)
+
+        headers = self._build_request_headers()
+        url = self._build_request_url(path, params)
+        timeout = request_timeout(self.timeout)
+        if timeout is not None:
+            # aiohttp reads a total of 0 as no timeout
+            timeout = max(timeout, 0.001)
+        async with self._session.request(method, url, json=data, headers=headers,
+                                         **{"timeout": aiohttp.ClientTimeout(total=timeout), **self.aiohttp_config}) as r:
+            return _read_response(r.status, await r.text())
+
+
+def _read_response(status, content: str):
+    # The same as the response handling of fhirpy's clients.
+    if 200 <= status < 300:
+        return json.loads(content, object_hook=AttrDict) if content else None
+
+    if status == 404 or status == 410:
+        raise ResourceNotFound(content)
+
+    try:
+        parsed_data = json.loads(content)
+        if parsed_data["resourceType"] == "OperationOutcome":
+            raise OperationOutcome(resource=parsed_data)
+        raise OperationOutcome(reason=content)
+    except (KeyError, JSONDecodeError):
+        raise OperationOutcome(reason=content)
+
+
+class _FhirClientPool:
+    """
+    Keep-alive FHIR clients keyed by (server url, authorization), shared by every request to the same server with the
+    same credentials. A client is evicted when it has been idle for IDLE_TIMEOUT_SECONDS, or when its access token
+    expires, so an expired token is never reused. An evicted client is closed right away when no request holds it,
+    otherwise it is retired and closed when the last request that holds it (see client) releases it.
+    """
+
+    def __init__(self, idle_timeout=None, pool_connections=None, pool_maxsize=None):
+        pool_config = conf.get("fhir_client_pool", {})
+        self._idle_timeout = idle_timeout if idle_timeout is not None else \
+            pool_config.get("IDLE_TIMEOUT_SECONDS", 300)
+        self._pool_connections = pool_connections if pool_connections is not None else \
+            pool_config.get("POOL_CONNECTIONS", 10)
+        self._pool_maxsize = pool_maxsize if pool_maxsize is not None else pool_config.get("POOL_MAXSIZE", 10)
+        self._timeout = pool_config.get("REQUEST_TIMEOUT_SECONDS")
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _is_expired(self, client, now) -> bool:
+        if client.expires_at is not None and time.time() >= client.expires_at:
+            return True
+        return client.in_use == 0 and now - client.last_used > self._idle_timeout
+
+    def evict_expired(self):
+        now = time.monotonic()
+        idle = []
+        with self._lock:
+            expired = [key for key, client in self._clients.items() if self._is_expired(client, now)]
+            for key in expired:
+                client = self._clients.pop(key)
+                client.retired = True
+                if client.in_use == 0:
+                    idle.append(client)
+        for client in idle:
+            client.close()
+
+    def _take(self, url, authorization, expires_in, hold: bool) -> PooledFHIRClient:
+        self.evict_expired()
+        key = (url, authorization)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = PooledFHIRClient(url, authorization,
+                                          pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize,
+                                          timeout=self._timeout)
+                self._clients[key] = client
+            if expires_in is not None:
+                client.expires_at = time.time() + int(expires_in)
+            if hold:
+                client.in_use += 1
+            client.last_used = time.monotonic()
+            return client
+
+    def get(self, url, authorization=None, expires_in=None) -> PooledFHIRClient:
+        """
+        The client is not held, so it may be closed once it is evicted. A closed session opens new connections when
+        it is used again, hold the client with client() to keep its connections for a whole request.
+        :param expires_in: the lifetime of the access token in seconds, e.g. fhirAuthorization.expires_in of CDS Hooks
+        :return: the pooled client of the server and credentials
+        """
+        return self._take(url, authorization, expires_in, hold=False)
+
+    @contextlib.contextmanager
+    def client(self, url, authorization=None, expires_in=None):
+        """
+        Hold the pooled client of the server and credentials for the block, it is not closed while it is held.
+        :param expires_in: the lifetime of the access token in seconds, e.g. fhirAuthorization.expires_in of CDS Hooks
+        """
+        client = self._take(url, authorization, expires_in, hold=True)
+        try:
+            yield client
+        finally:
+            with self._lock:
+                client.in_use -= 1
+                client.last_used = time.monotonic()
+                close = client.retired and client.in_use == 0
+            if close:
+                client.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+
+class _AsyncFhirClientPool:
+    """
+    Open PooledAsyncFHIRClient keyed by (event loop, server url, authorization), so the requests that are served on
+    the same loop share their keep-alive connections. A client is retired when it has been idle for
+    IDLE_TIMEOUT_SECONDS or when its access token expires, and closed once no request holds it any more.
+    """
+
+    def __init__(self, idle_timeout=None, limit=None, timeout=None):
+        pool_config = conf.get("fhir_client_pool", {})
+        self._idle_timeout = idle_timeout if idle_timeout is not None else \
+            pool_config.get("IDLE_TIMEOUT_SECONDS", 300)
+        self._limit = limit if limit is not None else pool_config.get("POOL_MAXSIZE", 10)
+        self._timeout = timeout if timeout is not None else pool_config.get("REQUEST_TIMEOUT_SECONDS")
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _is_expired(self, client, now) -> bool:
+        if client.expires_at is not None and time.time() >= client.expires_at:
+            return True
+        return client.in_use == 0 and now - client.last_used > self._idle_timeout
+
+    def _retire_expired(self, loop) -> list:
+        """
+        :return: the retired clients of the loop that no request holds, to be closed on the loop
+        """
+        now = time.monotonic()
+        retired = []
+        with self._lock:
+            # The clients of a closed loop can not be closed any more, they are only dropped.
+            expired = [key for key, client in self._clients.items()
+                       if key[0].is_closed() or (key[0] is loop and self._is_expired(client, now))]
+            for key in expired:
+                client = self._clients.pop(key)
+                client.retired = True
+                if key[0] is loop and client.in_use == 0:
+                    retired.append(client)
+        return retired
+
+    @contextlib.asynccontextmanager
+    async def client(self, url, authorization=None, expires_at=None):
+        """
+        Hold the open client of the server and credentials for the block, on the running event loop.
+        :param expires_at: when the access token expires, e.g. the expires_at of the pooled sync client
+        """
+        loop = asyncio.get_running_loop()
+        for client in self._retire_expired(loop):
+            await client.close()
+
+        key = (loop, url, authorization)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = PooledAsyncFHIRClient(url, authorization, limit=self._limit, timeout=self._timeout)
+                client.open()
+                self._clients[key] = client
+            if expires_at is not None:
+                client.expires_at = expires_at
+            client.in_use += 1
+            client.last_used = time.monotonic()
+        try:
+            yield client
+        finally:
+            with self._lock:
+                client.in_use -= 1
+                client.last_used = time.monotonic()
+                close = client.retired and client.in_use == 0
+            if close:
+                await client.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
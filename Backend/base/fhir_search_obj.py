@@ -1,38 +1,94 @@
 from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from fhirpy import AsyncFHIRClient
 from fhirpy import SyncFHIRClient
+from base.fhir_client_pool import PooledAsyncFHIRClient
+from base.fhir_client_pool import _AsyncFhirClientPool
+from base.fhir_client_pool import _FhirClientPool
+from base.latency_budget import Deadline
+from base.latency_budget import current_deadline
 from config import configObject as config
 
 
-class _FhirClassObject:
-    _default_client: SyncFHIRClient
-    _client: SyncFHIRClient
+@dataclass
+class FhirSearchContext:
+    """
+    The FHIR client that every search of one request is sent with. It is taken once when the request starts, so the
+    searches of a request keep using the same server even if another request updates the client in the meantime.
+    The async path (base/async_search.py) sends the searches with async_client, to the same server and credentials.
+    """
+    client: SyncFHIRClient
+    async_client: AsyncFHIRClient | None = None
+    patient_id: str | None = None
+    deadline: Deadline | None = None
+    async_pool: _AsyncFhirClientPool | None = None
+
+    def new_async_client(self):
+        """
+        An async client of the same server and credentials as client, hold it with "async with" for the request.
+        The pooled client keeps its session open for the next requests served on the same event loop.
+        """
+        if self.async_pool is not None:
+            return self.async_pool.client(self.client.url, self.client.authorization, self.client.expires_at)
+
+        pool_config = config.get("fhir_client_pool", {})
+        return PooledAsyncFHIRClient(self.client.url, self.client.authorization,
+                                     limit=pool_config.get("POOL_MAXSIZE", 10),
+                                     timeout=pool_config.get("REQUEST_TIMEOUT_SECONDS"))
+
 
+# The context of the request that is being processed, every thread and asyncio task sees the one of its own request.
+_request_context: ContextVar[FhirSearchContext | None] = ContextVar("fhir_request_context", default=None)
+
+
+class _FhirClassObject:
     def __init__(self):
-        self._default_client = SyncFHIRClient(
-            url=config['fhir_server']['FHIR_SERVER_URL']
-        )
+        self._pool = _FhirClientPool()
+        self._async_pool = _AsyncFhirClientPool()
+        self._default_url = config['fhir_server']['FHIR_SERVER_URL']
+
+    @contextmanager
+    def request_context(self, url=None, authorization=None, expires_in=None, patient_id=None,
+                        deadline: Deadline = None):
+        """
+        Send the searches of the current request to its own FHIR server, e.g. the fhirServer of a CDS Hooks call.
+        The requests processed by other threads or asyncio tasks at the same time keep their own server and patient.
 
-    def update_client(self, **kwargs):
+        :param url: fhir base url, the default FHIR server if it is not given
+        :param authorization: "bearer ..." # used while server is protected.
+        :param expires_in: lifetime of the access token in seconds, the pooled client is evicted after it
+                           and closed when the request leaves the context
+        :param patient_id: the patient of the request
+        :param deadline: the latency budget of the request, every FHIR request gets at most what is left of it
+        :return: the FhirSearchContext of the request
         """
+        with self._pool.client(url or self._default_url, authorization, expires_in) as client:
+            context = FhirSearchContext(client, patient_id=patient_id, deadline=deadline,
+                                        async_pool=self._async_pool)
+            token = _request_context.set(context)
+            deadline_token = current_deadline.set(deadline)
+            try:
+                yield context
+            finally:
+                current_deadline.reset(deadline_token)
+                _request_context.reset(token)
+
+    def client(self, default_client=False) -> SyncFHIRClient:
+        return self.context(default_client).client
 
-        :param kwargs: configs of server, {
-            url = fhir base url,
-            authorization = "bearer ..." # used while server is protected.
-        }
-        :return: None
+    def context(self, default_client=False) -> FhirSearchContext:
         """
-        self._client = SyncFHIRClient(
-            **kwargs
-        )
-
-    def client(self, default_client=False):
-        if default_client:
-            return self._default_client
-
-        try:
-            return self._default_client if self._client is None else self._client
-        except AttributeError:
-            return self._default_client
+        :return: the context of the current request, or of the default FHIR server outside of a request context
+        """
+        context = _request_context.get()
+        if default_client or context is None:
+            return FhirSearchContext(self._pool.get(self._default_url), async_pool=self._async_pool)
+
+        return context
 
 
 # fhir_class_obj = FhirClassObject()
@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import configObject as conf
+
+
+class _MicroBatcher:
+    """
+    Collects the rows of concurrent requests into one batch, runs a single predict_batch call for the whole batch
+    and hands every caller its own result back.
+
+    A batch is closed when max_batch_size rows are waiting, or max_wait_ms after its first row arrived.
+    """
+
+    def __init__(self, predict_batch, max_wait_ms=5, max_batch_size=32):
+        """
+        :param predict_batch: callable, receives a list of rows and returns a list of results in the same order
+        :param max_wait_ms: how long the first row of a batch waits for more rows
+        :param max_batch_size: maximum rows of a batch
+        """
+        self._predict_batch = predict_batch
+        self._max_wait = max_wait_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_count = 0
+        self._request_count = 0
+        self._max_batch_seen = 0
+        self._batch_size_histogram = {}
+
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, row) -> Future:
+        future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def predict(self, row):
+        """
+        Block until the batch containing the row has been predicted, and return the result of the row.
+        """
+        return self.submit(row).result()
+
+    def _collect_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            rows = [row for row, _ in batch]
+            try:
+                results = self._predict_batch(rows)
+                if len(results) != len(batch):
+                    raise ValueError(f"predict_batch returned {len(results)} results for {len(batch)} rows.")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+            with self._lock:
+                self._batch_count += 1
+                self._request_count += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                self._batch_size_histogram[len(batch)] = self._batch_size_histogram.get(len(batch), 0) + 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batch_count,
+                "requests": self._request_count,
+                "average_batch_size": self._request_count / self._batch_count if self._batch_count else 0,
+                "max_batch_size": self._max_batch_seen,
+                "batch_size_histogram": dict(sorted(self._batch_size_histogram.items()))
+            }
+
+
+class _InferenceServer:
+    """
+    Optional in-process inference server. Each (model, register|new) pair that is enabled in the config gets its own
+    _MicroBatcher, so concurrent single-patient requests share one forward pass.
+    """
+
+    def __init__(self, server_config: dict = None):
+        if server_config is None:
+            server_config = conf.get("inference_server", {})
+        self._enabled = server_config.get("ENABLED", False)
+        self._models = set(server_config.get("MODELS", []))
+        self._max_wait_ms = server_config.get("MAX_WAIT_MS", 5)
+        self._max_batch_size = server_config.get("MAX_BATCH_SIZE", 32)
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def enabled(self, model_name) -> bool:
+        return self._enabled and model_name in self._models
+
+    def predict(self, model_name, model_type, row, predict_batch):
+        """
+        Queue the row into the batcher of (model_name, model_type), and wait for its result.
+        :param predict_batch: callable used to create the batcher, receives a list of rows and returns their results
+        """
+        key = (model_name, model_type)
+        with self._lock:
+            if key not in self._batchers:
+                self._batchers[key] = _MicroBatcher(predict_batch, self._max_wait_ms, self._max_batch_size)
+            batcher = self._batchers[key]
+        return batcher.predict(row)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            batchers = dict(self._batchers)
+        return {f"{model_name}/{model_type}": batcher.metrics()
+                for (model_name, model_type), batcher in batchers.items()}
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class Deadline:
+    """
+    The latency budget of one request, from the moment it is created. The FHIR searches and model calls of the request
+    are awaited with Deadline.run, so the work that is still running when the budget is spent is cancelled.
+    """
+
+    def __init__(self, budget_seconds: float = None):
+        self.budget = budget_seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget_seconds if budget_seconds is not None else None
+        # (stage name, seconds), in the order the stages finished
+        self.stages = []
+
+    def remaining(self) -> float or None:
+        """
+        :return: the seconds left, never below 0, or None if the request has no budget
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, timeout: float = None) -> float or None:
+        """
+        :return: the shorter of timeout and the remaining budget
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    async def run(self, awaitable):
+        """
+        Await the awaitable within the remaining budget.
+        :raise asyncio.TimeoutError: if the budget is spent first, the awaitable is cancelled
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, remaining)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.monotonic() - started))
+
+    def log_if_exceeded(self, request_name: str):
+        """
+        Log how long every stage took, if the request has run past its budget.
+        """
+        elapsed = time.monotonic() - self.started
+        if self.budget is None or elapsed < self.budget:
+            return
+        stages = ", ".join(f"{name}: {seconds:.2f}s" for name, seconds in self.stages)
+        logging.warning(f"{request_name} exceeded its latency budget of {self.budget}s ({elapsed:.2f}s). {stages}")
+
+
+# The deadline of the request that is being processed, set by fhir_class_obj.request_context. The pooled FHIR clients
+# are shared by the requests, so they read the deadline of the calling request from here.
+current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+def request_timeout(timeout: float = None) -> float or None:
+    """
+    :return: the timeout of a FHIR request, at most what is left of the budget of the current request
+    """
+    deadline = current_deadline.get()
+    return deadline.timeout(timeout) if deadline is not None else timeout
@@ -0,0 +1,92 @@
+import importlib
+import os
+import threading
+
+from config import configObject as conf
+
+
+class _ModelPluginRegistry:
+    """
+    Discovers the model plugins under mocab_models/ and imports each of them on first use.
+
+    符合條件的model plugin:
+        1. folder名稱就是model的名稱
+        2. 裡面有model.py，並由__init__.py匯出predict() function，input attribute為patient_data_list <type: list>
+        3. (Optional) encode(), train(), get_model(), predict_batch()
+
+    If a manifest (list of model names) is given, only those models are served; otherwise the plugin folder is scanned.
+    Nothing is written into mocab_models/__init__.py, and plugins that are never used are never imported, so a
+    deployment serving only qCSI does not pull TensorFlow in.
+    """
+
+    def __init__(self, plugin_path=None, manifest=None):
+        plugin_config = conf.get("model_plugins", {})
+        self._plugin_path = plugin_path if plugin_path is not None else plugin_config.get("PATH", "mocab_models")
+        self._package = os.path.basename(os.path.normpath(self._plugin_path))
+        self._manifest = manifest if manifest is not None else plugin_config.get("MANIFEST")
+        self._names = None
+        self._modules = {}
+        self._lock = threading.Lock()
+        self._import_locks = {}
+
+    def _discover(self) -> list:
+        if self._manifest is not None:
+            return list(self._manifest)
+
+        names = []
+        for plugin_dir in sorted(os.listdir(self._plugin_path)):
+            # 阻絕 "__pycache__" folder
+            if plugin_dir.startswith("_"):
+                continue
+            if os.path.isdir(f"{self._plugin_path}/{plugin_dir}") and \
+                    os.path.exists(f"{self._plugin_path}/{plugin_dir}/model.py"):
+                names.append(plugin_dir)
+        return names
+
+    def names(self) -> list:
+        with self._lock:
+            if self._names is None:
+                self._names = self._discover()
+            return list(self._names)
+
+    def is_loaded(self, name) -> bool:
+        with self._lock:
+            return name in self._modules
+
+    def get(self, name):
+        """
+        Return the plugin module of the model, importing it if this is the first use.
+        :param name: model name, the folder name under mocab_models/
+        :return: module with predict() and the optional functions
+        """
+        with self._lock:
+            if name in self._modules:
+                return self._modules[name]
+        if name not in self.names():
+            raise KeyError(f"Model '{name}' is not exist in {self._plugin_path}.")
+
+        with self._lock:
+            import_lock = self._import_locks.setdefault(name, threading.Lock())
+        with import_lock:
+            with self._lock:
+                if name in self._modules:
+                    return self._modules[name]
+            module = importlib.import_module(f"{self._package}.{name}")
+            with self._lock:
+                self._modules[name] = module
+            return module
+
+    def preload(self, names=None):
+        """
+        Import the given plugins (default: all of them). Errors are printed, the plugin is retried on first use.
+        """
+        for name in names if names is not None else self.names():
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Model plugin '{name}' failed to load: {e}")
+
+    def preload_in_background(self, names=None) -> threading.Thread:
+        thread = threading.Thread(target=self.preload, args=(names,), daemon=True)
+        thread.start()
+        return thread
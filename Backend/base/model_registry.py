@@ -0,0 +1,74 @@
+import os
+import threading
+
+
+class _ModelRegistry:
+    """
+    Process-wide store of deserialized model artifacts.
+
+    Model plugins used to call joblib.load() / tf.keras.models.load_model() inside predict(), so every request
+    deserialized the model from disk again. The registry loads each artifact once and hands the live object back
+    to the plugin. Entries are keyed by the normalized artifact path, e.g. "mocab_models/SPC/register_model".
+
+    An entry is reloaded when the artifact on disk has been replaced (different inode or mtime), and can be dropped
+    explicitly with evict() (used by choose_model() and train_model()).
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.RLock()
+        self._loading_locks = {}
+
+    @staticmethod
+    def _key(path) -> str:
+        return os.path.normpath(path)
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def load(self, path: str, loader):
+        """
+        Return the model stored at path, deserializing it with loader(path) only if it is not resident yet.
+        :param path: path of the model artifact, e.g. f"{base_path}/{model_type}_model"
+        :param loader: callable that receives the path and returns the model object, e.g. joblib.load
+        :return: the live model object
+        """
+        key = self._key(path)
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        # Loading may take seconds (SavedModel), so only requests for the same artifact wait for each other.
+        with loading_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None and entry[0] == signature:
+                    return entry[1]
+
+            model = loader(path)
+            with self._lock:
+                self._models[key] = (signature, model)
+            return model
+
+    def evict(self, path: str):
+        """
+        Drop every resident model whose artifact path is path or lies under path.
+        :param path: an artifact path or a model folder, e.g. "./mocab_models/SPC"
+        """
+        key = self._key(path)
+        with self._lock:
+            for model_key in list(self._models.keys()):
+                if model_key == key or model_key.startswith(key + os.sep):
+                    del self._models[model_key]
+
+    def is_loaded(self, path: str) -> bool:
+        with self._lock:
+            return self._key(path) in self._models
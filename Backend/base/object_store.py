@@ -1,5 +1,16 @@
+import threading
+
+from base.async_runner import _AsyncRunner
+from base.card_cache import _CardCache
+from base.code_search_forms import _CodeSearchForms
 from base.fhir_search_obj import _FhirClassObject
-from base.fhir_bulk_obj import _BulkDataClient
+from base.model_registry import _ModelRegistry
+from base.inference_server import _InferenceServer
+from base.model_plugin_registry import _ModelPluginRegistry
+from base.patient_store import _PatientResourceStore
+from base.prediction_cache import _PredictionCache
+from base.search_cache import _SearchCache
+from base.server_capabilities import _ServerCapabilities
 from base.table import _HooksConfigTable
 from base.table import _FhirResourceRoute
 from base.table import _FeatureTable
@@ -7,15 +18,46 @@ from base.table import _TrainingSetTable
 from base.table import _TrainingStatusTable
 from base.table import _TransformationTable
 
+async_runner = _AsyncRunner()
 fhir_class_obj = _FhirClassObject()
 cds_hooks_config_table = _HooksConfigTable()
 fhir_resources_route = _FhirResourceRoute()
 feature_table = _FeatureTable()
 model_feature_table = _TransformationTable()
-bulk_server = _BulkDataClient()
+model_registry = _ModelRegistry()
+inference_server = _InferenceServer()
+model_plugins = _ModelPluginRegistry()
+prediction_cache = _PredictionCache()
+card_cache = _CardCache()
+code_search_forms = _CodeSearchForms()
+search_cache = _SearchCache()
+server_capabilities = _ServerCapabilities()
+patient_store = _PatientResourceStore()
+
+
+def _bulk_data_client():
+    from base.fhir_bulk_obj import _BulkDataClient
+    return _BulkDataClient()
+
 
 # Used for training pipline
-training_feature_table = _FeatureTable("./config/continuous_training/features.csv")
-training_model_feature_table = _TransformationTable("./config/continuous_training/transformation.csv")
-training_sets_table = _TrainingSetTable()
-training_status_table = _TrainingStatusTable()
+# These objects are created on first use (PEP 562 module __getattr__), so serving-only workers never parse the
+# training tables or import the bulk client until a continuous training process starts.
+_lazy_objects = {
+    "bulk_server": _bulk_data_client,
+    "training_feature_table": lambda: _FeatureTable("./config/continuous_training/features.csv"),
+    "training_model_feature_table": lambda: _TransformationTable("./config/continuous_training/transformation.csv"),
+    "training_sets_table": _TrainingSetTable,
+    "training_status_table": _TrainingStatusTable,
+}
+_lazy_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name not in _lazy_objects:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+    with _lazy_lock:
+        if name not in globals():
+            globals()[name] = _lazy_objects[name]()
+    return globals()[name]
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class CompiledOneHotEncoder:
+    """
+    A fitted sklearn OneHotEncoder compiled into per-column value→index lookup dictionaries.
+
+    transform() writes the one-hot positions straight into a preallocated NumPy block, instead of building a
+    DataFrame, casting it with astype(str) and densifying the sparse output of OneHotEncoder.transform().
+    The result is the same as OneHotEncoder.transform(df.astype(str)).toarray(), including the dropped categories
+    (drop_idx_) and the handle_unknown behaviour.
+    """
+
+    def __init__(self, encoder):
+        self.feature_names_in = [str(name) for name in encoder.feature_names_in_]
+        self.handle_unknown = encoder.handle_unknown
+        self.dtype = encoder.dtype
+
+        drop_idx = getattr(encoder, "drop_idx_", None)
+        self._lookups = []
+        feature_names_out = []
+        offset = 0
+        for column_index, categories in enumerate(encoder.categories_):
+            dropped = None if drop_idx is None or drop_idx[column_index] is None else int(drop_idx[column_index])
+            lookup = {}
+            for category_index, category in enumerate(categories):
+                if category_index == dropped:
+                    # The dropped category is encoded as all zeros.
+                    lookup[str(category)] = -1
+                    continue
+                lookup[str(category)] = offset
+                feature_names_out.append(f"{self.feature_names_in[column_index]}_{category}")
+                offset += 1
+            self._lookups.append(lookup)
+
+        self.feature_names_out = feature_names_out
+        self.n_features_out = offset
+
+    def transform(self, rows) -> np.ndarray:
+        """
+        :param rows: list of rows, each row lists the values in the order of feature_names_in.
+                     Values are compared by str(value), the same as astype(str) does.
+        :return: np.ndarray with shape (len(rows), n_features_out)
+        """
+        encoded = np.zeros((len(rows), self.n_features_out), dtype=self.dtype)
+        for row_index, row in enumerate(rows):
+            self.transform_row(row, encoded[row_index])
+        return encoded
+
+    def transform_row(self, row, out: np.ndarray):
+        """
+        Encode a single row into out, a zero filled array with n_features_out elements.
+        """
+        if len(row) != len(self._lookups):
+            raise ValueError(f"X has {len(row)} features, but the encoder is expecting {len(self._lookups)} features.")
+
+        for column_index, value in enumerate(row):
+            position = self._lookups[column_index].get(str(value))
+            if position is None:
+                if self.handle_unknown == "error":
+                    raise ValueError(f"Found unknown categories ['{value}'] in column {column_index} during transform")
+                continue
+            if position >= 0:
+                out[position] = 1
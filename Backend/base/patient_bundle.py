@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from fhirpy.base.exceptions import ResourceNotFound
+from fhirpy.base.utils import encode_params
+from fhirpy.base.utils import parse_pagination_url
+
+from base.code_search_forms import CODE
+from base.code_search_forms import COMPONENT_CODE
+from base.fetch_planner import SEARCH_SORT
+from base.fetch_planner import SearchRequest
+from base.fetch_planner import demultiplex_resources
+from base.fetch_planner import feature_searches
+from base.fetch_planner import split_codes
+from base.fetch_planner import to_data_sets
+from base.fhir_search_obj import FhirSearchContext
+from base.object_store import patient_store
+from base.route_converter import get_by_path
+from base.search_sets import DEFAULT_ROUTES
+from base.search_sets import get_route_value
+from base.search_sets import get_search_start_date
+from base.search_sets import is_existence_only
+
+
+def to_resource(client, data):
+    # The strategies of base/search_sets.py only read dict or SyncFHIRResource resources.
+    return client.resource(data['resourceType'], **data)
+
+
+def bundle_resources(client, bundle) -> list:
+    return [to_resource(client, entry['resource']) for entry in (bundle or {}).get('entry', [])
+            if 'resource' in entry]
+
+
+def _resource_date(resource, resource_type) -> str | None:
+    value = get_route_value(resource, DEFAULT_ROUTES[resource_type]['datetime'])
+    return str(value) if value is not None else None
+
+
+def all_page_resources(client, bundle) -> list:
+    """
+    :return: the resources of the bundle and of every next page of it
+    """
+    resources = bundle_resources(client, bundle)
+    next_link = get_by_path(bundle, ["link", {"relation": "next"}, "url"])
+    while next_link:
+        bundle = client._fetch_resource(*parse_pagination_url(next_link))
+        resources.extend(bundle_resources(client, bundle))
+        next_link = get_by_path(bundle, ["link", {"relation": "next"}, "url"])
+    return resources
+
+
+def fetch_everything(client, patient_id: str, resource_types: list) -> list:
+    """
+    Read Patient/{id}/$everything filtered by _type, following every next page.
+    _since is not sent: it filters by meta.lastUpdated, not by the date of care, so it would drop the Patient and every
+    resource that has not changed since then, e.g. an old Condition. The whole record of the types is read, which is
+    why RETRIEVAL_MODE defaults to "search".
+    :return: the resources of the patient
+    """
+    bundle = client.execute(f"Patient/{patient_id}/$everything", method="get",
+                            params={"_type": ",".join(resource_types)})
+    return all_page_resources(client, bundle)
+
+
+def select_feature_resources(resources: list, patient_id: str, table: dict, default_time: datetime) -> dict:
+    """
+    Answer one feature from the resources of $everything, the same as its search would.
+    :return: the same data set as get_patient_resources_data_set returns
+    """
+    resource_type = str(table['type_of_data']).capitalize()
+    of_type = [resource for resource in resources if resource.get('resourceType') == resource_type]
+    if resource_type == "Patient":
+        patients = [resource for resource in of_type if resource.get('id') == patient_id] or of_type
+        return {'resource': patients[:1], 'type': resource_type}
+
+    matched = demultiplex_resources(of_type, {'feature': table})['feature']
+    if len(matched) == 0 and resource_type == "Observation":
+        matched = demultiplex_resources(of_type, {'feature': table}, component=True)['feature']
+
+    # Condition is searched without date__ge, see Condition.search
+    date_ge = None if resource_type == "Condition" else get_search_start_date(table, default_time)
+    if date_ge is not None:
+        matched = [resource for resource in matched if (_resource_date(resource, resource_type) or "") >= date_ge]
+
+    # Resources without date go last, as the servers sort them.
+    descending = SEARCH_SORT[resource_type].startswith("-")
+    dated = [resource for resource in matched if _resource_date(resource, resource_type) is not None]
+    matched = sorted(dated, key=lambda resource: _resource_date(resource, resource_type), reverse=descending) + \
+        [resource for resource in matched if _resource_date(resource, resource_type) is None]
+
+    if is_existence_only(table) and len(matched) > 0:
+        matched = [{'resourceType': resource_type}]
+    return to_data_sets(resource_type, {'feature': table}, {'feature': matched})['feature']
+
+
+def fetch_with_everything(context: FhirSearchContext, patient_id: str, table: dict, default_time: datetime) -> dict:
+    """
+    :return: feature name and its data set, every feature is answered from one $everything
+    """
+    resource_types = sorted({str(feature['type_of_data']).capitalize() for feature in table.values()} | {"Patient"})
+    resources = fetch_everything(context.client, patient_id, resource_types)
+    return {key: select_feature_resources(resources, patient_id, table[key], default_time) for key in table}
+
+
+def patient_store_scopes(table: dict) -> list:
+    """
+    The searches that the patient store keeps for the features: the Patient, and per resource type the resources of
+    the codes of the features. Observations are kept by code and by component-code, the same as Observation.search.
+    :return: list of (resource type, code param, codes)
+    """
+    codes = {}
+    for feature in table.values():
+        resource_type = str(feature['type_of_data']).capitalize()
+        codes.setdefault(resource_type, [])
+        if resource_type != "Patient":
+            codes[resource_type].extend(code for code in split_codes(feature['code'])
+                                        if code not in codes[resource_type])
+
+    scopes = []
+    for resource_type in sorted(codes):
+        if resource_type == "Patient":
+            scopes.append(("Patient", None, ()))
+            continue
+        forms = [CODE, COMPONENT_CODE] if resource_type == "Observation" else [CODE]
+        scopes.extend((resource_type, form, tuple(sorted(codes[resource_type]))) for form in forms)
+    return scopes
+
+
+def _fetch_patient_resources(client, patient_id: str, scope: tuple, last_sync: str | None) -> list:
+    resource_type, code_param, codes = scope
+    if resource_type == "Patient":
+        params = {"_id": patient_id}
+    else:
+        params = {"subject": patient_id, code_param: ",".join(codes)}
+    if last_sync is not None:
+        params['_lastUpdated__gt'] = last_sync
+    return client.resources(resource_type).search(**params).fetch_all()
+
+
+def fetch_with_patient_store(context: FhirSearchContext, patient_id: str, table: dict, default_time: datetime) -> dict:
+    """
+    :return: feature name and its data set, every feature is answered from the local resources of the patient,
+             which are refreshed with _lastUpdated deltas (see base/patient_store.py)
+    """
+    client = context.client
+    resources = patient_store.sync(
+        client, patient_id, patient_store_scopes(table),
+        lambda scope, last_sync: _fetch_patient_resources(client, patient_id, scope, last_sync))
+    return {key: select_feature_resources(resources, patient_id, table[key], default_time) for key in table}
+
+
+def _batch_entry(client, request: SearchRequest) -> dict:
+    search = client.resources(request.resource_type).search(**request.params)
+    if request.sort is not None:
+        search = search.sort(request.sort)
+    return {"request": {"method": "GET", "url": f"{request.resource_type}?{encode_params(search.params)}"}}
+
+
+def fetch_batch(client, requests: list) -> list:
+    """
+    Send the searches with one batch Bundle POST.
+    :return: the searchset Bundle of every search in the same order, None for a search that failed
+    """
+    bundle = {
+        "resourceType": "Bundle",
+        "type": "batch",
+        "entry": [_batch_entry(client, request) for request in requests],
+    }
+    response = client.execute("", method="post", data=bundle)
+    results = []
+    for entry in (response or {}).get("entry", []):
+        status = str(entry.get("response", {}).get("status", ""))
+        results.append(entry.get("resource") if status.startswith("2") else None)
+    if len(results) != len(requests):
+        raise ValueError(f"The batch response has {len(results)} entries for {len(requests)} searches")
+    return results
+
+
+def _batch_result(client, request: SearchRequest, bundle):
+    """
+    Read the searchset Bundle of a batch entry the same way search_resources reads its search.
+    Only the fetch_all entries follow their next pages, a batch entry returns the first page of its search.
+    """
+    if request.mode == "count":
+        return bundle.get('total', 0)
+    if request.mode == "fetch_all":
+        return all_page_resources(client, bundle)
+    resources = bundle_resources(client, bundle)
+    if request.mode == "get":
+        if len(resources) == 0:
+            raise ResourceNotFound("No resources found")
+        return resources[0]
+    return resources
+
+
+def send_batch_searches(client, program):
+    """
+    The batch I/O layer of the search programs of base/fetch_planner.py, every round is one batch Bundle POST.
+    :return: the return value of the program
+    """
+    try:
+        requests = next(program)
+        while True:
+            bundles = fetch_batch(client, requests)
+            if any(bundle is None for bundle in bundles):
+                raise ValueError("Some searches of the batch failed")
+            requests = program.send([_batch_result(client, request, bundle)
+                                     for request, bundle in zip(requests, bundles)])
+    except StopIteration as done:
+        return done.value
+
+
+def fetch_with_batch(context: FhirSearchContext, patient_id: str, table: dict, default_time: datetime) -> dict:
+    """
+    :return: feature name and its data set. Every feature is its own entry of the batch with the pushdown of its
+             search_type and routes, so a latest feature reads one resource (_count=1) and only the max, min and all
+             features page. A coalesced code=a,b,c entry would come back with the first page only, and paging it
+             until every feature is on it reads the history of the others.
+    """
+    return send_batch_searches(context.client, feature_searches(context.client.url, patient_id, table, default_time,
+                                                                coalesce=False))
@@ -1,14 +1,36 @@
+import asyncio
+import dataclasses
 import datetime
-from base.search_sets import get_patient_resources_data_set
-from base.search_sets import get_resource_datetime
-from base.search_sets import get_resource_value
-from base.search_sets import get_datetime_value_with_func
+from base import async_search
+from base.fetch_planner import feature_searches
+from base.fetch_planner import send_searches
+from base.fhir_search_obj import FhirSearchContext
+from base.object_store import fhir_class_obj
+from base.object_store import patient_store
+from base.object_store import server_capabilities
+from base.patient_bundle import fetch_with_batch
+from base.patient_bundle import fetch_with_everything
+from base.patient_bundle import fetch_with_patient_store
+from base.server_capabilities import BATCH_MODE
+from base.server_capabilities import EVERYTHING_MODE
+from base.server_capabilities import PATIENT_STORE_MODE
+from base.server_capabilities import SEARCH_MODE
+from base.search_sets import ExtractionPlan
+from base.search_sets import compile_extraction_plans
+
+_retrievals = {
+    EVERYTHING_MODE: fetch_with_everything,
+    BATCH_MODE: fetch_with_batch,
+    PATIENT_STORE_MODE: fetch_with_patient_store,
+}
 
 
 def model_feature_search_with_patient_id(patient_id: str,
                                          table: dict,
                                          default_time: str = None,
-                                         data_alive_time: str = None) -> dict:
+                                         data_alive_time: str = None,
+                                         prefetch=None,
+                                         plans: dict = None) -> dict:
     """
     This function will return the result of model feature search with patient id. Different from smart search, this
     function will return the single result in dictionary type with the search_type defined in feature table.
@@ -16,17 +38,23 @@ def model_feature_search_with_patient_id(patient_id: str,
     :param table:
     :param default_time: Not yet implemented
     :param data_alive_time:
+    :param prefetch: the CDS Hooks prefetch (base/cds_prefetch.py), the features it covers are not searched
+    :param plans: feature name and its ExtractionPlan, e.g. feature_table.get_extraction_plans(model_name)
     :return: return date and value in dictionary type
     e.g.: {'date': "2020-12-13", 'value': 87}
     """
-    result_dict = smart_model_feature_search_with_patient_id(patient_id, table, default_time, data_alive_time)
+    if plans is None:
+        plans = compile_extraction_plans(table)
+    result_dict = smart_model_feature_search_with_patient_id(patient_id, table, default_time, data_alive_time,
+                                                             prefetch, plans)
 
     for key in result_dict:
         """
-        get_datetime_value_with_func will return date and value in dictionary type
+        The plan aggregates the date and value with the search_type of the feature, the same as
+        get_datetime_value_with_func
         return e.g.: {'date': "2020-12-13", 'value': 87}
         """
-        result_dict[key] = get_datetime_value_with_func(result_dict[key], table[key])
+        result_dict[key] = plans[key].aggregate(result_dict[key])
 
     return result_dict
 
@@ -34,22 +62,28 @@ def model_feature_search_with_patient_id(patient_id: str,
 def smart_model_feature_search_with_patient_id(patient_id: str,
                                                table: dict,
                                                default_time: str = None,
-                                               data_alive_time: str = None) -> dict:
+                                               data_alive_time: str = None,
+                                               prefetch=None,
+                                               plans: dict = None) -> dict:
     if default_time is None:
         default_time = datetime.datetime.now()
+    if plans is None:
+        plans = compile_extraction_plans(table)
+
+    # The features that the CDS client has prefetched are answered without the FHIR server.
+    prefetched = prefetch.feature_data_sets(patient_id, table, default_time) if prefetch is not None else {}
+    missing = {key: table[key] for key in table if key not in prefetched}
 
     # First is to get all patient resources from FHIR server.
-    data = dict()
-    for key in table:
-        # Key 即為features
-        data[key] = dict()
-        data[key] = get_patient_resources_data_set(patient_id, table[key], default_time, data_alive_time)
+    data = retrieve_data_sets(patient_id, missing, default_time, data_alive_time) if len(missing) > 0 else {}
+    data.update(prefetched)
+    data = {key: data[key] for key in table}
 
     # Next is to extract the data in data sets.
     result_dict = dict()
     for key in data:
         result_dict[key] = dict()
-        result_dict[key] = extract_data_in_data_sets(data[key], table[key], default_time)
+        result_dict[key] = extract_data_in_data_sets(data[key], table[key], default_time, plans[key])
 
     # smart_model_feature_search_with_patient_id will return datetime and value in dictionary type
     # e.g.:{
@@ -61,11 +95,127 @@ def smart_model_feature_search_with_patient_id(patient_id: str,
     return result_dict
 
 
-def extract_data_in_data_sets(data_sets, table, default_time=datetime.datetime.now()) -> dict:
+def retrieve_data_sets(patient_id: str,
+                       table: dict,
+                       default_time: datetime.datetime,
+                       data_alive_time: str = None) -> dict:
+    """
+    Retrieve the resources of every feature from the FHIR server.
+    :return: feature name and the data set returned by get_patient_resources_data_set
+    """
+    # They all share the FHIR client taken when the request starts.
+    context = fhir_class_obj.context()
+    data = None
+    if patient_store.enabled:
+        # The local resources of the patient, refreshed with the resources updated since the last request.
+        retrieval_mode = PATIENT_STORE_MODE
+    else:
+        retrieval_mode = server_capabilities.retrieval_mode(context.client)
+    if retrieval_mode != SEARCH_MODE:
+        # One $everything, one batch Bundle or the patient store for the whole request, the searches are the fallback.
+        try:
+            data = _retrievals[retrieval_mode](context, patient_id, table, default_time)
+        except Exception as e:
+            print(e)
+    if data is None:
+        data = search_data_sets(context, patient_id, table, default_time)
+    return data
+
+
+def search_data_sets(context: FhirSearchContext, patient_id: str, table: dict, default_time: datetime.datetime) -> dict:
+    """
+    Send the searches of every feature (feature_searches of base/fetch_planner.py) with the sync client, one after
+    another. The endpoints take the async path (async_search.search_data_sets), which sends the same searches.
+    :return: feature name and the data set returned by get_patient_resources_data_set
+    """
+    return send_searches(context.client, feature_searches(context.client.url, patient_id, table, default_time))
+
+
+async def async_model_feature_search_with_patient_id(patient_id: str,
+                                                     table: dict,
+                                                     default_time: datetime.datetime = None,
+                                                     data_alive_time: str = None,
+                                                     prefetch=None,
+                                                     plans: dict = None,
+                                                     context: FhirSearchContext = None,
+                                                     resolver=None) -> dict:
+    """
+    The async variant of model_feature_search_with_patient_id for the async views, the searches of the request are
+    awaited together on the event loop of the request (see base/async_search.py).
+    :param context: the FHIR context of the request, its open async_client is shared by every search
+    :param resolver: the FeatureResolver (base/feature_resolver.py) of the request, the features that the models of
+                     the request share are fetched once
+    :return: feature name and its date and value, e.g. {'glucose': {'date': "2020-12-13", 'value': 87}}
+    """
+    if plans is None:
+        plans = compile_extraction_plans(table)
+    result_dict = await async_smart_model_feature_search_with_patient_id(patient_id, table, default_time,
+                                                                         data_alive_time, prefetch, plans, context,
+                                                                         resolver)
+    return {key: plans[key].aggregate(result_dict[key]) for key in result_dict}
+
+
+async def async_smart_model_feature_search_with_patient_id(patient_id: str,
+                                                           table: dict,
+                                                           default_time: datetime.datetime = None,
+                                                           data_alive_time: str = None,
+                                                           prefetch=None,
+                                                           plans: dict = None,
+                                                           context: FhirSearchContext = None,
+                                                           resolver=None) -> dict:
+    if default_time is None:
+        default_time = resolver.default_time if resolver is not None else datetime.datetime.now()
+    if plans is None:
+        plans = compile_extraction_plans(table)
+
+    prefetched = prefetch.feature_data_sets(patient_id, table, default_time) if prefetch is not None else {}
+    missing = {key: table[key] for key in table if key not in prefetched}
+
+    if len(missing) == 0:
+        data = {}
+    elif resolver is not None:
+        data = await resolver.data_sets(missing)
+    else:
+        data = await async_retrieve_data_sets(patient_id, missing, default_time, context)
+    data.update(prefetched)
+    return {key: extract_data_in_data_sets(data[key], table[key], default_time, plans[key]) for key in table}
+
+
+async def async_retrieve_data_sets(patient_id: str,
+                                   table: dict,
+                                   default_time: datetime.datetime,
+                                   context: FhirSearchContext = None) -> dict:
+    """
+    The async variant of retrieve_data_sets.
+    """
+    if context is None:
+        context = fhir_class_obj.context()
+    if patient_store.enabled:
+        retrieval_mode = PATIENT_STORE_MODE
+    else:
+        # The CapabilityStatement is probed once per server, with the sync client.
+        retrieval_mode = await asyncio.to_thread(server_capabilities.retrieval_mode, context.client)
+    if retrieval_mode != SEARCH_MODE:
+        # One request for the whole patient (or none with the patient store), so it stays on the sync client.
+        try:
+            return await asyncio.to_thread(_retrievals[retrieval_mode], context, patient_id, table, default_time)
+        except Exception as e:
+            print(e)
+
+    if context.async_client is not None:
+        return await async_search.search_data_sets(context, patient_id, table, default_time)
+    async with context.new_async_client() as async_client:
+        context = dataclasses.replace(context, async_client=async_client)
+        return await async_search.search_data_sets(context, patient_id, table, default_time)
+
+
+def extract_data_in_data_sets(data_sets, table, default_time=datetime.datetime.now(), plan: ExtractionPlan = None) \
+        -> dict:
     """
     This function will extract the data in data_sets and return a dictionary
     :param data_sets:
     :param default_time:
+    :param plan: the compiled ExtractionPlan of the feature, compiled from the table if it is not given
     :return: All features value and date in dictionary type
     e.g.:{
         "diastolic blood pressure": {
@@ -74,20 +224,10 @@ def extract_data_in_data_sets(data_sets, table, default_time=datetime.datetime.n
         },...
     }
     """
-    result_list = {"date": [], "value": []}
-    origin_data = data_sets.copy()
-
-    for sync_fhir_resource in data_sets['resource']:
-        # TODO: 其實也可以改這個動作，畢竟真的很多餘，但有點怕大改
-        origin_data['resource'] = sync_fhir_resource
-
-        temp_date = get_resource_datetime(origin_data, table, default_time)
-        temp_value = get_resource_value(origin_data, table)
-        pass
-
-        result_list['date'].append(temp_date)
-        result_list['value'].append(temp_value)
-    return result_list
+    # The data set is read with the strategy of the type it was searched with, normally the type of the feature.
+    if plan is None or plan.resource_type != str(data_sets['type']).capitalize():
+        plan = ExtractionPlan({**table, 'type_of_data': data_sets['type']})
+    return plan.extract(data_sets['resource'], default_time)
 
 
 if __name__ == '__main__':
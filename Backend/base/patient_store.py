@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from config import configObject as conf
+
+
+class _PatientResources:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # scope -> {resource id: resource}
+        self.resources = {}
+        # scope -> (last sync instant for _lastUpdated, monotonic time of the last full fetch)
+        self.synced = {}
+
+
+class _PatientResourceStore:
+    """
+    In-memory store of the resources of recently scored patients, so a patient that is scored many times a day is
+    refreshed with small _lastUpdated=gt<last sync> deltas instead of pulling the whole history again.
+
+    Patients are keyed by (FHIR server url, hashed authorization, patient id) and the least recently used patient is
+    dropped once MAX_PATIENTS is exceeded. A patient holds the resources of every search scope it has been synced with,
+    e.g. the Observations of the codes of the scored models, so the store never pulls resources that no feature reads.
+    Deleted resources do not show up in a delta, so every scope is fetched in full again after FULL_REFRESH_SECONDS. The last sync instant is moved back by OVERLAP_SECONDS to
+    tolerate clock skew between this server and the FHIR server, the overlapping resources are merged by id.
+    """
+
+    def __init__(self, max_patients=None, full_refresh_seconds=None, overlap_seconds=None, enabled=None):
+        store_config = conf.get("patient_store", {})
+        self.enabled = enabled if enabled is not None else store_config.get("ENABLED", False)
+        self._max_patients = max_patients if max_patients is not None else store_config.get("MAX_PATIENTS", 256)
+        self._full_refresh = full_refresh_seconds if full_refresh_seconds is not None else \
+            store_config.get("FULL_REFRESH_SECONDS", 3600)
+        self._overlap = overlap_seconds if overlap_seconds is not None else store_config.get("OVERLAP_SECONDS", 60)
+        self._patients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(client, patient_id) -> tuple:
+        authorization = getattr(client, "authorization", None) or ""
+        return client.url, hashlib.sha256(str(authorization).encode()).hexdigest(), patient_id
+
+    def _patient(self, key) -> _PatientResources:
+        with self._lock:
+            patient = self._patients.get(key)
+            if patient is None:
+                patient = _PatientResources()
+                self._patients[key] = patient
+            self._patients.move_to_end(key)
+            while len(self._patients) > self._max_patients:
+                self._patients.popitem(last=False)
+            return patient
+
+    def sync(self, client, patient_id: str, scopes: list, fetch) -> list:
+        """
+        Bring the resources of the patient up to date and return the merged local view.
+        :param scopes: hashable search scopes, e.g. (resource type, code param, codes)
+        :param fetch: function (scope, last sync instant or None) -> list of resources. None asks for every
+                      resource of the scope, otherwise only the resources updated after the instant.
+        :return: every stored resource of the requested scopes, a resource found by several scopes is returned once
+        """
+        patient = self._patient(self._key(client, patient_id))
+        with patient.lock:
+            for scope in scopes:
+                last_sync, full_fetched_at = patient.synced.get(scope, (None, None))
+                if full_fetched_at is None or time.monotonic() - full_fetched_at > self._full_refresh:
+                    last_sync = None
+
+                started_at = datetime.now(timezone.utc) - timedelta(seconds=self._overlap)
+                fetched = fetch(scope, last_sync)
+                if last_sync is None:
+                    patient.resources[scope] = {}
+                    full_fetched_at = time.monotonic()
+                for index, resource in enumerate(fetched):
+                    resource_id = resource.get('id') or f"{started_at.isoformat()}-{index}"
+                    patient.resources[scope][resource_id] = resource
+                patient.synced[scope] = (started_at.isoformat(timespec="seconds"), full_fetched_at)
+
+            merged = {}
+            for scope in scopes:
+                for resource_id, resource in patient.resources[scope].items():
+                    merged.setdefault((resource.get('resourceType'), resource_id), resource)
+            return list(merged.values())
+
+    def forget(self, client, patient_id):
+        with self._lock:
+            self._patients.pop(self._key(client, patient_id), None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._patients)
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import configObject as conf
+
+
+class _PredictionCache:
+    """
+    Bounded LRU cache of model results with a time to live, placed in front of base_module.get_model_result.
+
+    Entries are keyed by (model, model type, model version, transformed feature vector). The version of a model is
+    bumped by invalidate(), which choose_model() calls when it promotes or discards a model, so results of the
+    previous model are never served again.
+    """
+
+    def __init__(self, max_size=None, ttl_seconds=None, enabled=None):
+        cache_config = conf.get("prediction_cache", {})
+        self._enabled = enabled if enabled is not None else cache_config.get("ENABLED", True)
+        self._max_size = max_size if max_size is not None else cache_config.get("MAX_SIZE", 1024)
+        self._ttl = ttl_seconds if ttl_seconds is not None else cache_config.get("TTL_SECONDS", 300)
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _key(self, model_name, model_type, features, version=None):
+        try:
+            # The type is part of the key, 1, 1.0 and True are equal and hash the same but are different features.
+            feature_key = tuple((type(value), value) for value in features)
+            hash(feature_key)
+        except TypeError:
+            return None
+        if version is None:
+            version = self._versions.get(model_name, 0)
+        return model_name, model_type, version, feature_key
+
+    def version(self, model_name) -> int:
+        with self._lock:
+            return self._versions.get(model_name, 0)
+
+    def get(self, model_name, model_type, features):
+        """
+        :return: the cached model result, or None if there is no fresh entry
+        """
+        if not self._enabled:
+            return None
+
+        with self._lock:
+            key = self._key(model_name, model_type, features)
+            if key is None or key not in self._entries:
+                return None
+
+            stored_at, result = self._entries[key]
+            if time.monotonic() - stored_at > self._ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, model_name, model_type, features, result, version=None):
+        """
+        :param version: the model version read before the prediction started. If the model has been invalidated
+                        since then, the result belongs to the previous model and is not stored.
+        """
+        if not self._enabled or result is None:
+            return
+
+        with self._lock:
+            if version is not None and version != self._versions.get(model_name, 0):
+                return
+            key = self._key(model_name, model_type, features, version)
+            if key is None:
+                return
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, model_name):
+        """
+        Drop every result of the model and bump its version.
+        """
+        with self._lock:
+            self._versions[model_name] = self._versions.get(model_name, 0) + 1
+            for key in [key for key in self._entries if key[0] == model_name]:
+                del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import configObject as conf
+
+
+class _SearchCache:
+    """
+    Cross-request cache of FHIR search results, placed under the search of every resource strategy in
+    base/search_sets.py, so opening the same chart again does not repeat the same searches against the FHIR server.
+
+    Entries are keyed by (FHIR server url, hashed authorization, resource type, normalized search params). The
+    authorization is part of the key, so the result fetched with one caller's token is never served to another caller.
+    Each resource type has its own time to live, and the least recently used entries are evicted once the estimated
+    size of the cached resources exceeds MAX_BYTES.
+    """
+
+    def __init__(self, max_bytes=None, ttl_seconds=None, enabled=None):
+        cache_config = conf.get("fhir_search_cache", {})
+        self._enabled = enabled if enabled is not None else cache_config.get("ENABLED", True)
+        self._max_bytes = max_bytes if max_bytes is not None else cache_config.get("MAX_BYTES", 64 * 1024 * 1024)
+        self._ttl = ttl_seconds if ttl_seconds is not None else cache_config.get("TTL_SECONDS", {})
+        self._default_ttl = self._ttl.get("DEFAULT", 60)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(value) -> str:
+        # The order of OR-joined tokens does not change the result, e.g. code=a,b is the same search as code=b,a
+        if isinstance(value, (list, tuple)):
+            return ",".join(sorted(str(item) for item in value))
+        return ",".join(sorted(str(value).split(",")))
+
+    def _key(self, client, resource_type, params, mode) -> tuple:
+        authorization = getattr(client, "authorization", None) or ""
+        return (
+            client.url,
+            hashlib.sha256(str(authorization).encode()).hexdigest(),
+            resource_type,
+            mode,
+            tuple(sorted((str(key), self._normalize(value)) for key, value in params.items())),
+        )
+
+    @staticmethod
+    def _size_of(result) -> int:
+        try:
+            return len(json.dumps(result, default=str))
+        except (TypeError, ValueError):
+            return 0
+
+    def fetch(self, client, resource_type: str, params: dict, fetch, mode="fetch"):
+        """
+        Return the cached result of the search, or call fetch() and cache its result.
+        :param client: the FHIR client the search is sent with, its url and authorization scope the entry
+        :param params: every parameter of the search, including the sort order and the page size
+        :param fetch: function without arguments that sends the search
+        :param mode: how the search is fetched, e.g. "fetch", "fetch_all" or "get"
+        """
+        if not self._enabled:
+            return fetch()
+
+        result = self.lookup(client, resource_type, params, mode)
+        if result is None:
+            result = fetch()
+            self.store(client, resource_type, params, result, mode)
+        return result
+
+    def lookup(self, client, resource_type: str, params: dict, mode="fetch"):
+        """
+        The same as fetch, for callers that send the search themselves, e.g. with an AsyncFHIRClient.
+        :return: the cached result, or None if the search has to be sent
+        """
+        if not self._enabled:
+            return None
+
+        key = self._key(client, resource_type, params, mode)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[0]:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return list(entry[1]) if isinstance(entry[1], list) else entry[1]
+            self._misses += 1
+        return None
+
+    def store(self, client, resource_type: str, params: dict, result, mode="fetch"):
+        if not self._enabled:
+            return
+
+        key = self._key(client, resource_type, params, mode)
+        size = self._size_of(result)
+        if size > self._max_bytes:
+            return
+
+        expires_at = time.monotonic() + self._ttl.get(resource_type, self._default_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (expires_at, list(result) if isinstance(result, list) else result, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / requests if requests > 0 else 0.0,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -3,22 +3,27 @@ from __future__ import annotations
 import re
 import logging
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import numpy as np
 
+from base.code_search_forms import CODE
+from base.code_search_forms import COMPONENT_CODE
+from base.code_search_forms import other_form
 from base.exceptions import RouteNotImplemented
+from base.fhir_search_obj import FhirSearchContext
+from base.object_store import code_search_forms
 from base.object_store import fhir_class_obj
 from base.object_store import fhir_resources_route
+from base.object_store import search_cache
 from dateutil.relativedelta import relativedelta
 from typing import Dict, Any
 from fhirpy.base.searchset import FHIR_DATE_FORMAT
 from datetime import datetime
 from fhirpy.lib import SyncFHIRResource
 
-from base.route_converter import get_by_path
-
-CLIENT: SyncFHIRResource
-
+from config import configObject as conf
 
 # FHIR_DATE_FORMAT='%Y-%m-%d'
 
@@ -193,7 +198,8 @@ class ResourceMgmt:
         self._strategy = strategy
 
     def get_data_with_resources(self, patient_id: str,
-                                table: Dict, default_time: datetime, data_alive_time=None) -> Dict:
+                                table: Dict, default_time: datetime, data_alive_time=None,
+                                context: FhirSearchContext = None) -> Dict:
         """
         The Context delegates some work to the Strategy object instead of
         implementing multiple versions of the algorithm on its own.
@@ -204,12 +210,12 @@ class ResourceMgmt:
             raise AttributeError("Strategy was not set yet. Set the strategy with 'foo.strategy = bar()'")
 
         logging.info("Getting patient's data with {} resources".format(self._strategy.__name__))
-        global CLIENT
-        CLIENT = fhir_class_obj.client()
+        if context is None:
+            context = fhir_class_obj.context()
 
         try:
             dict_with_resources = self._strategy.search(self._strategy, patient_id, table, default_time,
-                                                        data_alive_time)
+                                                        data_alive_time, context)
         except Exception as e:
             raise e
 
@@ -242,7 +248,8 @@ class ResourcesInterface(ABC):
     """
 
     @abstractmethod
-    def search(self, patient_id: str, table: dict, default_time: datetime, data_alive_time) -> Dict:
+    def search(self, patient_id: str, table: dict, default_time: datetime, data_alive_time,
+               context: FhirSearchContext) -> Dict:
         """
         Search FHIR Resource from FHIR Server and returns the resource list.
         :param patient_id: ID of patient
@@ -250,6 +257,7 @@ class ResourcesInterface(ABC):
         :param default_time: The time we default, usually are the time of the prediction (Such as now), but may would be
             used for training.
         :param data_alive_time: The time we want to get the data. If the data is not alive, we will not get the data.
+        :param context: The FHIR client of the request, the search is sent with context.client
         :return: Dictionary, inside the dictionary are the resources packed into a list and the type of resource.
             resource: list, type: str.capitalize()
         """
@@ -291,30 +299,172 @@ class GetValueAndDatetimeInterface(ABC):
         pass
 
 
+_DATE_REGEX = re.compile(
+    '([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1])))')
+_DATE_TIME_WITHOUT_SEC_REGEX = re.compile(
+    '([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)(-(0[1-9]|1[0-2])(-(0[1-9]|['
+    '1-2][0-9]|3[0-1])(T([01][0-9]|2[0-3]):[0-5][0-9]))) ')
+
+
 def _return_date_time_formatter(datetime_string) -> str or None:
     """
         This is a function that returns a standard DateTime format
         While using it, make sure the datetime_string parameter is a valid 'datetime' string
     """
 
-    date_regex = '([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1])))'
-    date_time_without_sec_regex = '([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)(-(0[1-9]|1[0-2])(-(0[1-9]|[' \
-                                  '1-2][0-9]|3[0-1])(T([01][0-9]|2[0-3]):[0-5][0-9]))) '
     if type(datetime_string) == str:
-        if re.search(date_time_without_sec_regex, datetime_string):
+        if _DATE_TIME_WITHOUT_SEC_REGEX.search(datetime_string):
             return datetime_string[:16]
-        elif re.search(date_regex, datetime_string):
+        elif _DATE_REGEX.search(datetime_string):
             return datetime_string[:10] + 'T00:00'
 
     return None
 
 
+def get_search_start_date(table: dict, default_time: datetime) -> str or None:
+    """
+    The earliest date of the data that is still alive, i.e. default_time - data_alive_time, in FHIR date format.
+    :return: None if the feature has no data_alive_time
+    """
+    if table['data_alive_time'] is None:
+        return None
+
+    return (default_time - relativedelta(
+        years=table['data_alive_time'].get_years(),
+        months=table['data_alive_time'].get_months(),
+        days=table['data_alive_time'].get_days(),
+        hours=table['data_alive_time'].get_hours(),
+        minutes=table['data_alive_time'].get_minutes(),
+        seconds=table['data_alive_time'].get_seconds()
+    )).strftime(FHIR_DATE_FORMAT)
+
+
+# The routes that get_value and get_datetime read when the feature table leaves the route empty.
+# None means the value is not read from the resource, e.g. the default value of Procedure is whether it exists.
+DEFAULT_ROUTES = {
+    "Observation": {"value": ["observation_quantity"], "datetime": ["observation_datetime", "observation_period"]},
+    "Procedure": {"value": None, "datetime": ["procedure_datetime", "procedure_period"]},
+    "Condition": {"value": None, "datetime": ["condition_datetime"]},
+}
+
+
+def get_route_value(resource, route_names: list) -> Any | None:
+    """
+    Read the routes of resource.route in order with their compiled accessors.
+    :return: the first value that is not None, or None
+    """
+    for route_name in route_names:
+        value = fhir_resources_route.get_accessor(route_name)(resource)
+        if value is not None:
+            return value
+    return None
+
+
+def get_search_elements(tables: list, resource_type: str) -> str or None:
+    """
+    The top level elements that the value and datetime routes of the features read, for the _elements parameter.
+    code and component are always kept, so the resources can still be matched with the codes of the features.
+    :return: comma joined elements, or None if a route can not be mapped to an element (e.g. a function route)
+    """
+    elements = ["code", "component"] if resource_type == "Observation" else ["code"]
+    for table in tables:
+        for route_key, default_key in (('value_route', 'value'), ('datetime_route', 'datetime')):
+            route_names = table[route_key] if table[route_key] is not None else \
+                DEFAULT_ROUTES[resource_type][default_key]
+            for route_name in route_names or []:
+                route = fhir_resources_route.get_route(route_name)
+                if len(route) == 0 or not isinstance(route[0], str) or "()" in route[0]:
+                    return None
+                if route[0] not in elements:
+                    elements.append(route[0])
+    return ",".join(elements)
+
+
+def get_search_pushdown(tables: list, resource_type: str) -> (dict, str):
+    """
+    Push the search_type and the routes of the features down to the FHIR search.
+    Latest only needs the first resource in the sort order, so a single latest feature is fetched with _count=1,
+    while max, min and all page through every resource. Only the elements that the routes read are requested.
+    :param tables: the feature tables that share the search
+    :return: the extra search params, and the fetch mode, "fetch" or "fetch_all"
+    """
+    if not conf.get("fhir_search").get("SEARCH_PUSHDOWN"):
+        return {}, "fetch"
+
+    params = {}
+    elements = get_search_elements(tables, resource_type)
+    if elements is not None:
+        params['_elements'] = elements
+
+    if any(str(table['search_type']).capitalize() != "Latest" for table in tables):
+        return params, "fetch_all"
+
+    if len(tables) == 1:
+        params['_count'] = 1
+    return params, "fetch"
+
+
+def is_existence_only(table: dict) -> bool:
+    """
+    Condition and Procedure features without value_route and datetime_route only tell whether any resource exists,
+    so they can be answered by counting the resources. Opt-in, because the date of these features becomes None.
+    """
+    return conf.get("fhir_search").get("EXISTENCE_ONLY_SEARCH") \
+        and str(table['type_of_data']).capitalize() in ("Condition", "Procedure") \
+        and table['value_route'] is None and table['datetime_route'] is None
+
+
+def search_existence(client, resource_type: str, params: dict) -> list:
+    """
+    Count the resources with _summary=count instead of downloading them.
+    :return: one placeholder resource without any element if a resource exists, otherwise an empty list
+    """
+    total = search_resources(client, resource_type, {**params, '_summary': 'count'}, mode="count")
+    return [{'resourceType': resource_type}] if total > 0 else []
+
+
+def search_resources(client, resource_type: str, params: dict, sort: str = None, mode: str = "fetch"):
+    """
+    Send the search through the cross-request search cache (base/search_cache.py).
+    :param mode: "fetch" for the first page, "fetch_all" for every page, "get" for a single resource
+    """
+    search = client.resources(resource_type).search(**params)
+    if sort is not None:
+        search = search.sort(sort)
+    return search_cache.fetch(client, resource_type, {**params, "_sort": sort}, getattr(search, mode), mode)
+
+
+def _search_observation(client, params: dict, form: str, mode: str = "fetch") -> list:
+    """
+    :param form: CODE or COMPONENT_CODE, the search parameter that the code of params is sent with
+    """
+    params = params.copy()
+    params[form] = params.pop('code')
+    return search_resources(client, 'Observation', params, sort='-date', mode=mode)
+
+
+def _search_observation_code_and_component_code(client, params: dict, mode: str = "fetch") -> (list, str):
+    """
+    Send the code and the component-code search concurrently. The code result wins if both have resources.
+    :return: the resources and the form they were found with
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {form: executor.submit(_search_observation, client, params, form, mode)
+                   for form in (CODE, COMPONENT_CODE)}
+        results = {form: future.result() for form, future in futures.items()}
+
+    if len(results[CODE]) == 0 and len(results[COMPONENT_CODE]) > 0:
+        return results[COMPONENT_CODE], COMPONENT_CODE
+    return results[CODE], CODE
+
+
 class Observation(ResourcesInterface, GetValueAndDatetimeInterface):
     def search(self,
                patient_id: str,
                table: dict,
                default_time: datetime = datetime.now(),
-               data_alive_time=None) -> Dict:
+               data_alive_time=None,
+               context: FhirSearchContext = None) -> Dict:
         default_value = table['default_value']
 
         params = {
@@ -325,38 +475,36 @@ class Observation(ResourcesInterface, GetValueAndDatetimeInterface):
         # if data_alive_time is not none, then ignore them
         # Usually used for SMART endpoint.
         if table['data_alive_time'] is not None:
-            params['date__ge'] = (default_time - relativedelta(
-                years=table['data_alive_time'].get_years(),
-                months=table['data_alive_time'].get_months(),
-                days=table['data_alive_time'].get_days(),
-                hours=table['data_alive_time'].get_hours(),
-                minutes=table['data_alive_time'].get_minutes(),
-                seconds=table['data_alive_time'].get_seconds()
-            )).strftime(FHIR_DATE_FORMAT)
-
-        resources = CLIENT.resources('Observation')
-        search = resources.search(
-            **params
-        ).sort('-date')
-        results = search.fetch()
+            params['date__ge'] = get_search_start_date(table, default_time)
 
-        if len(results) == 0:
-            """
-            如果resources的長度為0，代表Server裡面沒有這個病患的code data，
-            可能是在component-code之中，所以再透過component-code去搜尋
-            """
-            params_component = params.copy()
-            params_component['component_code'] = params_component.pop('code')
-            search = resources.search(
-                **params_component
-            ).sort('-date')
-            results = search.fetch()
+        pushdown_params, mode = get_search_pushdown([table], 'Observation')
+        params.update(pushdown_params)
+
+        client = context.client
+        form = code_search_forms.get(client.url, table['code'])
+
+        if form is None and conf.get("fhir_search").get("PARALLEL_COMPONENT_SEARCH"):
+            # The form of the code is still unknown, so both searches are sent at once instead of one after another.
+            results, form = _search_observation_code_and_component_code(client, params, mode)
+        else:
+            form = CODE if form is None else form
+            results = _search_observation(client, params, form, mode)
 
             if len(results) == 0:
                 """
-                如果再次搜尋後的結果依舊為0，代表資料庫中沒有此數據，回傳錯誤到前端(可能還可以想一些其他的解決方案)
+                如果resources的長度為0，代表Server裡面沒有這個病患的code data，
+                可能是在component-code之中，所以再透過component-code去搜尋
                 """
-                results = [default_value]
+                form = other_form(form)
+                results = _search_observation(client, params, form, mode)
+
+        if len(results) == 0:
+            """
+            如果再次搜尋後的結果依舊為0，代表資料庫中沒有此數據，回傳錯誤到前端(可能還可以想一些其他的解決方案)
+            """
+            results = [default_value]
+        else:
+            code_search_forms.remember(client.url, table['code'], form)
 
         return {'resource': results, 'type': 'Observation'}
 
@@ -368,41 +516,20 @@ class Observation(ResourcesInterface, GetValueAndDatetimeInterface):
         if type(resource) is not dict and type(resource) is not SyncFHIRResource:
             return None
 
-        route_list = []
-        if route is None:
-            route_list.append(fhir_resources_route.get_route("observation_datetime"))
-            route_list.append(fhir_resources_route.get_route("observation_period"))
-        else:
-            for item in route:
-                route_list.append(fhir_resources_route.get_route(item))
-
-        for item in route_list:
-            if get_by_path(resource, item) is not None:
-                return get_by_path(resource, item)
-
-        return None
+        return get_route_value(resource, route if route is not None else DEFAULT_ROUTES['Observation']['datetime'])
 
     def get_value(self, resource, route) -> int or float or str or None:
         # Two situation: one is to get the value of resource, the other is to get the value of resource.component
         if type(resource) is not dict and type(resource) is not SyncFHIRResource:
             return resource
 
-        route_list = []
-        if route is None:
-            route_list.append(fhir_resources_route.get_route("observation_quantity"))
-        else:
-            for item in route:
-                route_list.append(fhir_resources_route.get_route(item))
-        for item in route_list:
-            if get_by_path(resource, item) is not None:
-                return get_by_path(resource, item)
-
-        return None
+        return get_route_value(resource, route if route is not None else DEFAULT_ROUTES['Observation']['value'])
 
 
 class Procedure(ResourcesInterface, GetValueAndDatetimeInterface):
 
-    def search(self, patient_id: str, table: dict, default_time: datetime, data_alive_time) -> Dict:
+    def search(self, patient_id: str, table: dict, default_time: datetime, data_alive_time,
+               context: FhirSearchContext = None) -> Dict:
         default_value = table['default_value']
 
         params = {
@@ -413,20 +540,14 @@ class Procedure(ResourcesInterface, GetValueAndDatetimeInterface):
         # if data_alive_time is not none, then ignore them
         # Usually used for SMART endpoint.
         if table['data_alive_time'] is not None:
-            params['date__ge'] = (default_time - relativedelta(
-                years=table['data_alive_time'].get_years(),
-                months=table['data_alive_time'].get_months(),
-                days=table['data_alive_time'].get_days(),
-                hours=table['data_alive_time'].get_hours(),
-                minutes=table['data_alive_time'].get_minutes(),
-                seconds=table['data_alive_time'].get_seconds()
-            )).strftime(FHIR_DATE_FORMAT)
-
-        resources = CLIENT.resources('Procedure')
-        search = resources.search(
-            **params
-        ).sort('-date')
-        results = search.fetch()
+            params['date__ge'] = get_search_start_date(table, default_time)
+
+        if is_existence_only(table):
+            results = search_existence(context.client, 'Procedure', params)
+        else:
+            pushdown_params, mode = get_search_pushdown([table], 'Procedure')
+            params.update(pushdown_params)
+            results = search_resources(context.client, 'Procedure', params, sort='-date', mode=mode)
 
         if len(results) == 0:
             """
@@ -441,36 +562,16 @@ class Procedure(ResourcesInterface, GetValueAndDatetimeInterface):
         if type(resource) is not dict and type(resource) is not SyncFHIRResource:
             return None
 
-        route_list = []
-        if route is None:
-            route_list.append(fhir_resources_route.get_route("procedure_datetime"))
-            route_list.append(fhir_resources_route.get_route("procedure_period"))
-        else:
-            for item in route:
-                route_list.append(fhir_resources_route.get_route(item))
-
-        for item in route_list:
-            if get_by_path(resource, item) is not None:
-                return get_by_path(resource, item)
-
-        return None
+        return get_route_value(resource, route if route is not None else DEFAULT_ROUTES['Procedure']['datetime'])
 
     def get_value(self, resource: dict or SyncFHIRResource, route: list or None) -> int or str or float or bool:
         # The default get_value function in Procedure is to return boolean whether the procedure is done or not.
         if resource is None:
             return False
 
-        route_list = []
         if route is None:
             return True
-        else:
-            for item in route:
-                route_list.append(fhir_resources_route.get_route(item))
-        for item in route_list:
-            if get_by_path(resource, item) is not None:
-                return get_by_path(resource, item)
-
-        return None
+        return get_route_value(resource, route)
 
 
 class Condition(ResourcesInterface, GetValueAndDatetimeInterface):
@@ -478,18 +579,20 @@ class Condition(ResourcesInterface, GetValueAndDatetimeInterface):
                patient_id: str,
                table: dict,
                default_time: datetime = datetime.now(),
-               data_alive_time=None) -> Dict:
+               data_alive_time=None,
+               context: FhirSearchContext = None) -> Dict:
         params = {
             'subject': patient_id,
             'code': table['code']
         }
 
-        resources = CLIENT.resources('Condition')
         # FIXME: 等等，date__ge呢?
-        search = resources.search(
-            **params
-        ).sort('recorded-date')
-        results = search.fetch()
+        if is_existence_only(table):
+            results = search_existence(context.client, 'Condition', params)
+        else:
+            pushdown_params, mode = get_search_pushdown([table], 'Condition')
+            params.update(pushdown_params)
+            results = search_resources(context.client, 'Condition', params, sort='recorded-date', mode=mode)
 
         # 如果result的長度為0，代表病人沒有這個症狀，那就回傳None, 否則回傳結果
         # Consider: 如果這裡不回傳result, 而是回傳true or false，又會如何？
@@ -497,34 +600,19 @@ class Condition(ResourcesInterface, GetValueAndDatetimeInterface):
         return {'resource': [None] if len(results) == 0 else results, 'type': 'Condition'}
 
     def get_datetime(self, resource, route, default_time: datetime = datetime.now()) -> str | None:
-        route_list = []
-        if route is None:
-            route_list.append(fhir_resources_route.get_route("condition_datetime"))
-        else:
-            for item in route:
-                route_list.append(fhir_resources_route.get_route(item))
-
-        for item in route_list:
-            if get_by_path(resource, item) is not None:
-                return get_by_path(resource, item)
-
-        return None
+        return get_route_value(resource, route if route is not None else DEFAULT_ROUTES['Condition']['datetime'])
 
     def get_value(self, resource, route: list or None) -> bool or Any:
         # The default get_value function in Condition is to return boolean whether the patient has the conditions.
         if resource is None:
             return False
 
-        route_list = []
         if route is None:
             return True
-        else:
-            for item in route:
-                route_list.append(fhir_resources_route.get_route(item))
 
-        for item in route_list:
-            if get_by_path(resource, item) is not None:
-                return get_by_path(resource, item)
+        value = get_route_value(resource, route)
+        if value is not None:
+            return value
 
         raise ValueError("Can't find the value of condition")
 
@@ -534,10 +622,9 @@ class Patient(ResourcesInterface, GetValueAndDatetimeInterface):
                patient_id: str,
                table: dict,
                default_time: datetime = datetime.now(),
-               data_alive_time=None) -> Dict:
-        resources = CLIENT.resources('Patient')
-        search = resources.search(_id=patient_id).limit(1)
-        patient = search.get()
+               data_alive_time=None,
+               context: FhirSearchContext = None) -> Dict:
+        patient = search_resources(context.client, 'Patient', {'_id': patient_id, '_count': 1}, mode="get")
 
         return {
             "resource": [patient], 'type': "Patient"
@@ -563,18 +650,9 @@ class Patient(ResourcesInterface, GetValueAndDatetimeInterface):
         :param route:
         :return:
         """
-        route_list = []
         if route is None:
             return default_time.strftime("%Y-%m-%d")
-        else:
-            for item in route:
-                route_list.append(fhir_resources_route.get_route(item))
-
-        for item in route_list:
-            if get_by_path(resource, item) is not None:
-                return get_by_path(resource, item)
-
-        return None
+        return get_route_value(resource, route)
 
     def get_value(self, resource, route) -> int:
         """
@@ -587,22 +665,20 @@ class Patient(ResourcesInterface, GetValueAndDatetimeInterface):
         if type(route) is None:
             raise RouteNotImplemented("Route should not be none, please check the value_route in the feature table")
 
-        route_list = []
         for item in route:
-            route_list.append(fhir_resources_route.get_route(item))
-
-        for item in route_list:
-            if "()" in item[0]:
-                return getattr(self, item[0].replace("()", ""))(resource)
-            else:
-                if get_by_path(resource, item) is not None:
-                    return get_by_path(resource, item)
+            methods = fhir_resources_route.get_route(item)
+            if "()" in methods[0]:
+                return getattr(self, methods[0].replace("()", ""))(resource)
+            value = fhir_resources_route.get_accessor(item)(resource)
+            if value is not None:
+                return value
 
 
 def get_patient_resources_data_set(patient_id,
                                    table,
                                    default_time: datetime,
-                                   data_alive_time=None) -> dict or (dict, dict):
+                                   data_alive_time=None,
+                                   context: FhirSearchContext = None) -> dict or (dict, dict):
     """
     The function gets the history of patient's resources from the database and return
     :param patient_id: patient's id
@@ -612,6 +688,7 @@ def get_patient_resources_data_set(patient_id,
     :param data_alive_time: the time range, start from the default_time.
                             e.g. if the data_alive_time is 2 years, and the default_time is not, the server will search
                                  the data that is between now and two years ago
+    :param context: the FHIR client of the request, DEFAULT=fhir_class_obj.context()
     :return:
             Dict
                 {"resource": [SyncFHIRResources...], "component-code": str or None,
@@ -633,7 +710,8 @@ def get_patient_resources_data_set(patient_id,
     patient_data_dict_origin = patient_resources_mgmt.get_data_with_resources(patient_id,
                                                                               table,
                                                                               default_time,
-                                                                              data_alive_time)
+                                                                              data_alive_time,
+                                                                              context)
     return patient_data_dict_origin
 
 
@@ -687,3 +765,55 @@ def get_datetime_value_with_func(patient_data_dict: dict, table):
         raise AttributeError("'{}' search_type is not supported now, check it again.".format(table['search_type']))
 
     return patient_resource_result
+
+
+class ExtractionPlan:
+    """
+    The extraction of one feature, compiled once from its feature table instead of resolving the strategies of the
+    resource type and the search_type for every resource.
+    """
+
+    def __init__(self, table: dict):
+        self.resource_type = str(table['type_of_data']).capitalize()
+        strategy = globals()[self.resource_type]
+        self._get_datetime = partial(strategy.get_datetime, strategy)
+        self._get_value = partial(strategy.get_value, strategy)
+        self._datetime_route = table['datetime_route']
+        self._value_route = table['value_route']
+
+        # Only aggregate needs the search_type, extract works without it.
+        search_type = str(table.get('search_type', '')).capitalize()
+        if search_type == '':
+            search_type = 'Latest'
+        aggregator = globals().get("Get" + search_type)
+        self._search_type = table.get('search_type')
+        self._aggregate = partial(aggregator.execute, aggregator) if aggregator is not None else None
+
+    def extract(self, resources: list, default_time: datetime = datetime.now()) -> dict:
+        """
+        The same as extract_data_in_data_sets of base/patient_data_search.py.
+        :param resources: the resources of the data set
+        :return: {"date": [...], "value": [...]}
+        """
+        get_datetime, get_value = self._get_datetime, self._get_value
+        datetime_route, value_route = self._datetime_route, self._value_route
+        dates = [_return_date_time_formatter(get_datetime(resource, datetime_route, default_time))
+                 for resource in resources]
+        values = [get_value(resource, value_route) for resource in resources]
+        return {"date": dates, "value": values}
+
+    def aggregate(self, data: dict) -> dict:
+        """
+        The same as get_datetime_value_with_func.
+        """
+        if self._aggregate is None:
+            raise AttributeError("'{}' search_type is not supported now, check it again.".format(self._search_type))
+        return self._aggregate(data)
+
+
+def compile_extraction_plans(table: dict) -> dict:
+    """
+    :param table: feature name and its feature table
+    :return: feature name and its ExtractionPlan
+    """
+    return {key: ExtractionPlan(table[key]) for key in table}
@@ -0,0 +1,74 @@
+import threading
+
+from config import configObject as conf
+
+SEARCH_MODE = "search"
+BATCH_MODE = "batch"
+EVERYTHING_MODE = "everything"
+# Not a server capability, the mode of patient_data_search when the patient store (base/patient_store.py) is enabled
+PATIENT_STORE_MODE = "patient_store"
+
+
+class _ServerCapabilities:
+    """
+    Picks how the patient data of a request is retrieved from a FHIR server:
+        everything: one Patient/{id}/$everything, every feature is answered from the returned bundle
+        batch: the searches of the request are packed into batch Bundle POSTs, one per round of searches
+        search: one search per feature or per coalesced group (see base/fetch_planner.py)
+
+    With RETRIEVAL_MODE "auto", the CapabilityStatement (/metadata) of every server is probed once and the best mode
+    that the server supports is remembered.
+    """
+
+    def __init__(self, retrieval_mode=None):
+        self._retrieval_mode = retrieval_mode if retrieval_mode is not None else \
+            conf.get("fhir_search").get("RETRIEVAL_MODE", SEARCH_MODE)
+        self._modes = {}
+        self._lock = threading.Lock()
+
+    def retrieval_mode(self, client) -> str:
+        if self._retrieval_mode != "auto":
+            return self._retrieval_mode
+
+        with self._lock:
+            if client.url in self._modes:
+                return self._modes[client.url]
+
+        mode = self.probe(client)
+        with self._lock:
+            self._modes[client.url] = mode
+        return mode
+
+    @staticmethod
+    def probe(client) -> str:
+        try:
+            statement = client.execute("metadata", method="get")
+        except Exception as e:
+            print(e)
+            return SEARCH_MODE
+
+        supports_batch = False
+        for rest in (statement or {}).get("rest", []):
+            if rest.get("mode", "server") != "server":
+                continue
+            for resource in rest.get("resource", []):
+                if resource.get("type") != "Patient":
+                    continue
+                for operation in resource.get("operation", []):
+                    if operation.get("name") in ("everything", "$everything") or \
+                            str(operation.get("definition", "")).endswith("Patient-everything"):
+                        return EVERYTHING_MODE
+            if any(interaction.get("code") == "batch" for interaction in rest.get("interaction", [])):
+                supports_batch = True
+
+        return BATCH_MODE if supports_batch else SEARCH_MODE
+
+    def forget(self, url=None):
+        """
+        Probe the server again on its next request, e.g. after it has been upgraded.
+        """
+        with self._lock:
+            if url is None:
+                self._modes.clear()
+            else:
+                self._modes.pop(url, None)
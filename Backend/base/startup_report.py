@@ -0,0 +1,59 @@
+import builtins
+import sys
+import time
+
+
+class ImportTimer:
+    """
+    Measures how long every module import takes while the timer is running, similar to "python -X importtime".
+
+    Only the first import of a module is measured (later imports are dictionary lookups in sys.modules).
+    Cumulative time includes the nested imports, self time excludes them.
+    """
+
+    def __init__(self):
+        self._original_import = None
+        self._stack = []
+        self.records = []
+        self._started_at = None
+        self.total = 0.0
+
+    def start(self):
+        self._original_import = builtins.__import__
+        self._started_at = time.perf_counter()
+        builtins.__import__ = self._timed_import
+
+    def stop(self):
+        builtins.__import__ = self._original_import
+        self.total = time.perf_counter() - self._started_at
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        record = {"module": name, "depth": len(self._stack), "cumulative": 0.0, "children": 0.0}
+        self.records.append(record)
+        self._stack.append(record)
+        started_at = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            record["cumulative"] = time.perf_counter() - started_at
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]["children"] += record["cumulative"]
+
+    def report(self, threshold_ms=1.0) -> str:
+        """
+        :param threshold_ms: imports faster than this are left out of the report
+        :return: the report lines in import order, nested imports are indented
+        """
+        lines = [f"{'self [ms]':>10} | {'cumulative [ms]':>15} | imported module"]
+        for record in self.records:
+            cumulative_ms = record["cumulative"] * 1000
+            if cumulative_ms < threshold_ms:
+                continue
+            self_ms = (record["cumulative"] - record["children"]) * 1000
+            lines.append(f"{self_ms:10.1f} | {cumulative_ms:15.1f} | {'  ' * record['depth']}{record['module']}")
+        lines.append(f"Total startup time: {self.total * 1000:.1f} ms")
+        return "\n".join(lines)
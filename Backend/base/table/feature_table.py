@@ -6,6 +6,7 @@ class _FeatureTable:
     def __init__(self, feature_table_position="./config/features.csv"):
         # TODO: 可以改成Object，以方便後續讀取資料
         self.table = self.__create_table(feature_table_position)
+        self._extraction_plans = {}
 
     @classmethod
     def __create_table(cls, feature_table_position):
@@ -63,6 +64,17 @@ class _FeatureTable:
 
         return self.table[model_name]
 
+    def get_extraction_plans(self, model_name) -> dict:
+        """
+        The ExtractionPlan of every feature of the model, compiled on first use.
+        """
+        if model_name not in self._extraction_plans:
+            # search_sets reads the route table of base/object_store.py, which is created after the feature tables.
+            from base.search_sets import compile_extraction_plans
+            self._extraction_plans[model_name] = compile_extraction_plans(self.get_model_feature_dict(model_name))
+
+        return self._extraction_plans[model_name]
+
     def get_exist_model_name(self) -> list:
         return [i for i in self.table.keys()]
 
@@ -1,8 +1,11 @@
+from base.route_converter import compile_path
 from base.route_converter import parse_route
 
 
 class _FhirResourceRoute:
     rule = {}
+    # Rule name -> compiled route, so reading a resource does not interpret the route again.
+    accessors = {}
 
     def __init__(self, route_file_path="./config/resource.route"):
         with open(route_file_path, newline='') as route_file:
@@ -15,6 +18,7 @@ class _FhirResourceRoute:
                 if result["condition_name"] in self.rule.keys():
                     raise KeyError("Duplicate rule name in the resource.route.")
                 self.rule[result["condition_name"]] = result
+                self.accessors[result["condition_name"]] = compile_path(result["methods"])
 
     @staticmethod
     def _handle_route(string) -> dict:
@@ -54,6 +58,17 @@ class _FhirResourceRoute:
 
         return self.rule[resource_rule]["methods"]
 
+    def get_accessor(self, resource_rule):
+        """
+
+        :param resource_rule: name of route
+        :return: accessor(resource, default=None) of the route, the same as get_by_path(resource, methods, default)
+        """
+        if resource_rule not in self.rule:
+            raise KeyError("Rule is not exist in the resource.route.")
+
+        return self.accessors[resource_rule]
+
     def get_rule_dict(self):
         return sorted(self.rule.keys())
 
@@ -1,8 +1,6 @@
 import csv
 import re
 
-from pwnlib.util import safeeval
-
 from base.lib import transform_to_correct_type, Operation, BaseVariable
 
 prefix_list = [
@@ -129,6 +127,9 @@ class FormulaVariable(BaseVariable):
         self._attributes[name] = variable
 
     def get_value(self):
+        # pwnlib is heavy to import, and only formula variables need it.
+        from pwnlib.util import safeeval
+
         formula = self.formula
         attributes = {(k, v.get_value()) for k, v in self._attributes.items()}
 
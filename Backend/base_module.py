@@ -1,13 +1,15 @@
-import importlib
 import os
 import shutil
 
 import pandas as pd
 
-from mocab_models import *
 from base.model_input_transformer import transformer
 from base.object_store import feature_table
 from base.object_store import model_feature_table
+from base.object_store import model_registry
+from base.object_store import inference_server
+from base.object_store import model_plugins
+from base.object_store import prediction_cache
 
 table = feature_table
 
@@ -31,7 +33,6 @@ def return_model_result(patient_data_dict, api):
     """
         Function return_model_result會對 model執行 predict的動作，回傳 model的結果
         2022-10-10 新增一個新的動作：在丟入Model之前，會先將資料根據ModelFeature Table轉譯成model prefer的category
-        TODO: 把return_model_result獨立成一個新的檔案，需要解決的技術難點: globals()[api]
     """
 
     # transfer patient data into model preferred input
@@ -40,20 +41,88 @@ def return_model_result(patient_data_dict, api):
 
 
 def get_model_result(patient_data_list, api, model_type="register"):
+    # Repeated chart opens and hook retries produce the same feature vector, skip encoding and inference for them.
+    model_version = prediction_cache.version(api)
+    cached_result = prediction_cache.get(api, model_type, patient_data_list)
+    if cached_result is not None:
+        return cached_result
+
+    features = list(patient_data_list)
+    model_results = _predict(patient_data_list, api, model_type)
+    prediction_cache.put(api, model_type, features, model_results, model_version)
+    return model_results
+
+
+def _predict(patient_data_list, api, model_type="register"):
     base_path = f"./mocab_models/{api}"
     try:
         patient_data_list = encode_model_data_set(patient_data_list, api=api)
-        model_results = globals()[api].predict(patient_data_list, base_path, model_type)
+        model = model_plugins.get(api)
+        if inference_server.enabled(api) and hasattr(model, "predict_batch"):
+            # Share the forward pass with the other requests that are waiting for the same model.
+            return inference_server.predict(
+                api, model_type, patient_data_list,
+                lambda rows: model.predict_batch(_combine_rows(rows), base_path, model_type))
+        model_results = model.predict(patient_data_list, base_path, model_type)
         return model_results
     except Exception as e:
         print(e)
         return None
 
 
+def return_model_results(patient_data_dicts: list, api) -> list:
+    """
+        Function return_model_results is the batch variant of return_model_result. Every patient data dictionary is
+        transformed on its own, but the whole set is encoded once and scored with a single predict_batch call.
+    """
+    patient_data_lists = [transformer(model_feature_table, patient_data_dict, api)
+                          for patient_data_dict in patient_data_dicts]
+    return get_model_results(patient_data_lists, api)
+
+
+def get_model_results(patient_data_lists: list, api, model_type="register") -> list:
+    """
+    Score many transformed rows with one model invocation.
+    If the plugin has no predict_batch function, the rows are scored one by one with get_model_result.
+    :param patient_data_lists: list of rows returned by transformer
+    :return: list of model results in the same order, None for every row if the model fails
+    """
+    base_path = f"./mocab_models/{api}"
+    if len(patient_data_lists) == 0:
+        return []
+
+    try:
+        model = model_plugins.get(api)
+        if not hasattr(model, "predict_batch"):
+            return [get_model_result(patient_data_list, api, model_type) for patient_data_list in patient_data_lists]
+
+        x = patient_data_lists
+        if hasattr(model, "encode"):
+            # dtype=object keeps the python values as they are, the same as the single row DataFrame does.
+            x = pd.DataFrame(patient_data_lists, columns=model_feature_table.get_model_feature_column(api),
+                             dtype=object)
+            x = encode_model_data_set(x, api=api)
+        return list(model.predict_batch(x, base_path, model_type))
+    except Exception as e:
+        print(e)
+        # A single row that cannot be encoded fails the whole batch, so fall back to scoring the rows one by one.
+        return [get_model_result(patient_data_list, api, model_type) for patient_data_list in patient_data_lists]
+
+
+def _combine_rows(rows: list) -> pd.DataFrame or list:
+    """
+    Combine the single rows collected by the inference server into the input of predict_batch.
+    Encoded rows are one-row DataFrames, while rows of models without encode() are lists.
+    """
+    if isinstance(rows[0], pd.DataFrame):
+        return pd.concat(rows, ignore_index=True)
+    return rows
+
+
 def encode_model_data_set(x, y=None, api=None) -> pd.DataFrame or (pd.DataFrame, pd.DataFrame):
     base_path = f"./mocab_models/{api}"
     try:
-        x, y = globals()[api].encode(x, y, base_path)
+        x, y = model_plugins.get(api).encode(x, y, base_path)
     except AttributeError:
         pass
 
@@ -65,12 +134,16 @@ def encode_model_data_set(x, y=None, api=None) -> pd.DataFrame or (pd.DataFrame,
 
 def train_model(x_train, y_train, api):
     base_path = f"./mocab_models/{api}"
-    return globals()[api].train(x_train, y_train, base_path)
+    result = model_plugins.get(api).train(x_train, y_train, base_path)
+    # The freshly trained new_model replaces whatever candidate was resident before.
+    model_registry.evict(f"{base_path}/new_model")
+    prediction_cache.invalidate(api)
+    return result
 
 
 def get_machine_learning_model(model_type, api):
     base_path = f"./mocab_models/{api}"
-    return globals()[api].get_model(model_type, base_path)
+    return model_plugins.get(api).get_model(model_type, base_path)
 
 
 def choose_model(api, choosed_model):
@@ -97,21 +170,7 @@ def choose_model(api, choosed_model):
         elif os.path.isdir(base_path + new_model):
             shutil.rmtree(base_path + new_model)
 
-
-def import_model():
-    # TODO: Need to figure out what actions does this function done, and optimize it.
-    # get a handle on the module
-    mdl = importlib.import_module('mocab_models')
-
-    # is there an __all__?  if so respect it
-    if "__all__" in mdl.__dict__:
-        names = mdl.__dict__["__all__"]
-    else:
-        # otherwise we import all names that don't begin with _
-        names = [x for x in mdl.__dict__ if not x.startswith("_")]
-
-    # now drag them in
-    globals().update({k: getattr(mdl, k) for k in names})
-
-
-import_model()
+    # Both artifacts have been swapped or removed, so the resident copies are stale now.
+    model_registry.evict(base_path + prev_model)
+    model_registry.evict(base_path + new_model)
+    prediction_cache.invalidate(api)
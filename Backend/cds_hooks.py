@@ -1,10 +1,23 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+
 import base.cds_hooks_work as cds
 
 from base_module import return_model_result
 from base.cds_hooks_validator import model_evaluating
 from base.cds_hooks_validator import Card
 from base.cds_hooks_validator import card_determine
-from base.patient_data_search import model_feature_search_with_patient_id
+from base.cds_prefetch import Prefetch
+from base.cds_prefetch import prefetch_templates
+from base.async_search import async_search_resources
+from base.feature_resolver import FeatureResolver
+from base.fhir_search_obj import FhirSearchContext
+from base.latency_budget import Deadline
+from base.patient_data_search import async_model_feature_search_with_patient_id
+from base.object_store import async_runner
+from base.object_store import card_cache
 from base.object_store import feature_table
 from base.object_store import fhir_class_obj
 from config import configObject as conf
@@ -13,22 +26,28 @@ from fhirpy.base.exceptions import ResourceNotFound
 cds_app = cds.App()
 
 
-def model_evaluation(patient_id, encounter_id) -> list:
+async def model_evaluation(patient_id, encounter_id, prefetch: Prefetch = None,
+                           context: FhirSearchContext = None) -> list:
     """
     Evaluate which models should be automatically calculated in this round.
     :param patient_id:
     :param encounter_id:
+    :param prefetch: the Patient and Encounter prefetched by the CDS client are not read again
+    :param context: the FHIR context of the hook, with an open async_client
     :return:
     """
-    fhir_client = fhir_class_obj.client()
-    encounter_resource = None
+    encounter_resource = prefetch.encounter if prefetch is not None else None
+    patient_resource = prefetch.patient if prefetch is not None else None
     model_list = []
 
-    # TODO: 之後改掉，取得Resources 的動作統一在search_sets 中執行
-    patient_resource = fhir_client.resources("Patient").search(_id=patient_id).limit(1).get()
-    if encounter_id != "":
+    # The same search as search_sets.Patient, so the Patient features of the models reuse the cached result.
+    if patient_resource is None:
+        patient_resource = await async_search_resources(context, "Patient", {'_id': patient_id, '_count': 1},
+                                                        mode="get")
+    if encounter_id != "" and encounter_resource is None:
         try:
-            encounter_resource = fhir_client.resources("Encounter").search(_id=encounter_id).limit(1).get()
+            encounter_resource = await async_search_resources(context, "Encounter",
+                                                              {'_id': encounter_id, '_count': 1}, mode="get")
         except ResourceNotFound:
             print("No resource found")
 
@@ -41,57 +60,146 @@ def model_evaluation(patient_id, encounter_id) -> list:
     return model_list
 
 
-@cds_app.patient_view("MoCab-CDS-Service", "The patient greeting service greets a patient!", title="Patient Greeter")
-def greeting(r: cds.PatientViewRequest, response: cds.Response):
-    conf['patient_id'] = r.context.patientId
+@cds_app.patient_view("MoCab-CDS-Service", "The patient greeting service greets a patient!", title="Patient Greeter",
+                      prefetch=prefetch_templates)
+async def greeting(r: cds.PatientViewRequest, response: cds.Response):
+    authorization = None
+    expires_in = None
+    if r.fhirAuthorization is not None:
+        authorization = f"{r.fhirAuthorization.token_type} {r.fhirAuthorization.access_token}"
+        expires_in = r.fhirAuthorization.expires_in
+
+    cached_cards = card_cache.get_cards(r.fhirServer, authorization, r.context.patientId, r.context.encounterId,
+                                        feature_table.get_exist_model_name())
+    if cached_cards is not None:
+        # The cards of the previous view are returned at once, and recomputed in the background for the next view.
+        card_cache.refresh(r.fhirServer, authorization, r.context.patientId, r.context.encounterId,
+                           lambda: async_runner.run(patient_view_cards(r, authorization, expires_in)))
+        cards = [with_cache_age(card, age) for model_name, card, age in cached_cards if card is not None]
+    else:
+        cards = await patient_view_cards(r, authorization, expires_in,
+                                         conf.get("latency_budget").get("CDS_HOOKS_SECONDS"))
 
-    try:
-        fhir_class_obj.update_client(url=r.fhirServer,
-                                     authorization=f"{r.fhirAuthorization.token_type} {r.fhirAuthorization.access_token}")
-    except Exception as e:
-        raise Exception(e)
+    for card in cards:
+        response.add_card(card)
+    response.httpStatusCode = 200
 
-    # Add some if-else statement of models' using situation.
-    calculated_list = model_evaluation(r.context.patientId, r.context.encounterId)
 
-    # iterate all require models
-    for model_name in calculated_list:
-        """
-            1. 首先是要確認病患ID在資料庫中的資料集是否足夠，所以這時候會去試探Server看是否有數據
-            2. 確認有資料後，就會將數據丟入Model中進行預測
-            3. 預測完成後，根據Model Score判斷應該要回傳info card 或是 warning card (TODO: 需要一個表格去填寫何時使用warning card)
-            4. 回傳Warning Card
-        """
+async def patient_view_cards(r: cds.PatientViewRequest, authorization=None, expires_in=None,
+                             budget_seconds=None) -> list:
+    """
+    Compute the cards of every model of the patient, and put them into the card cache.
+    :param budget_seconds: the latency budget, the models that are not done by then are skipped and listed in an
+                           info card after the cards of the other models
+    :return: the cards in the order of the calculated models
+    """
+    deadline = Deadline(budget_seconds)
+    # The hook's FHIR server and patient only belong to this call, the other hooks are processed at the same time.
+    with fhir_class_obj.request_context(r.fhirServer, authorization, expires_in, r.context.patientId,
+                                        deadline) as context:
+        # The resources prefetched by the CDS client answer the features first, the FHIR server is searched for the rest.
+        prefetch = Prefetch(context.client, r.prefetch)
+
+        # Every search of the hook is sent with one async client of the hook's FHIR server.
+        async with context.new_async_client() as async_client:
+            context.async_client = async_client
+
+            # Add some if-else statement of models' using situation.
+            try:
+                with deadline.stage("model evaluation"):
+                    calculated_list = await deadline.run(
+                        model_evaluation(context.patient_id, r.context.encounterId, prefetch, context))
+            except asyncio.TimeoutError:
+                deadline.log_if_exceeded("patient-view")
+                # It is not known yet which models apply to the patient.
+                return [generate_skipped_card()]
+
+            # Every model runs its own fetch and predict pipeline, a bounded number of them at the same time.
+            # The features they share are fetched once, and the cards keep the order of calculated_list.
+            resolver = FeatureResolver(context.patient_id, context=context)
+            semaphore = asyncio.Semaphore(max(1, conf.get("cds_hooks").get("MAX_PARALLEL_MODELS")))
+            cards = await asyncio.gather(*[deadline.run(evaluate_model(context.patient_id, model_name, prefetch,
+                                                                       context, semaphore, resolver))
+                                           for model_name in calculated_list], return_exceptions=True)
+
+    deadline.log_if_exceeded("patient-view")
+    # The models that run past the deadline, or whose FHIR requests time out, are skipped.
+    skipped = [model_name for model_name, card in zip(calculated_list, cards) if isinstance(card, asyncio.TimeoutError)]
+    for card in cards:
+        # The same as before the models ran concurrently, an error that is not handled per model fails the hook.
+        if isinstance(card, BaseException) and not isinstance(card, asyncio.TimeoutError):
+            raise card
+
+    # The models that are not calculated for the patient are cached without a card.
+    model_cards = dict(zip(calculated_list, cards))
+    for model_name in feature_table.get_exist_model_name():
+        if model_name not in skipped:
+            card_cache.put(r.fhirServer, authorization, r.context.patientId, r.context.encounterId, model_name,
+                           model_cards.get(model_name))
+
+    cards = [model_cards[model_name] for model_name in calculated_list
+             if model_name not in skipped and model_cards[model_name] is not None]
+    if len(skipped) > 0:
+        cards.append(generate_skipped_card(skipped))
+    return cards
+
+
+def with_cache_age(card: cds.Card, age: float) -> cds.Card:
+    """
+    The cached card, with how long ago it was computed in its detail.
+    """
+    minutes, seconds = divmod(int(age), 60)
+    detail = f"{card.detail or ''}  \nCached result, computed {minutes} min {seconds} s ago."
+    return dataclasses.replace(card, detail=detail)
+
+
+async def evaluate_model(patient_id, model_name, prefetch: Prefetch, context: FhirSearchContext,
+                         semaphore: asyncio.Semaphore, resolver: FeatureResolver = None) -> cds.Card | None:
+    """
+        1. 首先是要確認病患ID在資料庫中的資料集是否足夠，所以這時候會去試探Server看是否有數據
+        2. 確認有資料後，就會將數據丟入Model中進行預測
+        3. 預測完成後，根據Model Score判斷應該要回傳info card 或是 warning card (TODO: 需要一個表格去填寫何時使用warning card)
+        4. 回傳Warning Card
+    :return: the card of the model, or None if the model is skipped
+    """
+    # The time of every stage is logged if the hook runs past its latency budget.
+    deadline = context.deadline if context is not None and context.deadline is not None else Deadline()
+    async with semaphore:
         try:
-            patient_data_dictionary = model_feature_search_with_patient_id(r.context.patientId,
-                                                                           feature_table.get_model_feature_dict(
-                                                                               model_name))
+            with deadline.stage(f"{model_name} fetch"):
+                patient_data_dictionary = await async_model_feature_search_with_patient_id(
+                    patient_id,
+                    feature_table.get_model_feature_dict(model_name),
+                    prefetch=prefetch,
+                    plans=feature_table.get_extraction_plans(model_name),
+                    context=context,
+                    resolver=resolver)
         except (ResourceNotFound, KeyError) as e:
             # TODO: What to do if resources are not found in the server?
             print(e)
-            continue
+            return None
 
         try:
-            patient_data_dictionary["predict_value"] = return_model_result(patient_data_dictionary, model_name)
+            # The prediction is CPU bound, so it runs in the executor instead of on the event loop.
+            with deadline.stage(f"{model_name} predict"):
+                patient_data_dictionary["predict_value"] = await asyncio.to_thread(return_model_result,
+                                                                                   patient_data_dictionary,
+                                                                                   model_name)
         except KeyError as e:
             print(e)
-            continue
+            return None
         except Exception as e:
             print(e)
-            continue
+            return None
 
-        card = generate_cds_card(r.context.patientId, patient_data_dictionary, model_name)
-        response.add_card(card)
-    response.httpStatusCode = 200
+    return generate_cds_card(patient_id, patient_data_dictionary, model_name)
 
 
 def generate_cds_card(patient_id, patient_data_dictionary, model_name) -> cds.Card:  # Model generate card.
     card_used = card_determine(patient_data_dictionary, model_name)
 
     model_name = "".join([i if i.isalnum() else " " for i in model_name])
-    source = cds.Source(label="MoCab CDS Service",
-                        url="https://www.mo-cab.dev",
-                        icon="https://i.imgur.com/sFUFOyO.png")
+    source = card_source()
     # suggestions = [cds.Suggestion(label="Suggestions", isRecommended=True)]
     if card_used is Card.CRITICAL:
         summary = f"Patient {patient_id} has a high risk of \"{model_name}\".\n"
@@ -113,3 +221,20 @@ def generate_cds_card(patient_id, patient_data_dictionary, model_name) -> cds.Ca
         f"{conf.get('base_urls').get('BACKEND_URL')}{conf.get('base_urls').get('smart_prefix')}/launch"
     ))
     return card
+
+
+def generate_skipped_card(model_names=None) -> cds.Card:
+    """
+    The info card of the models that were not done within the latency budget of the hook.
+    :param model_names: the skipped models, None if all the models of the patient were skipped
+    """
+    model_names = ", ".join(model_names) if model_names is not None else "all models"
+    summary = "Some models could not be calculated in time."
+    detail = f"Skipped models: {model_names}  \nThey will be calculated again on the next view of the patient."
+    return cds.Card.info(summary, card_source(), detail=detail)
+
+
+def card_source() -> cds.Source:
+    return cds.Source(label="MoCab CDS Service",
+                      url="https://www.mo-cab.dev",
+                      icon="https://i.imgur.com/sFUFOyO.png")
@@ -1,3 +1,5 @@
+import os
+
 _config = {
     "DEFAULT": {
         "ServerAliveInterval": 45,
@@ -9,9 +11,48 @@ _config = {
         "FHIR_SERVER_URL": "http://ming-desktop.ddns.net:8192/fhir",
         "FHIR_SERVER_URL_LOCAL": "http://localhost:8090/fhir",
     },
+    "fhir_search": {
+        # Search the features of the same resource type and time window together, see base/fetch_planner.py
+        "COALESCE_QUERIES": True,
+        # Search the Observations of a single feature by code and component-code at the same time while the form of
+        # its code is still unknown. The coalesced groups search component-code only after code has missed.
+        "PARALLEL_COMPONENT_SEARCH": True,
+        # Derive _count, _elements and paging from the search_type and routes of the features
+        "SEARCH_PUSHDOWN": True,
+        # Count Condition/Procedure features that have neither value_route nor datetime_route with _summary=count.
+        # Their date becomes None, so it is off by default. Of the shipped features.csv only NSTI "sea" (condition,
+        # code 0) qualifies, the SPC rows read a route of their resource and are always fetched.
+        "EXISTENCE_ONLY_SEARCH": False,
+        # "search", "batch" (one batch Bundle per round of searches), "everything" (one Patient/$everything)
+        # or "auto" to pick by the CapabilityStatement of the server, see base/server_capabilities.py
+        # "everything" reads the whole record of the resource types, it can not be bounded by date (see
+        # fetch_everything of base/patient_bundle.py), so "search" stays the default.
+        "RETRIEVAL_MODE": "search",
+    },
+    "fhir_client_pool": {
+        # Keep-alive clients keyed by (server url, authorization), see base/fhir_client_pool.py
+        "IDLE_TIMEOUT_SECONDS": 300,
+        "POOL_CONNECTIONS": 10,
+        "POOL_MAXSIZE": 10,
+        # Timeout of every FHIR request, a request with a latency budget gets at most what is left of it
+        "REQUEST_TIMEOUT_SECONDS": 30,
+    },
+    "fhir_search_cache": {
+        # FHIR search results shared across requests, scoped by server url and authorization, see base/search_cache.py
+        "ENABLED": True,
+        "MAX_BYTES": 64 * 1024 * 1024,
+        "TTL_SECONDS": {
+            "DEFAULT": 60,
+            "Patient": 3600,
+            "Condition": 600,
+            "Procedure": 600,
+            "Observation": 60,
+        },
+    },
     "bulk_server": {
         "BULK_SERVER_URL": "http://ming-desktop.ddns.net:8193/fhir",
-        "BULK_SERVER_URL_LOCAL": "http://localhost:8888/fhir"
+        "BULK_SERVER_URL_LOCAL": "http://localhost:8888/fhir",
+        "TIMEOUT_SECONDS": 30,
     },
     "base_urls": {
         "BACKEND_URL": "http://localhost:5050",
@@ -20,10 +61,59 @@ _config = {
         "smart_prefix": "/smart",
         "continuous_training_prefix": "/ct",
     },
+    "latency_budget": {
+        # Seconds an endpoint may take, the models that are not done by then are skipped. None for no budget.
+        "CDS_HOOKS_SECONDS": 8,
+        "API_SECONDS": 20,
+    },
+    "cds_hooks": {
+        # Models of one hook call whose fetch and predict run at the same time
+        "MAX_PARALLEL_MODELS": 4,
+    },
+    "batch_api": {
+        # Patients of one /<model>/batch call whose data are searched at the same time
+        "MAX_PARALLEL_PATIENTS": 8,
+    },
+    "model_plugins": {
+        "PATH": "mocab_models",
+        # None: serve every plugin folder under PATH. Or a list of model names, e.g. ["qCSI"]
+        "MANIFEST": None,
+        # Import the plugins in a background thread after boot, instead of on the first request
+        "PRELOAD": True,
+    },
+    "inference_server": {
+        # Collect concurrent predictions of the listed models into one batch, see base/inference_server.py
+        "ENABLED": False,
+        "MODELS": ["SPC"],
+        "MAX_WAIT_MS": 5,
+        "MAX_BATCH_SIZE": 32,
+    },
+    "patient_store": {
+        # Keep the resources of scored patients and refresh them with _lastUpdated deltas, see base/patient_store.py
+        "ENABLED": False,
+        "MAX_PATIENTS": 256,
+        "FULL_REFRESH_SECONDS": 3600,
+        "OVERLAP_SECONDS": 60,
+    },
+    "prediction_cache": {
+        # Model results keyed by the transformed feature vector, cleared when choose_model() swaps the model
+        "ENABLED": True,
+        "MAX_SIZE": 1024,
+        "TTL_SECONDS": 300,
+    },
+    "card_cache": {
+        # Answer patient-view from the cards of the previous view and recompute them in the background
+        "ENABLED": False,
+        "MAX_SIZE": 1024,
+        "MAX_AGE_SECONDS": 900,
+        "REFRESH_WORKERS": 2,
+    },
     "patient_id": "test-03121002",
     "flask_config": {
         "DEBUG": True,
         "PORT": 5050,
+        # Signs the session cookie that keeps the SMART launch of a browser, set it when there are several workers
+        "SECRET_KEY": os.environ.get("MOCAB_SECRET_KEY") or os.urandom(32).hex(),
     }
 }
 
@@ -14,27 +14,6 @@ from base_module import train_model
 from base_module import get_machine_learning_model
 from base_module import choose_model
 from base.lib import transform_to_correct_type
-from base.continuous_training_processor import \
-    combine_training_and_predicting_feature_table, \
-    separate_patients, \
-    allocate_feature_resources, \
-    extract_value_and_datetime, \
-    resources_filter, \
-    transform_data, \
-    merge_transformed_data, \
-    drop_unuseful_rows, \
-    split_data, \
-    imputation_stategy, \
-    model_evaluation, \
-    drop_trained_data
-from base.object_store import \
-    training_sets_table, \
-    bulk_server, \
-    feature_table, \
-    training_feature_table, \
-    model_feature_table, \
-    training_model_feature_table, \
-    training_status_table
 
 ct_app = Blueprint('con_train', __name__)
 lock = threading.Lock()
@@ -127,6 +106,30 @@ def check_status(process_id):
 
 
 def training_process(model_name):
+    # The training stack (sklearn metrics, training tables, bulk client) is imported on the first training process,
+    # so serving-only workers never load it.
+    from base.continuous_training_processor import \
+        combine_training_and_predicting_feature_table, \
+        separate_patients, \
+        allocate_feature_resources, \
+        extract_value_and_datetime, \
+        resources_filter, \
+        transform_data, \
+        merge_transformed_data, \
+        drop_unuseful_rows, \
+        split_data, \
+        imputation_stategy, \
+        model_evaluation, \
+        drop_trained_data
+    from base.object_store import \
+        training_sets_table, \
+        bulk_server, \
+        feature_table, \
+        training_feature_table, \
+        model_feature_table, \
+        training_model_feature_table, \
+        training_status_table
+
     # Lock the thread
     lock.acquire(timeout=1200)
 
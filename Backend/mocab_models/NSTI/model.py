@@ -1,5 +1,7 @@
 import joblib
 
+from base.object_store import model_registry
+
 
 def predict(data: list, base_path, model_type="register"):
     """
@@ -17,12 +19,23 @@ def predict(data: list, base_path, model_type="register"):
     x = list()
     temp = data
     # Fixme: 路徑問題，待解決
-    loaded_model = joblib.load(f"{base_path}/{model_type}_model")
+    loaded_model = model_registry.load(f"{base_path}/{model_type}_model", joblib.load)
     x.append(temp)
     result = loaded_model.predict_proba(x)
     return result[:, 1][0]
 
 
+def predict_batch(data, base_path, model_type="register") -> list:
+    """
+    Batch variant of predict. Every row of data is scored with a single predict_proba call.
+    :param data: list of rows, each row is in the same format as the data of predict
+    :return: list of float, Model Scores in the same order as data
+    """
+    loaded_model = model_registry.load(f"{base_path}/{model_type}_model", joblib.load)
+    result = loaded_model.predict_proba(data)
+    return result[:, 1].tolist()
+
+
 if __name__ == "__main__":
     patient_data = [1, 12900, 162.2, 86.6, 0]
     print(predict(patient_data))
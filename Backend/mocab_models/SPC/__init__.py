@@ -1,4 +1,5 @@
 from .model import encode
 from .model import train
 from .model import get_model
-from .model import predict
\ No newline at end of file
+from .model import predict
+from .model import predict_batch
@@ -3,9 +3,9 @@ import pandas as pd
 import tensorflow as tf
 
 from joblib import dump, load
-from sklearn.preprocessing import OneHotEncoder
-from keras import metrics
-from tensorflow.keras.optimizers.legacy import Adam
+
+from base.object_store import model_registry
+from base.one_hot_encoder import CompiledOneHotEncoder
 
 
 def config(base_path):
@@ -17,28 +17,34 @@ def config(base_path):
     return config
 
 
+def load_encoder(path):
+    return CompiledOneHotEncoder(load(path))
+
+
 def encode(x, y, base_path):
     """
     Function encode will transform data into model preferred category
+    The encoder is loaded once and compiled into lookup dictionaries, see base/one_hot_encoder.py
     """
     try:
-        enc = load(f'{base_path}/encoder.joblib')
+        enc = model_registry.load(f'{base_path}/encoder.joblib', load_encoder)
     except FileNotFoundError:
         raise FileNotFoundError("Encoder not found")
 
-    column_enc = list(enc.feature_names_in_)
     if type(x) == list:
-        df = pd.DataFrame(columns=column_enc)
-        df.loc[0] = x
+        rows = [x]
     else:
-        df = x
-    x_enc = enc.transform(df.astype(str))
-    x_enc = pd.DataFrame(x_enc.toarray(), columns=enc.get_feature_names_out())
+        rows = x[enc.feature_names_in].astype(str).to_numpy()
+    x_enc = pd.DataFrame(enc.transform(rows), columns=enc.feature_names_out)
 
     return x_enc, y
 
 
 def train(x_train, y_train, base_path):
+    # Only needed while training, so serving does not import them.
+    from keras import metrics
+    from tensorflow.keras.optimizers.legacy import Adam
+
     conf = config(base_path)
     METRICS = [
         metrics.Precision(thresholds=conf['set_thres']),
@@ -61,14 +67,23 @@ def train(x_train, y_train, base_path):
 
 def get_model(model_type, base_path):
     if model_type == 'register':
-        return tf.keras.models.load_model(f"{base_path}/register_model")
+        return model_registry.load(f"{base_path}/register_model", tf.keras.models.load_model)
     elif model_type == 'new':
-        return tf.keras.models.load_model(f"{base_path}/new_model")
+        return model_registry.load(f"{base_path}/new_model", tf.keras.models.load_model)
     else:
         return None
 
 
 def predict(data, base_path, model_type="register"):
-    model = tf.keras.models.load_model(f"{base_path}/{model_type}_model")
+    model = model_registry.load(f"{base_path}/{model_type}_model", tf.keras.models.load_model)
     result = model.predict(data, verbose=0)
     return float(result[0][0])
+
+
+def predict_batch(data, base_path, model_type="register") -> list:
+    """
+    Batch variant of predict, data is the encoded DataFrame of every patient. Runs a single forward pass.
+    """
+    model = model_registry.load(f"{base_path}/{model_type}_model", tf.keras.models.load_model)
+    result = model.predict(data, verbose=0)
+    return [float(score) for score in result[:, 0]]
@@ -1 +1 @@
-__all__ = ['SPC', 'pima_diabetes', 'template', 'qCSI', 'NSTI']
+# Model plugins are discovered and imported lazily by base/model_plugin_registry.py
@@ -1 +1,2 @@
 from .model import predict
+from .model import predict_batch
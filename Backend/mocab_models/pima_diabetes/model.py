@@ -1,5 +1,7 @@
 import joblib
 
+from base.object_store import model_registry
+
 
 def predict(data: list, base_path, model_type="register"):
     # @data comes from two places, one is from diabetes_predict(), the other is from flask(not sure where yet).
@@ -11,9 +13,20 @@ def predict(data: list, base_path, model_type="register"):
     # controlled variable: glucose, diastolic blood pressure, insulin, height, weight, age
 
     temp = data
-    loaded_model = joblib.load(f"{base_path}/{model_type}_model")
+    loaded_model = model_registry.load(f"{base_path}/{model_type}_model", joblib.load)
     x.append(temp)
     result = loaded_model.predict_proba(x)
     # result = [no's probability, yes's probability]
     # return negative's probability
     return result[:, 1][0]
+
+
+def predict_batch(data, base_path, model_type="register") -> list:
+    """
+    Batch variant of predict. Every row of data is scored with a single predict_proba call.
+    :param data: list of rows, each row is in the same format as the data of predict
+    :return: list of float, Model Scores in the same order as data
+    """
+    loaded_model = model_registry.load(f"{base_path}/{model_type}_model", joblib.load)
+    result = loaded_model.predict_proba(data)
+    return result[:, 1].tolist()
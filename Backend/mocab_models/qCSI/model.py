@@ -39,6 +39,13 @@ def predict(data: list, base_path, model_type="register") -> int:
     return sum(data)
 
 
+def predict_batch(data: list, base_path, model_type="register") -> list:
+    """
+    Batch variant of predict. qCSI is a rule based score, so every row is simply calculated on its own.
+    """
+    return [predict(row, base_path, model_type) for row in data]
+
+
 def unit_conversion(treatment_mining_result: Dict) -> int or float:
     """
     treatment_mining_result: Dict, {'mask_name': , 'mask_type', 'value'}
@@ -9,3 +9,11 @@ def predict(data: list):
     x.append(temp)
     result = loaded_model.predict_proba(x)
     return result[:, 1][0]
+
+
+def predict_batch(data: list) -> list:
+    # Optional. Score many rows at once, used by the <base>/<model name>/batch endpoint.
+    model_path = "YOUR_MODEL_PATH_HERE"
+    loaded_model = joblib.load(model_path)
+    result = loaded_model.predict_proba(data)
+    return result[:, 1].tolist()
@@ -1,15 +1,27 @@
+from __future__ import annotations
+
+import secrets
+import threading
+from collections import OrderedDict
+
 from fhirclient.client import FHIRClient
-from flask import request, redirect, abort, jsonify
+from flask import request, redirect, abort, jsonify, session
 from flask import Blueprint
 from base import patient_data_search as ds
+from base.object_store import async_runner
 from base.object_store import feature_table
 from base.object_store import fhir_class_obj
 from config import configObject as conf
 
-smart_clientObj: FHIRClient
 smart_app = Blueprint('smart_on_fhir', __name__)
 table = feature_table
 
+# The SMART client of every browser session, keyed by the id kept in its flask.session. The tokens stay on the server.
+SMART_SESSION_KEY = "smart_session_id"
+MAX_SMART_SESSIONS = 1024
+_smart_clients = OrderedDict()
+_smart_clients_lock = threading.Lock()
+
 
 @smart_app.route("/<api>", methods=['GET'])
 def smart_api_with_id(api):
@@ -20,49 +32,73 @@ def smart_api_with_id(api):
     # if not check_auth():
     #     abort(401, description="SMART Auth is not enabled. Launch MoCab SMART Endpoint in EHR First.")
 
-    patient_data_dict = ds.smart_model_feature_search_with_patient_id(
-        patient_id, table.get_model_feature_dict(api))
-
+    patient_data_dict = async_runner.run(_smart_search(api, patient_id, smart_server(session_client())))
     return jsonify(patient_data_dict)
 
 
+async def _smart_search(api, patient_id, server: dict) -> dict:
+    # The searches of the request are sent to the FHIR server of the SMART launch.
+    with fhir_class_obj.request_context(**server, patient_id=patient_id):
+        return await ds.async_smart_model_feature_search_with_patient_id(
+            patient_id, table.get_model_feature_dict(api), plans=table.get_extraction_plans(api))
+
+
 @smart_app.route("/launch", methods=['GET'])
 def smart_launch():
     # TODO: Change redirect_uri
-    global smart_clientObj
     settings = {
         'app_id': 'mocab_app',
         'api_base': request.values.get("iss"),
         'redirect_uri': f"{conf.get('base_urls').get('BACKEND_URL')}{conf.get('base_urls').get('smart_prefix')}/fhir-app",
         'scope': " ".join(["patient/*.read", "launch"])
     }
-    smart_clientObj = FHIRClient(settings=settings)
+    smart_client = FHIRClient(settings=settings)
+    if SMART_SESSION_KEY not in session:
+        session[SMART_SESSION_KEY] = secrets.token_urlsafe(32)
+    with _smart_clients_lock:
+        _smart_clients[session[SMART_SESSION_KEY]] = smart_client
+        _smart_clients.move_to_end(session[SMART_SESSION_KEY])
+        while len(_smart_clients) > MAX_SMART_SESSIONS:
+            _smart_clients.popitem(last=False)
 
-    return redirect(smart_clientObj.authorize_url)
+    return redirect(smart_client.authorize_url)
 
 
 @smart_app.route("/fhir-app", methods=["GET"])
 def callback():
-    global smart_clientObj
+    smart_client = session_client()
     try:
-        smart_clientObj.handle_callback(request.url)
+        smart_client.handle_callback(request.url)
     except Exception as e:
         return f"""<h1>Authorization Error</h1><p>{e}</p><p><a href="/">Start over</a></p>"""
-    if check_auth():
-        fhir_class_obj.update_client(url=smart_clientObj.server.base_uri,
-                                     authorization=f"bearer {smart_clientObj.server.auth.access_token}")
-        print(smart_clientObj.__dict__)
-        print(smart_clientObj.server.__dict__)
-        print(smart_clientObj.server.auth.__dict__)
+    if check_auth(smart_client):
+        print(smart_client.__dict__)
+        print(smart_client.server.__dict__)
+        print(smart_client.server.auth.__dict__)
         return redirect(f"{conf.get('base_urls').get('FRONTEND_URL')}")
     return "Not Authorized"
 
 
-def check_auth():
-    global smart_clientObj
+def session_client() -> FHIRClient | None:
+    """
+    :return: the SMART client launched by the browser session of the request, None before it is launched
+    """
+    with _smart_clients_lock:
+        return _smart_clients.get(session.get(SMART_SESSION_KEY))
+
+
+def smart_server(smart_client: FHIRClient | None) -> dict:
+    """
+    The FHIR server and authorization of the SMART launch, nothing (the default FHIR server) before it is authorized.
+    """
+    if not check_auth(smart_client):
+        return {}
+    return {"url": smart_client.server.base_uri,
+            "authorization": f"bearer {smart_client.server.auth.access_token}"}
+
+
+def check_auth(smart_client: FHIRClient | None) -> bool:
     try:
-        return smart_clientObj.ready
+        return smart_client.ready
     except AttributeError:
         return False
-    except NameError:
-        return False
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture
+def feature():
+    """
+    :return: a function that makes the feature table of one feature, a latest observation unless told otherwise,
+             e.g. feature("http://loinc.org|2345-7") or feature(None, "patient", value_route=["gender"])
+    """
+    def make_feature(code, type_of_data="observation", default_value=None, value_route=None, data_alive_time=None,
+                     search_type="latest"):
+        return {"code": code, "type_of_data": type_of_data, "data_alive_time": data_alive_time,
+                "default_value": default_value, "value_route": value_route, "datetime_route": None,
+                "search_type": search_type}
+    return make_feature
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime
+
+from fhirpy import AsyncFHIRClient
+from fhirpy import SyncFHIRClient
+
+import cds_hooks
+from base import async_search
+from base import fetch_planner
+from base.cds_hooks_work.service import Service
+from base.code_search_forms import _CodeSearchForms
+from base.fhir_search_obj import FhirSearchContext
+from base.search_cache import _SearchCache
+
+
+def _bundle(*resources):
+    return {"resourceType": "Bundle", "entry": [{"resource": resource} for resource in resources]}
+
+
+class FakeAsyncClient(AsyncFHIRClient):
+    def __init__(self, expected_requests):
+        super().__init__("http://fhir")
+        self.requests = []
+        self._expected_requests = expected_requests
+        self._all_sent = asyncio.Event()
+
+    async def _fetch_resource(self, path, params=None):
+        self.requests.append((path, dict(params)))
+        if len(self.requests) == self._expected_requests:
+            self._all_sent.set()
+        # Every request waits for the others, so this only returns if they are in flight at the same time.
+        await asyncio.wait_for(self._all_sent.wait(), timeout=5)
+
+        if path == "Patient":
+            return _bundle({"resourceType": "Patient", "id": "p1", "gender": "female"})
+        if path == "Condition":
+            return _bundle()
+        if "component-code" in params:
+            return _bundle({"resourceType": "Observation", "id": "bp", "effectiveDateTime": "2021-01-01",
+                            "code": {"coding": [{"code": "85354-9"}]},
+                            "component": [{"code": {"coding": [{"code": "8462-4"}]}}]})
+        return _bundle({"resourceType": "Observation", "id": "glu", "effectiveDateTime": "2021-02-01",
+                        "code": {"coding": [{"code": "2345-7"}]}})
+
+
+def test_async_searches_are_in_flight_together(monkeypatch, feature):
+    monkeypatch.setattr(async_search, "search_cache", _SearchCache(enabled=False))
+    monkeypatch.setattr(fetch_planner, "code_search_forms", _CodeSearchForms())
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "PARALLEL_COMPONENT_SEARCH", True)
+    table = {
+        "glucose": feature("2345-7"),
+        "diastolic": feature("8462-4"),
+        "hypertension": feature("38341003", "condition"),
+        "gender": feature(None, "patient"),
+    }
+
+    # The code search of the Observations, Condition and Patient. Component-code follows once code has missed.
+    async_client = FakeAsyncClient(expected_requests=3)
+    context = FhirSearchContext(SyncFHIRClient("http://fhir"), async_client)
+    data = asyncio.run(async_search.search_data_sets(context, "p1", table, datetime(2023, 1, 1)))
+
+    assert list(data) == list(table)
+    assert [resource["id"] for resource in data["glucose"]["resource"]] == ["glu"]
+    assert [resource["id"] for resource in data["diastolic"]["resource"]] == ["bp"]
+    assert data["hypertension"] == {"resource": [None], "type": "Condition"}
+    assert data["gender"]["resource"][0].gender == "female"
+    # The resources are read by the strategies of base/search_sets.py, like the ones of the sync path.
+    assert type(data["glucose"]["resource"][0]).__name__ == "SyncFHIRResource"
+
+
+def test_service_awaits_async_handler():
+    async def handler(request, response):
+        await asyncio.sleep(0)
+        response.httpStatusCode = 201
+
+    service = Service("patient-view", "id", "description", handler=handler)
+    response = asyncio.run(service.handle_input({"hook": "patient-view", "hookInstance": "1",
+                                                 "context": {"userId": "Practitioner/1", "patientId": "p1"}}))
+    assert response.httpStatusCode == 201
+
+
+def test_models_are_evaluated_together_in_order(monkeypatch):
+    started = []
+    all_started = asyncio.Event()
+
+    async def feature_search(patient_id, table, prefetch=None, plans=None, context=None, resolver=None):
+        started.append(table)
+        if len(started) == 3:
+            all_started.set()
+        # Every model waits for the others, so this only returns if their pipelines run at the same time.
+        await asyncio.wait_for(all_started.wait(), timeout=5)
+        if table == "broken":
+            raise KeyError("broken")
+        # The first model finishes last, its card is still the first one.
+        await asyncio.sleep(0.05 if table == "first" else 0)
+        return {}
+
+    monkeypatch.setattr(cds_hooks, "async_model_feature_search_with_patient_id", feature_search)
+    monkeypatch.setattr(cds_hooks.feature_table, "get_model_feature_dict", lambda model_name: model_name)
+    monkeypatch.setattr(cds_hooks.feature_table, "get_extraction_plans", lambda model_name: None)
+    monkeypatch.setattr(cds_hooks, "return_model_result", lambda data, model_name: 0)
+    monkeypatch.setattr(cds_hooks, "generate_cds_card", lambda patient_id, data, model_name: model_name)
+
+    async def evaluate(model_names):
+        semaphore = asyncio.Semaphore(len(model_names))
+        return await asyncio.gather(*[cds_hooks.evaluate_model("p1", model_name, None, None, semaphore)
+                                      for model_name in model_names])
+
+    assert asyncio.run(evaluate(["first", "broken", "last"])) == ["first", None, "last"]
@@ -0,0 +1,32 @@
+import asyncio
+
+from fhirpy.base.exceptions import ResourceNotFound
+
+import app
+
+
+def test_batch_searches_the_patients_concurrently_and_keeps_the_errors(monkeypatch):
+    searching = []
+
+    async def search(patient_id, table, data_alive_time=None, plans=None, context=None):
+        searching.append(patient_id)
+        # Every patient waits for the others, so a sequential search would never finish.
+        while len(searching) < 3:
+            await asyncio.sleep(0.01)
+        if patient_id == "unknown":
+            raise ResourceNotFound("Patient/unknown is not found")
+        assert context.patient_id == patient_id
+        return {"age": {"date": None, "value": len(patient_id)}}
+
+    monkeypatch.setattr(app.ds, "async_model_feature_search_with_patient_id", search)
+    monkeypatch.setattr(app.table, "get_model_feature_dict", lambda model_name: {})
+    monkeypatch.setattr(app.table, "get_extraction_plans", lambda model_name: {})
+    monkeypatch.setattr(app, "return_model_results",
+                        lambda patient_data_dicts, model_name: [row["age"]["value"] for row in patient_data_dicts])
+
+    response = app.mocab_app.test_client().post("/qCSI/batch", json={"ids": ["p1", "unknown", "p333"]})
+
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [(row["id"], row.get("predict_value")) for row in results] == [("p1", 2), ("unknown", None), ("p333", 4)]
+    assert "not found" in results[1]["error"]
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from base.card_cache import _CardCache
+
+
+def test_cards_are_served_until_max_age():
+    cache = _CardCache(max_age_seconds=0.05, enabled=True)
+    cache.put("http://ehr", "Bearer a", "p1", "e1", "qCSI", "card")
+    cache.put("http://ehr", "Bearer a", "p1", "e1", "SPC", None)
+
+    cards = cache.get_cards("http://ehr", "Bearer a", "p1", "e1", ["qCSI", "SPC"])
+    assert [(model_name, card) for model_name, card, age in cards] == [("qCSI", "card"), ("SPC", None)]
+    # Every model of the patient needs a card, the server and patient are part of the key.
+    assert cache.get_cards("http://ehr", "Bearer a", "p1", "e1", ["qCSI", "pima_diabetes"]) is None
+    assert cache.get_cards("http://other", "Bearer a", "p1", "e1", ["qCSI"]) is None
+
+    time.sleep(0.1)
+    assert cache.get_cards("http://ehr", "Bearer a", "p1", "e1", ["qCSI", "SPC"]) is None
+
+
+def test_cards_are_scoped_by_authorization_and_encounter():
+    cache = _CardCache(enabled=True)
+    cache.put("http://ehr", "Bearer a", "p1", "e1", "qCSI", "card")
+
+    assert cache.get_cards("http://ehr", "Bearer a", "p1", "e1", ["qCSI"]) is not None
+    # Another clinician's token, a hook without a token, or another encounter of the patient is a miss.
+    assert cache.get_cards("http://ehr", "Bearer b", "p1", "e1", ["qCSI"]) is None
+    assert cache.get_cards("http://ehr", None, "p1", "e1", ["qCSI"]) is None
+    assert cache.get_cards("http://ehr", "Bearer a", "p1", "e2", ["qCSI"]) is None
+
+
+def test_disabled_cache_serves_nothing():
+    cache = _CardCache(enabled=False)
+    cache.put("http://ehr", None, "p1", "", "qCSI", "card")
+    assert cache.get_cards("http://ehr", None, "p1", "", ["qCSI"]) is None
+
+
+def test_one_refresh_per_patient_at_a_time():
+    cache = _CardCache(enabled=True)
+    release = threading.Event()
+    refreshed = threading.Event()
+
+    def recompute():
+        release.wait(timeout=5)
+        cache.put("http://ehr", "Bearer a", "p1", "e1", "qCSI", "new card")
+        refreshed.set()
+
+    assert cache.refresh("http://ehr", "Bearer a", "p1", "e1", recompute)
+    assert not cache.refresh("http://ehr", "Bearer a", "p1", "e1", recompute)
+    release.set()
+    assert refreshed.wait(timeout=5)
+    assert cache.get_cards("http://ehr", "Bearer a", "p1", "e1", ["qCSI"])[0][1] == "new card"
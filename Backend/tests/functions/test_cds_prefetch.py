@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from fhirpy import SyncFHIRClient
+
+from base.cds_hooks_work.service import Service
+from base.cds_prefetch import Prefetch
+from base.cds_prefetch import prefetch_templates
+
+
+class FakeFeatureTable:
+    def __init__(self, table):
+        self.table = table
+
+    def get_model_feature_dict(self, model_name):
+        return self.table[model_name]
+
+    def get_exist_model_name(self) -> list:
+        return list(self.table)
+
+
+def _searchset(*resources, next_url=None):
+    bundle = {"resourceType": "Bundle", "type": "searchset", "entry": [{"resource": r} for r in resources]}
+    if next_url is not None:
+        bundle["link"] = [{"relation": "next", "url": next_url}]
+    return bundle
+
+
+def test_templates_merge_codes_of_every_model(feature):
+    table = FakeFeatureTable({
+        "A": {"glucose": feature("2345-7"), "sbp": feature("8480-6,8462-4"), "dm": feature("E11", "condition")},
+        "B": {"glucose": feature("2345-7"), "gender": feature(None, "patient")},
+    })
+
+    templates = prefetch_templates(table)
+    assert templates["patient"] == "Patient/{{context.patientId}}"
+    assert templates["observations"] == "Observation?subject={{context.patientId}}&code=2345-7,8480-6,8462-4"
+    assert templates["observationComponents"] == \
+        "Observation?subject={{context.patientId}}&component-code=2345-7,8480-6,8462-4"
+    assert templates["conditions"] == "Condition?subject={{context.patientId}}&code=E11"
+    assert "procedures" not in templates
+
+    service = Service("patient-view", "id", "description", prefetch=lambda: prefetch_templates(table))
+    assert service.to_dict()["prefetch"] == templates
+
+
+def test_answer_covered_features_from_prefetch(feature):
+    client = SyncFHIRClient("http://fhir")
+    observation = {"resourceType": "Observation", "id": "o1", "effectiveDateTime": "2022-12-01",
+                   "code": {"coding": [{"code": "2345-7"}]}}
+    prefetch = Prefetch(client, {
+        "patient": {"resourceType": "Patient", "id": "p1", "gender": "female"},
+        "observations": _searchset(observation),
+        "observationComponents": _searchset(observation),
+        "conditions": None,
+        "procedures": _searchset(next_url="http://fhir/Procedure?page=2"),
+    })
+    table = {"glucose": feature("2345-7"), "gender": feature(None, "patient"),
+             "dm": feature("E11", "condition"), "op": feature("0001", "procedure")}
+
+    data = prefetch.feature_data_sets("p1", table, datetime(2023, 1, 1))
+    # A missing condition result and a paged procedure result are left to the FHIR server.
+    assert set(data) == {"glucose", "gender"}
+    assert [resource["id"] for resource in data["glucose"]["resource"]] == ["o1"]
+    assert data["gender"]["resource"][0]["gender"] == "female"
+    assert prefetch.patient["id"] == "p1"
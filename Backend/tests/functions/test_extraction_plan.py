@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pytest
+
+from base.search_sets import ExtractionPlan
+from base.search_sets import get_datetime_value_with_func
+from base.search_sets import get_resource_datetime
+from base.search_sets import get_resource_value
+
+
+def test_plan_extracts_like_the_strategies(feature):
+    resources = [
+        {"resourceType": "Observation", "effectiveDateTime": "2021-05-01T08:30:00",
+         "component": [{"code": {"coding": [{"code": "8462-4"}]}, "valueQuantity": {"value": 80}}]},
+        {"resourceType": "Observation", "effectivePeriod": {"start": "2020-01-01"},
+         "component": [{"code": {"coding": [{"code": "8462-4"}]}, "valueQuantity": {"value": 90}}]},
+        85,
+    ]
+    table = feature("8462-4", value_route=["blood_pressure_diastolic"], search_type="max")
+    plan = ExtractionPlan(table)
+
+    extracted = plan.extract(resources, datetime(2023, 1, 1))
+    expected = {"date": [], "value": []}
+    for resource in resources:
+        data = {"resource": resource, "type": "Observation"}
+        expected["date"].append(get_resource_datetime(data, table, datetime(2023, 1, 1)))
+        expected["value"].append(get_resource_value(data, table))
+
+    assert extracted == expected == {"date": ["2021-05-01T00:00", "2020-01-01T00:00", None], "value": [80, 90, 85]}
+    assert plan.aggregate(extracted) == get_datetime_value_with_func(extracted, table) == \
+        {"date": "2020-01-01T00:00", "value": 90}
+
+
+def test_plan_defaults_and_unsupported_search_type(feature):
+    assert ExtractionPlan(feature("8462-4", "condition", search_type="")).extract([None], datetime(2023, 1, 1)) == \
+        {"date": [None], "value": [False]}
+
+    with pytest.raises(AttributeError, match="'median' search_type is not supported now"):
+        ExtractionPlan(feature("8462-4", search_type="median")).aggregate({"date": [], "value": []})
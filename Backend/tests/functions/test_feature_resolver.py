@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime
+
+from base import feature_resolver
+from base.feature_resolver import FeatureResolver
+from base.feature_resolver import feature_fetch_key
+from base.lib import TimeObject
+
+
+def test_feature_fetch_key(feature):
+    default_time = datetime(2023, 1, 1)
+    assert feature_fetch_key(feature("a,b"), default_time) == feature_fetch_key(feature("b, a"), default_time)
+    assert feature_fetch_key(feature("a"), default_time) != feature_fetch_key(
+        feature("a", data_alive_time=TimeObject("0001-00-00T00:00:00")), default_time)
+    assert feature_fetch_key(feature(None, "patient", value_route=["age"]), default_time) != feature_fetch_key(
+        feature(None, "patient", value_route=["gender"]), default_time)
+
+
+def test_shared_features_are_fetched_once(monkeypatch, feature):
+    retrievals = []
+
+    async def retrieve(patient_id, table, default_time, context=None):
+        retrievals.append(sorted(table))
+        await asyncio.sleep(0)
+        return {key: {"resource": [key], "type": table[key]["type_of_data"]} for key in table}
+
+    monkeypatch.setattr(feature_resolver, "async_retrieve_data_sets", retrieve)
+    diabetes = {"glucose": feature("2345-7"), "age": feature(None, "patient", value_route=["age"])}
+    sepsis = {"Age": feature(None, "patient", value_route=["age"]), "wbc": feature("6690-2"),
+              "blood sugar": feature("2345-7")}
+
+    async def resolve():
+        resolver = FeatureResolver("p1", datetime(2023, 1, 1))
+        return await asyncio.gather(resolver.data_sets(diabetes), resolver.data_sets(sepsis))
+
+    diabetes_data, sepsis_data = asyncio.run(resolve())
+
+    # The second model only fetches the feature that the first one does not have, and waits for the rest.
+    assert retrievals == [["age", "glucose"], ["wbc"]]
+    assert diabetes_data == {"glucose": {"resource": ["glucose"], "type": "observation"},
+                             "age": {"resource": ["age"], "type": "patient"}}
+    assert sepsis_data == {"Age": {"resource": ["age"], "type": "patient"},
+                           "wbc": {"resource": ["wbc"], "type": "observation"},
+                           "blood sugar": {"resource": ["glucose"], "type": "observation"}}
+
+
+def test_features_with_another_search_type_are_fetched_apart(monkeypatch, feature):
+    retrievals = []
+
+    async def retrieve(patient_id, table, default_time, context=None):
+        retrievals.append({key: table[key]["search_type"] for key in table})
+        return {key: {"resource": [table[key]["search_type"]], "type": "observation"} for key in table}
+
+    monkeypatch.setattr(feature_resolver, "async_retrieve_data_sets", retrieve)
+    latest_glucose = feature("2345-7")
+    max_glucose = feature("2345-7", search_type="max")
+
+    async def resolve():
+        resolver = FeatureResolver("p1", datetime(2023, 1, 1))
+        return await asyncio.gather(resolver.data_sets({"glucose": latest_glucose}),
+                                    resolver.data_sets({"glucose": max_glucose}))
+
+    latest_data, max_data = asyncio.run(resolve())
+    # The latest search reads the newest resource only, so the max model gets a search of every page of its own.
+    assert retrievals == [{"glucose": "latest"}, {"glucose": "max"}]
+    assert latest_data["glucose"]["resource"] == ["latest"]
+    assert max_data["glucose"]["resource"] == ["max"]
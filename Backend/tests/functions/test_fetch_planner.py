@@ -0,0 +1,200 @@
+from datetime import datetime
+
+import pytest
+
+from base import fetch_planner
+from base import search_sets
+from base.code_search_forms import _CodeSearchForms
+from base.fetch_planner import FeatureSearchGroup
+from base.fhir_search_obj import FhirSearchContext
+from base.fetch_planner import demultiplex_resources
+from base.fetch_planner import fetch_feature_search_group
+from base.fetch_planner import plan_feature_searches
+from base.search_sets import get_search_pushdown
+from base.search_sets import is_existence_only
+from base.table.feature_table import _FeatureTable
+
+
+class FakeClient:
+    url = "http://fhir"
+    authorization = None
+
+
+def _observation(code, component_code=None):
+    resource = {"resourceType": "Observation", "code": {"coding": [{"system": "http://loinc.org", "code": code}]}}
+    if component_code is not None:
+        resource["component"] = [{"code": {"coding": [{"system": "http://loinc.org", "code": component_code}]}}]
+    return resource
+
+
+def test_plan_groups_by_resource_type(feature):
+    table = {
+        "glucose": feature("http://loinc.org|2345-7"),
+        "hypertension": feature("http://snomed.info/sct|38341003", "condition"),
+        "insulin": feature("http://loinc.org|14749-6,http://loinc.org|20448-7"),
+        "age": feature(None, "patient"),
+    }
+    groups, single_features = plan_feature_searches(table, datetime(2023, 1, 1))
+
+    assert single_features == ["age"]
+    assert [(group.resource_type, list(group.tables)) for group in groups] == [
+        ("Observation", ["glucose", "insulin"]), ("Condition", ["hypertension"])]
+    assert groups[0].codes == ["http://loinc.org|2345-7", "http://loinc.org|14749-6", "http://loinc.org|20448-7"]
+
+
+def test_latest_features_are_grouped_apart(monkeypatch, feature):
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "SEARCH_PUSHDOWN", True)
+    tables = {"glucose": feature("2345-7"), "hba1c": feature("4548-4", search_type="all"),
+              "height": feature("8302-2"), "weight": feature("29463-7", search_type="max")}
+
+    groups, _ = plan_feature_searches(tables, datetime(2023, 1, 1))
+    assert [list(group.tables) for group in groups] == [["glucose", "height"], ["hba1c", "weight"]]
+
+
+def test_demultiplex_by_coding(feature):
+    tables = {"glucose": feature("http://loinc.org|2345-7"), "insulin": feature("14749-6,20448-7")}
+    resources = [_observation("20448-7"), _observation("2345-7"), _observation("14749-6")]
+
+    matched = demultiplex_resources(resources, tables)
+    assert matched["glucose"] == [resources[1]]
+    assert matched["insulin"] == [resources[0], resources[2]]
+
+
+BLOOD_PRESSURE = _observation("85354-9", component_code="8462-4")
+
+
+@pytest.fixture
+def observation_table(feature):
+    return {
+        "glucose": feature("http://loinc.org|2345-7"),
+        "diastolic_blood_pressure": feature("http://loinc.org|8462-4"),
+        "spo2": feature("http://loinc.org|59408-5", default_value=98),
+    }
+
+
+def _fake_search(searches):
+    def fake_search(client, resource_type, params, sort=None, mode="fetch"):
+        code_param = "code" if "code" in params else "component_code"
+        codes = params[code_param].split(",")
+        searches.append((code_param, codes, params.get("_count")))
+        if code_param == "code":
+            return [_observation("2345-7")] if "http://loinc.org|2345-7" in codes else []
+        return [BLOOD_PRESSURE] if "http://loinc.org|8462-4" in codes else []
+    return fake_search
+
+
+def test_fetch_group_with_component_fallback(monkeypatch, observation_table):
+    searches = []
+    monkeypatch.setattr(fetch_planner, "search_resources", _fake_search(searches))
+    monkeypatch.setattr(fetch_planner, "code_search_forms", _CodeSearchForms())
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "PARALLEL_COMPONENT_SEARCH", False)
+
+    groups, _ = plan_feature_searches(observation_table, datetime(2023, 1, 1))
+    data_sets = fetch_feature_search_group("test", groups[0], FhirSearchContext(FakeClient()))
+
+    # The first page of the group, then the features that are not on it on their own, then by component-code.
+    assert searches == [
+        ("code", ["http://loinc.org|2345-7", "http://loinc.org|8462-4", "http://loinc.org|59408-5"], None),
+        ("code", ["http://loinc.org|8462-4"], 1),
+        ("code", ["http://loinc.org|59408-5"], 1),
+        ("component_code", ["http://loinc.org|8462-4", "http://loinc.org|59408-5"], None),
+        ("component_code", ["http://loinc.org|59408-5"], 1)]
+    assert data_sets["diastolic_blood_pressure"] == {"resource": [BLOOD_PRESSURE], "type": "Observation"}
+    assert data_sets["spo2"] == {"resource": [98], "type": "Observation"}
+
+
+def test_fetch_group_remembers_component_code(monkeypatch, observation_table):
+    searches = []
+    monkeypatch.setattr(fetch_planner, "search_resources", _fake_search(searches))
+    monkeypatch.setattr(fetch_planner, "code_search_forms", _CodeSearchForms())
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "PARALLEL_COMPONENT_SEARCH", True)
+
+    groups, _ = plan_feature_searches(observation_table, datetime(2023, 1, 1))
+    first = fetch_feature_search_group("test", groups[0], FhirSearchContext(FakeClient()))
+    # The forms are unknown, component-code is only searched for the features that code has missed.
+    assert searches[0] == (
+        "code", ["http://loinc.org|2345-7", "http://loinc.org|8462-4", "http://loinc.org|59408-5"], None)
+    assert [codes for code_param, codes, _ in searches if code_param == "component_code"] == \
+        [["http://loinc.org|8462-4", "http://loinc.org|59408-5"], ["http://loinc.org|59408-5"]]
+
+    searches.clear()
+    second = fetch_feature_search_group("test", groups[0], FhirSearchContext(FakeClient()))
+    # Blood pressure goes straight to component-code, glucose to code, spo2 is still unknown.
+    assert searches == [
+        ("code", ["http://loinc.org|2345-7", "http://loinc.org|59408-5"], None),
+        ("component_code", ["http://loinc.org|8462-4"], 1),
+        ("code", ["http://loinc.org|59408-5"], 1),
+        ("component_code", ["http://loinc.org|59408-5"], 1)]
+    assert first == second
+    assert second["diastolic_blood_pressure"]["resource"] == [BLOOD_PRESSURE]
+
+
+def test_search_pushdown_by_search_type(feature):
+    latest = feature("http://loinc.org|8462-4", value_route=["blood_pressure_diastolic"])
+    params, mode = get_search_pushdown([latest], "Observation")
+    assert mode == "fetch" and params["_count"] == 1
+    assert params["_elements"] == "code,component,effectiveDateTime,effectivePeriod"
+
+    maximum = feature("http://loinc.org|2345-7", search_type="max")
+    params, mode = get_search_pushdown([latest, maximum], "Observation")
+    assert mode == "fetch_all" and "_count" not in params
+    assert params["_elements"] == "code,component,effectiveDateTime,effectivePeriod,valueQuantity"
+
+
+def test_latest_group_reads_one_page_then_searches_the_missing_features(monkeypatch, feature):
+    searches = []
+
+    def fake_search(client, resource_type, params, sort=None, mode="fetch"):
+        searches.append((params["code"], params.get("_count"), mode))
+        # The patient has no resource of the placeholder code "0".
+        return [_observation(code.split("|")[-1]) for code in params["code"].split(",") if code != "0"]
+
+    monkeypatch.setattr(fetch_planner, "search_resources", fake_search)
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "SEARCH_PUSHDOWN", True)
+    tables = {"glucose": feature("http://loinc.org|2345-7"), "height": feature("http://loinc.org|3137-7"),
+              "pregnancies": feature("0", default_value=6)}
+
+    data_sets = fetch_feature_search_group("test", FeatureSearchGroup("Procedure", None, tables),
+                                           FhirSearchContext(FakeClient()))
+    assert searches == [("http://loinc.org|2345-7,http://loinc.org|3137-7,0", None, "fetch"), ("0", 1, "fetch")]
+    assert data_sets["pregnancies"]["resource"] == [6]
+
+    # max, min and all need every resource, so their group reads every page.
+    searches.clear()
+    tables = {"glucose": feature("http://loinc.org|2345-7", search_type="max"),
+              "height": feature("http://loinc.org|3137-7", search_type="max")}
+    fetch_feature_search_group("test", FeatureSearchGroup("Procedure", None, tables), FhirSearchContext(FakeClient()))
+    assert searches == [("http://loinc.org|2345-7,http://loinc.org|3137-7", None, "fetch_all")]
+
+
+def test_existence_only_features_are_counted(monkeypatch, feature):
+    counted = []
+
+    def fake_search_resources(client, resource_type, params, sort=None, mode="fetch"):
+        counted.append((resource_type, params["_summary"], mode))
+        return 2 if params["code"] == "http://snomed.info/sct|38341003" else 0
+
+    monkeypatch.setattr(search_sets, "search_resources", fake_search_resources)
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "EXISTENCE_ONLY_SEARCH", True)
+    hypertension = feature("http://snomed.info/sct|38341003", "condition")
+    diabetes = feature("http://snomed.info/sct|44054006", "condition")
+
+    groups, single_features = plan_feature_searches({"hypertension": hypertension, "diabetes": diabetes},
+                                                    datetime(2023, 1, 1))
+    assert groups == [] and single_features == ["hypertension", "diabetes"]
+
+    condition = search_sets.Condition
+    context = FhirSearchContext(client=None)
+    found = condition.search(condition, "test", hypertension, context=context)
+    assert counted == [("Condition", "count", "count")]
+    assert condition.get_value(condition, found["resource"][0], None) is True
+    assert condition.get_datetime(condition, found["resource"][0], None) is None
+    assert condition.search(condition, "test", diabetes, context=context)["resource"] == [None]
+
+
+def test_shipped_existence_only_features(monkeypatch):
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "EXISTENCE_ONLY_SEARCH", True)
+    # Keep the note of EXISTENCE_ONLY_SEARCH in config/config.py in line with the shipped feature table.
+    table = _FeatureTable(fetch_planner.conf["table_path"]["FEATURE_TABLE"]).table
+    assert {(model, key) for model, features in table.items() for key, feature in features.items()
+            if is_existence_only(feature)} == {("NSTI", "sea")}
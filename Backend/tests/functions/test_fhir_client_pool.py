@@ -0,0 +1,137 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from base.async_runner import _AsyncRunner
+from base.fhir_client_pool import _AsyncFhirClientPool
+from base.fhir_client_pool import _FhirClientPool
+from base.fhir_search_obj import _FhirClassObject
+
+
+def test_client_is_reused_per_server_and_authorization():
+    pool = _FhirClientPool(idle_timeout=60)
+    client = pool.get("http://fhir", "Bearer a")
+
+    assert pool.get("http://fhir", "Bearer a") is client
+    assert pool.get("http://fhir", "Bearer b") is not client
+    assert pool.get("http://other", "Bearer a") is not client
+    assert len(pool) == 3
+
+
+def test_evict_idle_and_expired_clients():
+    pool = _FhirClientPool(idle_timeout=0.05)
+    idle = pool.get("http://fhir", "Bearer idle")
+    time.sleep(0.1)
+    assert pool.get("http://fhir", "Bearer idle") is not idle
+
+    pool = _FhirClientPool(idle_timeout=60)
+    expired = pool.get("http://fhir", "Bearer expired", expires_in=0)
+    assert pool.get("http://fhir", "Bearer expired") is not expired
+
+
+def test_evicted_client_is_closed_by_its_last_holder(monkeypatch):
+    pool = _FhirClientPool(idle_timeout=60)
+    closed = []
+    with pool.client("http://fhir", "Bearer a", expires_in=0) as held:
+        monkeypatch.setattr(held, "close", lambda: closed.append(held))
+        assert pool.get("http://fhir", "Bearer a") is not held
+        assert len(pool) == 1
+        # The request that got the client before it expired can finish with it.
+        assert held.retired and closed == []
+    assert closed == [held]
+
+
+def test_idle_client_is_closed_unless_held(monkeypatch):
+    pool = _FhirClientPool(idle_timeout=0.05)
+    closed = []
+    idle = pool.get("http://fhir", "Bearer idle")
+    monkeypatch.setattr(idle, "close", lambda: closed.append(idle))
+    with pool.client("http://fhir", "Bearer held") as held:
+        time.sleep(0.1)
+        pool.evict_expired()
+        assert closed == [idle]
+        # A held client is not idle, however long its request takes.
+        assert pool.get("http://fhir", "Bearer held") is held
+
+
+def test_requests_share_the_session(monkeypatch):
+    pool = _FhirClientPool(idle_timeout=60)
+    client = pool.get("http://fhir", "Bearer a")
+    sent = []
+
+    class FakeResponse:
+        status_code = 200
+        content = b'{"resourceType": "Bundle", "entry": []}'
+
+    def fake_request(method, url, json=None, headers=None, **kwargs):
+        sent.append((method, url, headers["Authorization"]))
+        return FakeResponse()
+
+    monkeypatch.setattr(client._session, "request", fake_request)
+    assert client.resources("Patient").search(_id="p1").fetch() == []
+    assert client.resources("Patient").search(_id="p2").fetch() == []
+    assert [request[2] for request in sent] == ["Bearer a", "Bearer a"]
+
+
+def test_request_contexts_do_not_leak():
+    fhir_class_obj = _FhirClassObject()
+    default_url = fhir_class_obj.client().url
+
+    async def hook(url, patient_id):
+        with fhir_class_obj.request_context(url, "Bearer a", patient_id=patient_id):
+            await asyncio.sleep(0.01)
+            # The other hook has entered its own context in the meantime.
+            context = fhir_class_obj.context()
+            return context.client.url, context.patient_id
+
+    async def hooks():
+        return await asyncio.gather(hook("http://ehr-a", "p1"), hook("http://ehr-b", "p2"))
+
+    assert asyncio.run(hooks()) == [("http://ehr-a", "p1"), ("http://ehr-b", "p2")]
+    assert fhir_class_obj.client().url == default_url
+    assert fhir_class_obj.context().patient_id is None
+
+
+def test_async_clients_are_shared_by_the_requests_of_a_loop():
+    pool = _AsyncFhirClientPool(idle_timeout=60)
+
+    async def requests():
+        async with pool.client("http://fhir", "Bearer a") as first:
+            pass
+        async with pool.client("http://fhir", "Bearer a") as second:
+            pass
+        async with pool.client("http://fhir", "Bearer b") as other:
+            pass
+        return first, second, other
+
+    first, second, other = asyncio.run(requests())
+    assert first is second
+    assert other is not first
+
+
+def test_expired_async_client_is_closed_by_its_last_holder():
+    pool = _AsyncFhirClientPool(idle_timeout=60)
+
+    async def requests():
+        async with pool.client("http://fhir", "Bearer a", expires_at=time.time() + 60) as held:
+            held.expires_at = time.time() - 1
+            # Another request retires the expired client, the one that holds it can still use it.
+            async with pool.client("http://fhir", "Bearer a") as renewed:
+                assert renewed is not held
+                assert held.retired and held._session is not None
+        return held
+
+    held = asyncio.run(requests())
+    assert held._session is None
+
+
+def test_runner_serves_coroutines_of_many_threads_on_one_loop():
+    runner = _AsyncRunner()
+
+    async def current_loop():
+        await asyncio.sleep(0)
+        return asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        loops = list(executor.map(lambda _: runner.run(current_loop()), range(8)))
+    assert len(set(loops)) == 1
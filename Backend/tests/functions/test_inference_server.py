@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+from base.inference_server import _MicroBatcher
+from base.inference_server import _InferenceServer
+
+
+def test_concurrent_rows_share_one_batch():
+    batch_sizes = []
+
+    def predict_batch(rows):
+        batch_sizes.append(len(rows))
+        return [sum(row) for row in rows]
+
+    batcher = _MicroBatcher(predict_batch, max_wait_ms=200, max_batch_size=4)
+    futures = [batcher.submit([i, i]) for i in range(4)]
+
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6]
+    assert batch_sizes == [4]
+    assert batcher.metrics()["batch_size_histogram"] == {4: 1}
+
+
+def test_predict_from_many_threads():
+    batcher = _MicroBatcher(lambda rows: [row * 2 for row in rows], max_wait_ms=20, max_batch_size=8)
+    results = {}
+
+    def worker(value):
+        results[value] = batcher.predict(value)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == {i: i * 2 for i in range(20)}
+    assert batcher.metrics()["requests"] == 20
+
+
+def test_exception_is_raised_to_every_caller():
+    def predict_batch(rows):
+        raise ValueError("model failed")
+
+    batcher = _MicroBatcher(predict_batch, max_wait_ms=1)
+    with pytest.raises(ValueError, match="model failed"):
+        batcher.predict([1])
+
+
+def test_disabled_model():
+    server = _InferenceServer({"ENABLED": True, "MODELS": ["SPC"]})
+    assert server.enabled("SPC")
+    assert not server.enabled("qCSI")
+    assert not _InferenceServer({"ENABLED": False, "MODELS": ["SPC"]}).enabled("SPC")
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+import pytest
+
+import cds_hooks
+from base import cds_hooks_work as cds
+from base.fhir_client_pool import PooledFHIRClient
+from base.latency_budget import Deadline
+from base.latency_budget import current_deadline
+
+
+def test_work_past_the_deadline_is_cancelled():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    deadline = Deadline(0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(deadline.run(slow()))
+    assert cancelled == [True]
+    assert deadline.remaining() == 0
+    assert deadline.timeout(30) == 0
+
+
+def test_without_budget():
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    assert deadline.timeout(30) == 30
+    assert asyncio.run(deadline.run(asyncio.sleep(0, "done"))) == "done"
+
+
+def test_stages_are_logged_when_the_budget_is_exceeded(caplog):
+    deadline = Deadline(0)
+    with deadline.stage("qCSI fetch"):
+        pass
+    with caplog.at_level(logging.WARNING):
+        deadline.log_if_exceeded("patient-view")
+    assert "patient-view exceeded its latency budget" in caplog.text
+    assert "qCSI fetch" in caplog.text
+
+
+def test_hook_returns_the_cards_of_the_models_done_in_time(monkeypatch):
+    async def model_evaluation(patient_id, encounter_id, prefetch=None, context=None):
+        return ["fast", "slow"]
+
+    async def evaluate_model(patient_id, model_name, prefetch, context, semaphore, resolver=None):
+        await asyncio.sleep(5 if model_name == "slow" else 0)
+        return cds.Card.info(model_name, cds_hooks.card_source())
+
+    monkeypatch.setattr(cds_hooks, "model_evaluation", model_evaluation)
+    monkeypatch.setattr(cds_hooks, "evaluate_model", evaluate_model)
+    monkeypatch.setattr(cds_hooks.feature_table, "get_exist_model_name", lambda: ["fast", "slow"])
+    request = cds.PatientViewRequest({"hook": "patient-view", "hookInstance": "1",
+                                      "context": {"userId": "Practitioner/1", "patientId": "p1"}})
+
+    cards = asyncio.run(cds_hooks.patient_view_cards(request, budget_seconds=0.1))
+    assert [card.summary for card in cards] == ["fast", "Some models could not be calculated in time."]
+    assert "slow" in cards[1].detail
+
+
+def test_sync_requests_get_at_most_the_remaining_budget():
+    timeouts = []
+
+    class FakeSession:
+        def request(self, method, url, timeout=None, **kwargs):
+            timeouts.append(timeout)
+            return type("Response", (), {"status_code": 200, "content": b'{"resourceType": "Bundle"}'})()
+
+    client = PooledFHIRClient("http://fhir", timeout=30)
+    client._session = FakeSession()
+    client._do_request("get", "Observation")
+    token = current_deadline.set(Deadline(0))
+    try:
+        client._do_request("get", "Observation")
+    finally:
+        current_deadline.reset(token)
+    assert timeouts[0] == 30
+    assert 0 < timeouts[1] < 0.01
+
+
+def test_hook_past_the_deadline_before_the_models_are_known(monkeypatch):
+    async def model_evaluation(patient_id, encounter_id, prefetch=None, context=None):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(cds_hooks, "model_evaluation", model_evaluation)
+    request = cds.PatientViewRequest({"hook": "patient-view", "hookInstance": "1",
+                                      "context": {"userId": "Practitioner/1", "patientId": "p1"}})
+
+    cards = asyncio.run(cds_hooks.patient_view_cards(request, budget_seconds=0.05))
+    assert len(cards) == 1
+    assert "Skipped models: all models" in cards[0].detail
@@ -0,0 +1,26 @@
+import pytest
+from base.model_plugin_registry import _ModelPluginRegistry
+
+
+def test_discover_plugin_folders():
+    registry = _ModelPluginRegistry("mocab_models", manifest=None)
+    assert {"NSTI", "SPC", "pima_diabetes", "qCSI"} <= set(registry.names())
+
+
+def test_import_on_first_use():
+    registry = _ModelPluginRegistry("mocab_models", manifest=None)
+    assert not registry.is_loaded("qCSI")
+
+    plugin = registry.get("qCSI")
+    assert registry.is_loaded("qCSI")
+    assert registry.get("qCSI") is plugin
+    assert plugin.predict([1, 1, 0], "./mocab_models/qCSI") == 2
+    # Other plugins are untouched.
+    assert not registry.is_loaded("SPC")
+
+
+def test_manifest_restricts_models():
+    registry = _ModelPluginRegistry("mocab_models", manifest=["qCSI"])
+    assert registry.names() == ["qCSI"]
+    with pytest.raises(KeyError):
+        registry.get("SPC")
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+from base.model_registry import _ModelRegistry
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        with open(path) as f:
+            return f.read()
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    model_path = tmp_path / "register_model"
+    model_path.write_text("v1")
+    return tmp_path
+
+
+def test_load_once(model_dir):
+    registry = _ModelRegistry()
+    loader = CountingLoader()
+    path = f"{model_dir}/register_model"
+
+    assert registry.load(path, loader) == "v1"
+    assert registry.load(path, loader) == "v1"
+    assert loader.calls == 1
+
+
+def test_evict_model_folder(model_dir):
+    registry = _ModelRegistry()
+    loader = CountingLoader()
+    path = f"{model_dir}/register_model"
+
+    registry.load(path, loader)
+    registry.evict(str(model_dir))
+    assert not registry.is_loaded(path)
+    registry.load(path, loader)
+    assert loader.calls == 2
+
+
+def test_reload_replaced_artifact(model_dir):
+    registry = _ModelRegistry()
+    loader = CountingLoader()
+    path = f"{model_dir}/register_model"
+    registry.load(path, loader)
+
+    # Same as choose_model(): new_model is renamed onto register_model.
+    (model_dir / "new_model").write_text("v2")
+    os.replace(model_dir / "new_model", path)
+
+    assert registry.load(path, loader) == "v2"
+    assert loader.calls == 2
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import OneHotEncoder
+
+from base.one_hot_encoder import CompiledOneHotEncoder
+
+training_df = pd.DataFrame({
+    "gender": ["1", "2", "1", "2"],
+    "age": ["2", "3", "4", "9"],
+    "grade": ["1", "2", "9", "1"],
+})
+
+rows = [
+    ["1", "2", "1"],
+    [2, 9, 9],
+    ["2", "4", "2"],
+]
+
+
+@pytest.mark.parametrize("drop, handle_unknown", [
+    ("first", "error"),
+    (None, "error"),
+    (None, "ignore"),
+])
+def test_transform_matches_sklearn(drop, handle_unknown):
+    enc = OneHotEncoder(drop=drop, handle_unknown=handle_unknown).fit(training_df)
+    compiled = CompiledOneHotEncoder(enc)
+
+    expected = enc.transform(pd.DataFrame(rows, columns=training_df.columns).astype(str)).toarray()
+    assert np.array_equal(compiled.transform(rows), expected)
+    assert compiled.feature_names_out == list(enc.get_feature_names_out())
+
+
+def test_unknown_category():
+    compiled = CompiledOneHotEncoder(OneHotEncoder(drop="first").fit(training_df))
+    with pytest.raises(ValueError, match="unknown categories"):
+        compiled.transform([["1", "5", "1"]])
+
+
+def test_ignore_unknown_category():
+    enc = OneHotEncoder(handle_unknown="ignore").fit(training_df)
+    compiled = CompiledOneHotEncoder(enc)
+    assert np.array_equal(compiled.transform([["1", "5", "1"]]),
+                          enc.transform(pd.DataFrame([["1", "5", "1"]], columns=training_df.columns)).toarray())
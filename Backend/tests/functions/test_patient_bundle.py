@@ -0,0 +1,130 @@
+from datetime import datetime
+
+from fhirpy import SyncFHIRClient
+
+from base import fetch_planner
+from base.code_search_forms import _CodeSearchForms
+from base.patient_bundle import fetch_with_batch
+from base.patient_bundle import select_feature_resources
+from base.fhir_search_obj import FhirSearchContext
+from base.server_capabilities import _ServerCapabilities
+
+
+def _observation(code, date, component_code=None):
+    resource = {"resourceType": "Observation", "effectiveDateTime": date,
+                "code": {"coding": [{"system": "http://loinc.org", "code": code}]}}
+    if component_code is not None:
+        resource["component"] = [{"code": {"coding": [{"system": "http://loinc.org", "code": component_code}]}}]
+    return resource
+
+
+class FakeClient(SyncFHIRClient):
+    def __init__(self, responses):
+        super().__init__("http://fhir")
+        self.responses = responses
+        self.requests = []
+
+    def execute(self, path, method="post", **kwargs):
+        self.requests.append((method, path, kwargs))
+        response = self.responses[path]
+        # A list holds the responses of the same path in the order they are sent
+        return response.pop(0) if isinstance(response, list) else response
+
+    def _fetch_resource(self, path, params=None):
+        self.requests.append(("get", path, params))
+        return self.responses[path]
+
+
+def test_probe_prefers_everything_then_batch():
+    everything = {"rest": [{"mode": "server", "interaction": [{"code": "batch"}],
+                            "resource": [{"type": "Patient", "operation": [{"name": "everything"}]}]}]}
+    batch = {"rest": [{"mode": "server", "interaction": [{"code": "batch"}], "resource": [{"type": "Patient"}]}]}
+
+    assert _ServerCapabilities("auto").retrieval_mode(FakeClient({"metadata": everything})) == "everything"
+    assert _ServerCapabilities("auto").retrieval_mode(FakeClient({"metadata": batch})) == "batch"
+    assert _ServerCapabilities("auto").retrieval_mode(FakeClient({"metadata": {"rest": []}})) == "search"
+    assert _ServerCapabilities("search").retrieval_mode(FakeClient({})) == "search"
+
+
+def test_answer_feature_from_everything(feature):
+    client = FakeClient({})
+    resources = [client.resource(data["resourceType"], **data) for data in [
+        _observation("2345-7", "2020-01-01"),
+        _observation("2345-7", "2021-01-01"),
+        _observation("85354-9", "2021-05-01", component_code="8462-4"),
+        {"resourceType": "Patient", "id": "p1", "birthDate": "1990-01-01"},
+    ]]
+
+    glucose = select_feature_resources(resources, "p1", feature("http://loinc.org|2345-7"), datetime(2023, 1, 1))
+    assert [resource["effectiveDateTime"] for resource in glucose["resource"]] == ["2021-01-01", "2020-01-01"]
+
+    diastolic = select_feature_resources(resources, "p1", feature("8462-4"), datetime(2023, 1, 1))
+    assert diastolic["resource"][0]["effectiveDateTime"] == "2021-05-01"
+
+    spo2 = select_feature_resources(resources, "p1", feature("59408-5", default_value=98), datetime(2023, 1, 1))
+    assert spo2 == {"resource": [98], "type": "Observation"}
+
+    patient = select_feature_resources(resources, "p1", feature(None, "patient"), datetime(2023, 1, 1))
+    assert patient["resource"][0]["birthDate"] == "1990-01-01"
+
+
+def _searchset(*resources, next_url=None):
+    bundle = {"resourceType": "Bundle", "entry": [{"resource": resource} for resource in resources]}
+    if next_url is not None:
+        bundle["link"] = [{"relation": "next", "url": next_url}]
+    return bundle
+
+
+def test_batch_sends_one_entry_per_feature(monkeypatch, feature):
+    monkeypatch.setattr(fetch_planner, "code_search_forms", _CodeSearchForms())
+    # The second batch searches the diastolic pressure by component-code, since its code search has no resource.
+    client = FakeClient({"": [
+        {"resourceType": "Bundle", "entry": [
+            {"response": {"status": "200 OK"}, "resource": _searchset(_observation("2345-7", "2021-01-01"))},
+            {"response": {"status": "200 OK"}, "resource": _searchset()},
+            {"response": {"status": "200 OK"}, "resource": _searchset({"resourceType": "Patient", "id": "p1"})},
+        ]},
+        {"resourceType": "Bundle", "entry": [
+            {"response": {"status": "200 OK"},
+             "resource": _searchset(_observation("85354-9", "2021-05-01", "8462-4"))},
+        ]},
+    ]})
+    table = {
+        "glucose": feature("http://loinc.org|2345-7"),
+        "diastolic": feature("8462-4", value_route=["blood_pressure_diastolic"]),
+        "gender": feature(None, "patient", value_route=["gender"]),
+    }
+
+    data = fetch_with_batch(FhirSearchContext(client), "p1", table, datetime(2023, 1, 1))
+    assert [(method, path, kwargs["data"]["type"]) for method, path, kwargs in client.requests] == \
+        [("post", "", "batch"), ("post", "", "batch")]
+    first, second = [[entry["request"]["url"] for entry in kwargs["data"]["entry"]]
+                     for method, path, kwargs in client.requests]
+    assert [url.split("?")[0] for url in first] == ["Observation", "Observation", "Patient"]
+    assert "_count=1" in first[0] and "%7C2345-7" in first[0]
+    assert len(second) == 1 and "component-code=8462-4" in second[0]
+    assert data["glucose"]["resource"][0]["effectiveDateTime"] == "2021-01-01"
+    assert data["diastolic"]["resource"][0]["effectiveDateTime"] == "2021-05-01"
+    assert data["gender"]["resource"][0]["id"] == "p1"
+
+
+def test_batch_pages_only_the_fetch_all_entries(monkeypatch, feature):
+    monkeypatch.setattr(fetch_planner, "code_search_forms", _CodeSearchForms())
+    client = FakeClient({
+        "": [{"resourceType": "Bundle", "entry": [
+            {"response": {"status": "200 OK"},
+             "resource": _searchset(_observation("2345-7", "2021-01-01"),
+                                    next_url="http://fhir/Observation?_page=glucose")},
+            {"response": {"status": "200 OK"},
+             "resource": _searchset(_observation("4548-4", "2021-01-01"),
+                                    next_url="http://fhir/Observation?_page=hba1c")},
+        ]}],
+        "http://fhir/Observation?_page=hba1c": _searchset(_observation("4548-4", "2019-01-01")),
+    })
+    table = {"glucose": feature("2345-7"), "hba1c": feature("4548-4", search_type="max")}
+
+    data = fetch_with_batch(FhirSearchContext(client), "p1", table, datetime(2023, 1, 1))
+    assert len(data["glucose"]["resource"]) == 1
+    assert [resource["effectiveDateTime"] for resource in data["hba1c"]["resource"]] == ["2021-01-01", "2019-01-01"]
+    assert [(method, path) for method, path, kwargs in client.requests] == \
+        [("post", ""), ("get", "http://fhir/Observation?_page=hba1c")]
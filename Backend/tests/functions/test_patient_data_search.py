@@ -1,5 +1,14 @@
+import asyncio
+from datetime import datetime
+
 import pytest
+from fhirpy import SyncFHIRClient
 
+from base import async_search
+from base import fetch_planner
+from base import patient_data_search
+from base.code_search_forms import _CodeSearchForms
+from base.fhir_search_obj import FhirSearchContext
 from base.object_store import feature_table
 from base.patient_data_search import model_feature_search_with_patient_id
 
@@ -33,3 +42,37 @@ def test_model_feature_search_with_patient_id(patient_id, model_name, expected_o
     feature__table = features__table.get_model_feature_dict(model_name)
 
     assert model_feature_search_with_patient_id(patient__id, feature__table) == expected_output
+
+
+def test_sync_and_async_paths_send_the_same_searches(monkeypatch, feature):
+    monkeypatch.setattr(fetch_planner, "code_search_forms", _CodeSearchForms())
+    monkeypatch.setitem(fetch_planner.conf["fhir_search"], "EXISTENCE_ONLY_SEARCH", True)
+    table = {"glucose": feature("2345-7"), "placeholder": feature("0", default_value=6),
+             "sea": feature("0", "condition"), "age": feature(None, "patient", value_route=["age"])}
+    sent = {"sync": [], "async": []}
+
+    def answer(path, resource_type, params, mode):
+        sent[path].append((resource_type, params, mode))
+        if mode == "count":
+            return 0
+        if mode == "get":
+            return {"resourceType": "Patient", "id": "p1"}
+        return [{"resourceType": "Observation", "code": {"coding": [{"code": "2345-7"}]}}] \
+            if "2345-7" in params.get("code", "") else []
+
+    def search_resources(client, resource_type, params, sort=None, mode="fetch"):
+        return answer("sync", resource_type, params, mode)
+
+    async def async_search_resources(context, resource_type, params, sort=None, mode="fetch"):
+        return answer("async", resource_type, params, mode)
+
+    monkeypatch.setattr(fetch_planner, "search_resources", search_resources)
+    monkeypatch.setattr(async_search, "async_search_resources", async_search_resources)
+    context = FhirSearchContext(SyncFHIRClient("http://fhir"))
+
+    sync_data = patient_data_search.search_data_sets(context, "p1", table, datetime(2023, 1, 1))
+    async_data = asyncio.run(async_search.search_data_sets(context, "p1", table, datetime(2023, 1, 1)))
+    assert sent["sync"] == sent["async"]
+    assert sync_data == async_data
+    assert list(sync_data) == list(table)
+    assert sync_data["placeholder"] == {"resource": [6], "type": "Observation"}
@@ -0,0 +1,71 @@
+from base.patient_bundle import patient_store_scopes
+from base.patient_store import _PatientResourceStore
+
+
+class FakeClient:
+    url = "http://fhir"
+    authorization = "Bearer a"
+
+
+def test_refresh_with_deltas_and_merge_by_id():
+    store = _PatientResourceStore(max_patients=10, full_refresh_seconds=3600, overlap_seconds=0, enabled=True)
+    requests = []
+    responses = [
+        [{"id": "1", "value": 1}, {"id": "2", "value": 2}],
+        [{"id": "2", "value": 20}, {"id": "3", "value": 3}],
+    ]
+
+    def fetch(resource_type, last_sync):
+        requests.append((resource_type, last_sync))
+        return responses.pop(0)
+
+    first = store.sync(FakeClient(), "p1", ["Observation"], fetch)
+    assert [resource["value"] for resource in first] == [1, 2]
+
+    second = store.sync(FakeClient(), "p1", ["Observation"], fetch)
+    assert requests[0] == ("Observation", None)
+    assert requests[1][1] is not None
+    assert sorted(resource["value"] for resource in second) == [1, 3, 20]
+
+
+def test_full_refresh_and_patient_limit():
+    store = _PatientResourceStore(max_patients=1, full_refresh_seconds=0, overlap_seconds=0, enabled=True)
+    requests = []
+
+    def fetch(resource_type, last_sync):
+        requests.append(last_sync)
+        return [{"id": "1"}]
+
+    store.sync(FakeClient(), "p1", ["Condition"], fetch)
+    store.sync(FakeClient(), "p1", ["Condition"], fetch)
+    # Every sync is a full fetch once FULL_REFRESH_SECONDS has passed.
+    assert requests == [None, None]
+
+    store.sync(FakeClient(), "p2", ["Condition"], fetch)
+    assert len(store) == 1
+
+
+def test_scopes_are_merged_by_resource_id():
+    store = _PatientResourceStore(max_patients=10, full_refresh_seconds=3600, overlap_seconds=0, enabled=True)
+    bp = {"resourceType": "Observation", "id": "bp"}
+    responses = {"code": [bp], "component_code": [bp, {"resourceType": "Observation", "id": "panel"}]}
+
+    resources = store.sync(FakeClient(), "p1", [("Observation", "code", ("8462-4",)),
+                                                ("Observation", "component_code", ("8462-4",))],
+                           lambda scope, last_sync: responses[scope[1]])
+    assert [resource["id"] for resource in resources] == ["bp", "panel"]
+
+
+def test_scopes_search_the_codes_of_the_features(feature):
+    table = {
+        "glucose": feature("http://loinc.org|2345-7"),
+        "hba1c": feature("4548-4,http://loinc.org|2345-7"),
+        "dm": feature("44054006", "condition"),
+        "gender": feature(None, "patient", value_route=["gender"]),
+    }
+    assert patient_store_scopes(table) == [
+        ("Condition", "code", ("44054006",)),
+        ("Observation", "code", ("4548-4", "http://loinc.org|2345-7")),
+        ("Observation", "component_code", ("4548-4", "http://loinc.org|2345-7")),
+        ("Patient", None, ()),
+    ]
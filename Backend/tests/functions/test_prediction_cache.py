@@ -0,0 +1,55 @@
+import time
+
+from base.prediction_cache import _PredictionCache
+
+
+def test_hit_and_miss():
+    cache = _PredictionCache(max_size=10, ttl_seconds=60, enabled=True)
+    assert cache.get("NSTI", "register", [1, 4400, 0.5]) is None
+
+    cache.put("NSTI", "register", [1, 4400, 0.5], 0.3)
+    assert cache.get("NSTI", "register", [1, 4400, 0.5]) == 0.3
+    assert cache.get("NSTI", "new", [1, 4400, 0.5]) is None
+    assert cache.get("NSTI", "register", [1, 4400, 0.6]) is None
+
+
+def test_equal_values_of_different_types_are_different_features():
+    cache = _PredictionCache(max_size=10, ttl_seconds=60, enabled=True)
+    cache.put("qCSI", "register", [1, 0], "int")
+    assert cache.get("qCSI", "register", [1.0, 0]) is None
+    assert cache.get("qCSI", "register", [True, 0]) is None
+    assert cache.get("qCSI", "register", [1, 0]) == "int"
+
+
+def test_lru_eviction():
+    cache = _PredictionCache(max_size=2, ttl_seconds=60, enabled=True)
+    cache.put("qCSI", "register", [1], 1)
+    cache.put("qCSI", "register", [2], 2)
+    cache.get("qCSI", "register", [1])
+    cache.put("qCSI", "register", [3], 3)
+
+    assert cache.get("qCSI", "register", [1]) == 1
+    assert cache.get("qCSI", "register", [2]) is None
+    assert len(cache) == 2
+
+
+def test_ttl():
+    cache = _PredictionCache(max_size=10, ttl_seconds=0.01, enabled=True)
+    cache.put("qCSI", "register", [1], 1)
+    time.sleep(0.02)
+    assert cache.get("qCSI", "register", [1]) is None
+
+
+def test_invalidate_on_model_swap():
+    cache = _PredictionCache(max_size=10, ttl_seconds=60, enabled=True)
+    version = cache.version("SPC")
+    cache.put("SPC", "register", [1, 2], 0.9, version)
+    cache.put("NSTI", "register", [1, 2], 0.1)
+
+    cache.invalidate("SPC")
+    assert cache.get("SPC", "register", [1, 2]) is None
+    assert cache.get("NSTI", "register", [1, 2]) == 0.1
+
+    # A prediction that started before the swap is not stored.
+    cache.put("SPC", "register", [1, 2], 0.9, version)
+    assert cache.get("SPC", "register", [1, 2]) is None
@@ -1,4 +1,5 @@
 import pytest
+from base.route_converter import compile_path
 from base.route_converter import get_by_path
 from base.route_converter import parse_route
 
@@ -45,6 +46,23 @@ def test_get_by_path(input_dict, path, expected_output):
     assert get_by_path(input_dict, path) == expected_output
 
 
+@pytest.mark.parametrize("input_dict, path, default, expected_output", get_by_path_data_default)
+def test_compile_path_with_default(input_dict, path, expected_output, default):
+    assert compile_path(path)(input_dict, default) == expected_output
+
+
+@pytest.mark.parametrize("input_dict, path, expected_output", get_by_path_data)
+def test_compile_path(input_dict, path, expected_output):
+    assert compile_path(path)(input_dict) == expected_output
+
+
+def test_compile_path_matches_like_get_by_path():
+    data = {"key": [{"code": 1, "value": "int"}, {"code": "1", "value": "str"}, "not a dict"]}
+    for path in (["key", {"code": "1"}, "value"], ["key", {"code": "2"}], ["key", {"code": "2"}, "value"],
+                 ["key", 5], ["missing", 0]):
+        assert compile_path(path)(data, "default") == get_by_path(data, path, "default")
+
+
 @pytest.mark.parametrize("input_string, expected_output", parse_route_data)
 def test_parse_route(input_string, expected_output):
     assert parse_route(input_string) == expected_output
@@ -120,3 +138,13 @@ def resource():
 ])
 def test_regression(resource, route, expected_output):
     assert get_by_path(resource, parse_route(route)) == expected_output
+
+
+@pytest.mark.parametrize("route, expected_output", [
+    ('bodySite.{coding:{system: "https://www.hpa.gov.tw/",code:"0"}}.coding.0.display', "原發部位手術邊緣"),
+    ('bodySite.{coding:{system: "https://www.hpa.gov.tw/",code:"999"}}.coding.0.display',
+     "原發部位手術切緣距離"),
+    ('bodySite.{coding:{system: "https://www.hpa.gov.tw/",code:"1"}}.coding.0.display', None),
+])
+def test_compiled_regression(resource, route, expected_output):
+    assert compile_path(parse_route(route))(resource) == expected_output
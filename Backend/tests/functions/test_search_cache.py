@@ -0,0 +1,72 @@
+import time
+
+from base.search_cache import _SearchCache
+
+
+class FakeClient:
+    def __init__(self, url="http://fhir", authorization=None):
+        self.url = url
+        self.authorization = authorization
+
+
+def _fetch(calls, result):
+    def fetch():
+        calls.append(1)
+        return result
+    return fetch
+
+
+def test_same_search_is_fetched_once():
+    cache = _SearchCache(max_bytes=1024 * 1024, ttl_seconds={"DEFAULT": 60}, enabled=True)
+    calls = []
+    params = {"subject": "p1", "code": "a|1,b|2", "_sort": "-date"}
+
+    assert cache.fetch(FakeClient(), "Observation", params, _fetch(calls, [{"id": "1"}])) == [{"id": "1"}]
+    # The order of OR-joined codes does not matter.
+    reordered = {"_sort": "-date", "code": "b|2,a|1", "subject": "p1"}
+    assert cache.fetch(FakeClient(), "Observation", reordered, _fetch(calls, [])) == [{"id": "1"}]
+    assert len(calls) == 1
+    assert cache.metrics()["hits"] == 1 and cache.metrics()["misses"] == 1
+
+
+def test_entries_are_scoped_by_server_and_authorization():
+    cache = _SearchCache(max_bytes=1024 * 1024, ttl_seconds={"DEFAULT": 60}, enabled=True)
+    calls = []
+    params = {"_id": "p1"}
+
+    cache.fetch(FakeClient(authorization="Bearer a"), "Patient", params, _fetch(calls, {"id": "a"}), mode="get")
+    assert cache.fetch(FakeClient(authorization="Bearer b"), "Patient", params, _fetch(calls, {"id": "b"}),
+                       mode="get") == {"id": "b"}
+    assert cache.fetch(FakeClient("http://other", "Bearer a"), "Patient", params, _fetch(calls, {"id": "c"}),
+                       mode="get") == {"id": "c"}
+    assert len(calls) == 3
+
+
+def test_ttl_per_resource_type():
+    cache = _SearchCache(max_bytes=1024 * 1024, ttl_seconds={"DEFAULT": 60, "Observation": 0.05}, enabled=True)
+    calls = []
+
+    cache.fetch(FakeClient(), "Observation", {"code": "a"}, _fetch(calls, []))
+    cache.fetch(FakeClient(), "Condition", {"code": "a"}, _fetch(calls, []))
+    time.sleep(0.1)
+    cache.fetch(FakeClient(), "Observation", {"code": "a"}, _fetch(calls, []))
+    cache.fetch(FakeClient(), "Condition", {"code": "a"}, _fetch(calls, []))
+    assert len(calls) == 3
+
+
+def test_evict_least_recently_used_over_memory_budget():
+    resource = [{"id": "x" * 100}]
+    cache = _SearchCache(max_bytes=250, ttl_seconds={"DEFAULT": 60}, enabled=True)
+    calls = []
+
+    cache.fetch(FakeClient(), "Observation", {"code": "a"}, _fetch(calls, resource))
+    cache.fetch(FakeClient(), "Observation", {"code": "b"}, _fetch(calls, resource))
+    cache.fetch(FakeClient(), "Observation", {"code": "a"}, _fetch(calls, resource))
+    cache.fetch(FakeClient(), "Observation", {"code": "c"}, _fetch(calls, resource))
+    assert len(cache) == 2
+    assert cache.metrics()["bytes"] <= 250
+
+    # "b" was the least recently used entry.
+    cache.fetch(FakeClient(), "Observation", {"code": "a"}, _fetch(calls, resource))
+    cache.fetch(FakeClient(), "Observation", {"code": "b"}, _fetch(calls, resource))
+    assert len(calls) == 4
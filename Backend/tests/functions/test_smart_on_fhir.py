@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from flask import Flask
+
+import smart_on_fhir
+
+
+class FakeSmartClient:
+    def __init__(self, settings):
+        self.settings = settings
+        self.ready = False
+        self.server = SimpleNamespace(base_uri=settings["api_base"], auth=SimpleNamespace(access_token=None))
+
+    @property
+    def authorize_url(self):
+        return f"{self.settings['api_base']}/authorize"
+
+    def handle_callback(self, url):
+        self.ready = True
+        self.server.auth.access_token = f"token of {self.settings['api_base']}"
+
+
+def test_every_session_keeps_its_own_smart_launch(monkeypatch):
+    monkeypatch.setattr(smart_on_fhir, "FHIRClient", FakeSmartClient)
+    monkeypatch.setattr(smart_on_fhir, "_smart_clients", type(smart_on_fhir._smart_clients)())
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(smart_on_fhir.smart_app)
+
+    servers = {}
+    for ehr in ["http://ehr-a", "http://ehr-b"]:
+        with app.test_client() as browser:
+            browser.get(f"/launch?iss={ehr}")
+            browser.get("/fhir-app?code=c&state=s")
+            servers[ehr] = smart_on_fhir.smart_server(smart_on_fhir.session_client())
+
+    assert servers == {"http://ehr-a": {"url": "http://ehr-a", "authorization": "bearer token of http://ehr-a"},
+                       "http://ehr-b": {"url": "http://ehr-b", "authorization": "bearer token of http://ehr-b"}}
+    # A session that has not launched gets the default FHIR server, not the launch of another user.
+    with app.test_request_context("/"):
+        assert smart_on_fhir.smart_server(smart_on_fhir.session_client()) == {}